@@ -1,26 +1,240 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
-from fastapi.responses import Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Query
+from fastapi.responses import Response, JSONResponse, StreamingResponse, FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.background import BackgroundTask
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile, FileExists
+from bson import json_util
+from pymongo import monitoring, IndexModel, ReturnDocument, UpdateOne, UpdateMany, DeleteMany, CursorType, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, OperationFailure, BulkWriteError, CollectionInvalid, PyMongoError
 import os
+import asyncio
+import contextvars
+import csv
+import io
+import itertools
+import json
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
-from typing import List, Optional, Dict, Any, Union
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator, AfterValidator, ValidationError
+from typing import List, Optional, Dict, Any, Union, Annotated, get_args, get_origin
 import uuid
+import collections
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
+import orjson
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, multiprocess, generate_latest, CONTENT_TYPE_LATEST
+)
 import base64
+import binascii
+import hashlib
+import xlsxwriter
+from urllib.parse import quote
+from email.utils import format_datetime, parsedate_to_datetime
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ==================== METRICS ====================
+
+# With several uvicorn workers PROMETHEUS_MULTIPROC_DIR must be set in the process environment
+# (not .env, it is read when prometheus_client is imported) and emptied before the workers start;
+# /metrics then aggregates the files all workers write there.
+PROMETHEUS_MULTIPROC = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency",
+                                  ["method", "route"], buckets=LATENCY_BUCKETS)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served",
+                                  ["method", "route"], multiprocess_mode="livesum")
+MONGO_COMMANDS = Counter("mongodb_commands_total", "MongoDB commands", ["collection", "command", "outcome"])
+MONGO_COMMAND_DURATION = Histogram("mongodb_command_duration_seconds", "MongoDB command latency",
+                                   ["collection", "command"], buckets=LATENCY_BUCKETS)
+MONGO_POOL_CHECKOUT_WAIT = Histogram("mongodb_pool_checkout_wait_seconds",
+                                     "Time spent waiting for a pooled MongoDB connection", buckets=LATENCY_BUCKETS)
+MONGO_POOL_CHECKOUT_FAILURES = Counter("mongodb_pool_checkout_failures_total",
+                                       "Failed MongoDB connection checkouts", ["reason"])
+
+# Mongo commands of the current request as (collection, command, seconds). Motor copies the context
+# into its executor threads, so the listener appends to the list of the request that sent them.
+request_db_commands: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_db_commands", default=None)
+# Requests over either budget are logged with their command breakdown
+DB_ROUND_TRIP_BUDGET = int(os.environ.get('DB_ROUND_TRIP_BUDGET', '25'))
+REQUEST_LATENCY_BUDGET_MS = float(os.environ.get('REQUEST_LATENCY_BUDGET_MS', '1000'))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts and times every command Motor sends, labelled by collection and command name"""
+
+    def __init__(self):
+        # request_id -> collection; started and succeeded/failed arrive on the same executor thread
+        self._collections = {}
+
+    def started(self, event):
+        name = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(name)
+        self._collections[event.request_id] = collection if isinstance(collection, str) else "-"
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop(event.request_id, "-")
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMANDS.labels(collection, event.command_name, outcome).inc()
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(seconds)
+        commands = request_db_commands.get()
+        if commands is not None:
+            commands.append((collection, event.command_name, seconds))
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Checkout wait: from check-out started to checked out (or failed) on the same thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            MONGO_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+            self._local.started = None
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        MONGO_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    # Pool lifecycle events are not measured
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+def route_template(scope) -> str:
+    """Path template of the matching route, so ids do not become label values"""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "<unmatched>")
+    return "<unmatched>"
+
+class PrometheusMiddleware:
+    """Plain ASGI middleware, so streamed responses are timed until their last chunk"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method, route = scope["method"], route_template(scope)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
+
+class DbAccountingMiddleware:
+    """
+    Counts the Mongo round trips of each request and reports them with a Server-Timing header
+    (db: time in Mongo and number of commands, app: time to the response headers). Commands
+    issued while a streamed body is still being sent are logged but not in the header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        commands = []
+        token = request_db_commands.set(commands)
+        started = time.perf_counter()
+        streaming = False
+
+        async def send_with_timing(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                streaming = headers.get("content-type", "").startswith("text/event-stream")
+                db_ms = sum(c[2] for c in commands) * 1000
+                app_ms = (time.perf_counter() - started) * 1000
+                headers.append("Server-Timing",
+                               f'db;dur={db_ms:.1f};desc="{len(commands)} round trips", app;dur={app_ms:.1f}')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_db_commands.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            # Live event streams stay open by design
+            if not streaming and (len(commands) > DB_ROUND_TRIP_BUDGET or elapsed_ms > REQUEST_LATENCY_BUDGET_MS):
+                breakdown = collections.Counter(f"{c[0]}.{c[1]}" for c in commands).most_common(5)
+                logger.warning(
+                    f"Over budget: {scope['method']} {scope['path']} took {elapsed_ms:.0f} ms with "
+                    f"{len(commands)} Mongo round trips ({sum(c[2] for c in commands) * 1000:.0f} ms); "
+                    f"top: {', '.join(f'{name} x{count}' for name, count in breakdown) or '-'}"
+                )
+
+def render_metrics() -> bytes:
+    if PROMETHEUS_MULTIPROC:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # Security
@@ -29,12 +243,27 @@ security = HTTPBearer()
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 
+class FastJSONResponse(JSONResponse):
+    """JSON rendered with orjson; UTC datetimes end in Z like Pydantic's own output"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(DbAccountingMiddleware)
 api_router = APIRouter(prefix="/api")
 
 # ==================== MODELS ====================
 
+def _utc(value: datetime) -> datetime:
+    # BSON dates come back naive but are always UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+# System timestamps (created_at/updated_at) are stored as BSON dates in UTC.
+# Wall-clock fields entered by users (incident_time, review_date, ...) stay plain datetime.
+UtcDatetime = Annotated[datetime, AfterValidator(_utc)]
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -44,7 +273,7 @@ class User(BaseModel):
     role: str  # Role ID or legacy role name
     role_name: Optional[str] = None  # For display purposes
     permissions: Optional[dict] = None  # Role permissions
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserCreate(BaseModel):
     username: str
@@ -81,8 +310,8 @@ class Risk(BaseModel):
     implementation_deadline: Optional[str] = None  # Срок реализации (Q3 2026)
     status: str  # Статус: Открыт, В обработке, Принят, Закрыт
     review_date: Optional[datetime] = None  # Дата пересмотра
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     priority: int = Field(default=0)
 
 class RiskCreate(BaseModel):
@@ -146,8 +375,8 @@ class Incident(BaseModel):
     assigned_to: List[str] = Field(default_factory=list)  # User IDs assigned to this incident
     created_by: Optional[str] = None  # User ID who created the incident
     attachments: List[dict] = Field(default_factory=list)  # Список вложений {id, data, filename}
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class IncidentAttachmentCreate(BaseModel):
     data: str  # base64 data URL
@@ -203,11 +432,12 @@ class IncidentComment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     incident_id: str
     text: str = ""
-    image: Optional[str] = None  # base64 data URL
+    image: Optional[str] = None  # URL of the image stored in GridFS
+    image_sha256: Optional[str] = None
     type: str = "message"  # "message" or "note"
     user_id: str
     user_name: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class IncidentCommentCreate(BaseModel):
     text: str = ""
@@ -233,8 +463,8 @@ class Asset(BaseModel):
     protection_measures: Optional[str] = None  # Меры защиты
     description: Optional[str] = None  # Описание
     note: Optional[str] = None  # Примечание
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class AssetCreate(BaseModel):
     asset_number: Optional[str] = None  # Auto-generated if not provided
@@ -282,7 +512,7 @@ class Settings(BaseModel):
     threat_categories: List[str] = Field(default_factory=lambda: ["Внешний злоумышленник", "Инсайдер", "Стихийное бедствие", "Сбой оборудования"])
     threat_sources: List[str] = Field(default_factory=lambda: ["Хакер-одиночка", "Криминальная группа", "Недовольный сотрудник", "Конкурент"])
     asset_owners: List[str] = Field(default_factory=list)
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SettingsUpdate(BaseModel):
     subject_types: Optional[List[str]] = None
@@ -305,12 +535,23 @@ class DashboardStats(BaseModel):
     avg_mttr: Optional[float] = None
     avg_mttc: Optional[float] = None
 
+class MetricDistribution(BaseModel):
+    count: int = 0
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+
 class IncidentMetrics(BaseModel):
     avg_mtta: Optional[float] = None
     avg_mttr: Optional[float] = None
     avg_mttc: Optional[float] = None
     total_incidents: int
     closed_incidents: int
+    # Distributions in hours
+    mtta: MetricDistribution = Field(default_factory=MetricDistribution)
+    mttr: MetricDistribution = Field(default_factory=MetricDistribution)
+    mttc: MetricDistribution = Field(default_factory=MetricDistribution)
 
 # ==================== THREAT MODELS ====================
 class Threat(BaseModel):
@@ -322,8 +563,8 @@ class Threat(BaseModel):
     source: Optional[str] = None  # Хакер-одиночка, Криминальная группа, Недовольный сотрудник
     related_vulnerability_id: Optional[str] = None  # ID уязвимости
     mitre_attack_id: Optional[str] = None  # MITRE ATT&CK ID
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ThreatCreate(BaseModel):
     threat_number: Optional[str] = None
@@ -356,8 +597,8 @@ class Vulnerability(BaseModel):
     status: str  # Обнаружена, Принята, В работе, Устранена
     discovery_date: datetime
     closure_date: Optional[datetime] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class VulnerabilityCreate(BaseModel):
     vulnerability_number: Optional[str] = None
@@ -433,8 +674,8 @@ class Role(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str  # Custom role name
     permissions: RolePermissions
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RoleCreate(BaseModel):
     name: str
@@ -463,8 +704,8 @@ class WikiPage(BaseModel):
     parent_id: Optional[str] = None  # For tree structure
     order: int = 0  # Order within siblings
     created_by: str  # User ID
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class WikiPageCreate(BaseModel):
     title: str
@@ -498,8 +739,8 @@ class Registry(BaseModel):
     description: Optional[str] = None
     columns: List[RegistryColumn] = Field(default_factory=list)
     created_by: str  # User ID
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RegistryCreate(BaseModel):
     name: str
@@ -517,8 +758,8 @@ class RegistryRecord(BaseModel):
     registry_id: str
     data: dict  # Column_id: value mapping
     created_by: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: UtcDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RegistryRecordCreate(BaseModel):
     data: dict
@@ -528,76 +769,452 @@ class RegistryRecordUpdate(BaseModel):
 
 class PaginatedThreats(BaseModel):
     items: List[Threat]
-    total: int
+    total: Optional[int] = None  # None when include_total=false
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PaginatedVulnerabilities(BaseModel):
     items: List[Vulnerability]
-    total: int
+    total: Optional[int] = None  # None when include_total=false
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PaginatedIncidents(BaseModel):
     items: List[Incident]
-    total: int
+    total: Optional[int] = None  # None when include_total=false
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class PaginatedIncidentComments(BaseModel):
+    items: List[IncidentComment]
+    limit: int
+    next_cursor: Optional[str] = None
 
 class PaginatedRisks(BaseModel):
     items: List[Risk]
-    total: int
+    total: Optional[int] = None  # None when include_total=false
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PaginatedAssets(BaseModel):
     items: List[Asset]
-    total: int
+    total: Optional[int] = None  # None when include_total=false
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class PaginatedRegistryRecords(BaseModel):
+    items: List[RegistryRecord]
+    total: Optional[int] = None  # None when include_total=false
+    page: int
+    limit: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    row: int  # 1-based data row (CSV header excluded) or NDJSON line
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    dry_run: bool
+    total_rows: int = 0
+    valid_rows: int = 0
+    inserted: int = 0
+    errors: List[ImportRowError] = Field(default_factory=list)
+    errors_truncated: bool = False
+
+    def add_error(self, row: int, errors: List[str]):
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(ImportRowError(row=row, errors=errors))
+        else:
+            self.errors_truncated = True
+
+class BulkSelection(BaseModel):
+    ids: Optional[List[str]] = None  # Either explicit ids...
+    filter: Optional[Dict[str, Union[str, List[str]]]] = None  # ...or field -> value(s), as on the list endpoints
+
+class BulkRiskUpdate(BulkSelection):
+    update: RiskUpdate
+
+class BulkIncidentUpdate(BulkSelection):
+    update: IncidentUpdate
+
+class BulkAssetUpdate(BulkSelection):
+    update: AssetUpdate
+
+class BulkThreatUpdate(BulkSelection):
+    update: ThreatUpdate
+
+class BulkVulnerabilityUpdate(BulkSelection):
+    update: VulnerabilityUpdate
+
+class BulkItemResult(BaseModel):
+    id: str
+    status: str  # updated, deleted, not_found, forbidden, failed
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    matched: int = 0
+    modified: int = 0
+    deleted: int = 0
+    results: List[BulkItemResult] = Field(default_factory=list)
 
 # ==================== HELPERS ====================
 
-async def generate_incident_number() -> str:
-    """Generate next incident number in format INC000001"""
-    incidents = await db.incidents.find({}, {"incident_number": 1}).to_list(None)
-    if not incidents:
-        return "INC000001"
-    
-    # Extract numbers and find max
-    numbers = []
-    for inc in incidents:
-        num_str = inc.get('incident_number', '').replace('INC', '')
+# Sort keys accepted by the list endpoints; each one is backed by a (field, id) index
+SORTABLE_FIELDS = {
+    "risks": ["created_at", "updated_at", "risk_number", "registration_date", "risk_level",
+              "criticality", "status", "owner", "review_date", "priority"],
+    "incidents": ["created_at", "updated_at", "incident_number", "incident_time", "detection_time",
+                  "violator", "system", "criticality", "status", "detected_by"],
+    "assets": ["created_at", "updated_at", "asset_number", "name", "category", "criticality",
+               "status", "owner", "review_date"],
+    "threats": ["created_at", "updated_at", "threat_number", "category", "source"],
+    "vulnerabilities": ["created_at", "updated_at", "vulnerability_number", "vulnerability_type",
+                        "status", "discovery_date", "cvss_score", "severity"],
+}
+
+def resolve_sort(collection: str, sort_by: Optional[str], sort_order: Optional[str]) -> tuple:
+    """Validate sort parameters against SORTABLE_FIELDS, returns (field, direction)"""
+    field = sort_by or "created_at"
+    if field not in SORTABLE_FIELDS[collection]:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort field: {field}")
+    return field, -1 if sort_order == "desc" else 1
+
+# Fields covered by each collection's text index (free-text "q" parameter)
+TEXT_SEARCH_FIELDS = {
+    "risks": ["scenario", "description", "treatment_plan", "owner"],
+    "incidents": ["description", "measures", "comment", "violator", "login"],
+    "assets": ["name", "description", "location", "note"],
+    "threats": ["description"],
+    "vulnerabilities": ["description", "vulnerability_type"],
+}
+
+# Register numbers are matched by prefix on their unique index instead of the text index
+NUMBER_FIELDS = {
+    "risks": "risk_number",
+    "incidents": "incident_number",
+    "assets": "asset_number",
+    "threats": "threat_number",
+    "vulnerabilities": "vulnerability_number",
+}
+# Only the prefixes the number generators produce, so searches like "CVE-2021" stay text searches
+NUMBER_PREFIXES = {
+    "risks": "RSK",
+    "incidents": "INC",
+    "assets": "ACT",
+    "threats": "THR",
+    "vulnerabilities": "VUL",
+}
+NUMBER_SEARCH_RES = {
+    collection: re.compile(rf'^{prefix}-?\d[\d-]*$', re.IGNORECASE) for collection, prefix in NUMBER_PREFIXES.items()
+}
+
+def match_any(values: Optional[List[str]]):
+    """Equality for a single value, $in for several"""
+    values = [v for v in values or [] if v]
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else {"$in": values}
+
+def match_range(low=None, high=None) -> Optional[dict]:
+    condition = {}
+    if low is not None:
+        condition["$gte"] = low
+    if high is not None:
+        condition["$lte"] = high
+    return condition or None
+
+def search_filter(collection: str, q: Optional[str]) -> Optional[dict]:
+    q = (q or "").strip()
+    if not q:
+        return None
+    number_re = NUMBER_SEARCH_RES.get(collection)
+    if number_re and number_re.match(q):
+        return {NUMBER_FIELDS[collection]: {"$regex": f"^{re.escape(q.upper())}"}}
+    return {"$text": {"$search": q}}
+
+def build_list_query(collection: str, conditions: dict, q: Optional[str] = None,
+                     scope: Optional[dict] = None) -> dict:
+    """
+    Combine an access scope, field conditions (None values are skipped) and free-text search
+    into the single query used for both the page and its total.
+    """
+    clauses = [scope] if scope else []
+    fields = {field: condition for field, condition in conditions.items() if condition is not None}
+    if fields:
+        clauses.append(fields)
+    search = search_filter(collection, q)
+    if search:
+        clauses.append(search)
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def encode_cursor(sort_by: str, sort_direction: int, item: dict) -> str:
+    """Opaque keyset cursor: the (sort value, id) of the last returned row"""
+    value = item
+    for part in sort_by.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    payload = json_util.dumps([sort_by, sort_direction, value, item.get('id')])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def keyset_filter(cursor: str, sort_by: str, sort_direction: int) -> dict:
+    """Filter selecting rows strictly after the cursor in (sort_by, id) order"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_direction, value, last_id = json_util.loads(base64.urlsafe_b64decode(padded).decode())
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort_by or cursor_direction != sort_direction:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort parameters")
+
+    op = "$gt" if sort_direction == 1 else "$lt"
+    # Nulls/missing values sort first ascending and last descending
+    if value is None:
+        if sort_direction == 1:
+            return {"$or": [{sort_by: None, "id": {op: last_id}}, {sort_by: {"$ne": None}}]}
+        return {sort_by: None, "id": {op: last_id}}
+    after = [{sort_by: {op: value}}, {sort_by: value, "id": {op: last_id}}]
+    if sort_direction == -1:
+        after.append({sort_by: None})
+    return {"$or": after}
+
+# Totals for filtered queries are cached briefly; writes through notify_write() drop them
+COUNT_CACHE_TTL = float(os.environ.get('COUNT_CACHE_TTL', '10'))
+COUNT_CACHE_MAX_ENTRIES = int(os.environ.get('COUNT_CACHE_MAX_ENTRIES', '1000'))
+# Insertion ordered, so the oldest entries go first when the size bound is hit
+count_cache: Dict[tuple, tuple] = collections.OrderedDict()
+
+def _prune_count_cache(collection: str, version: Optional[int]):
+    """Drop expired totals and those of older versions of the collection before adding one"""
+    now = time.monotonic()
+    stale = [
+        key for key, (expires, _) in count_cache.items()
+        if expires <= now or (key[0] == collection and None not in (key[2], version) and key[2] < version)
+    ]
+    for key in stale:
+        count_cache.pop(key, None)
+    while len(count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+        count_cache.popitem(last=False)
+
+async def count_documents_cached(collection: str, query: dict, version: Optional[int] = None) -> int:
+    """
+    version is the collection's stamp when the caller has it; totals cached by other workers
+    before a write then stop matching, not only those of the worker that handled the write.
+    """
+    if not query:
+        # Collection metadata, no scan
+        return await db[collection].estimated_document_count()
+    key = (collection, json_util.dumps(query), version)
+    cached = count_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    total = await db[collection].count_documents(query)
+    _prune_count_cache(collection, version)
+    count_cache.pop(key, None)
+    count_cache[key] = (time.monotonic() + COUNT_CACHE_TTL, total)
+    return total
+
+def invalidate_count_cache(collection: str):
+    for key in [k for k in count_cache if k[0] == collection]:
+        count_cache.pop(key, None)
+
+async def fetch_page(collection: str, query: dict, sort_by: str, sort_direction: int, page: int, limit: int,
+                     cursor: Optional[str] = None, include_total: bool = True, version: Optional[int] = None) -> dict:
+    """
+    Fetch one page of a list endpoint. Without a cursor the classic page/limit skip is used;
+    with a cursor the query seeks past the last (sort value, id) using the sort index.
+    next_cursor is returned in both modes so clients can switch to cursor paging.
+    """
+    find_query = query
+    if cursor:
+        seek = keyset_filter(cursor, sort_by, sort_direction)
+        find_query = {"$and": [query, seek]} if query else seek
+    find_cursor = db[collection].find(find_query, {"_id": 0}).sort([(sort_by, sort_direction), ("id", sort_direction)])
+    if not cursor:
+        find_cursor = find_cursor.skip((page - 1) * limit)
+
+    # One extra row tells whether there is a next page
+    if include_total:
+        items, total = await asyncio.gather(
+            find_cursor.limit(limit + 1).to_list(limit + 1),
+            count_documents_cached(collection, query, version)
+        )
+    else:
+        items, total = await find_cursor.limit(limit + 1).to_list(limit + 1), None
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "total_pages": (total + limit - 1) // limit if total is not None else None,
+        "next_cursor": encode_cursor(sort_by, sort_direction, items[-1]) if has_more else None,
+    }
+
+@lru_cache(maxsize=None)
+def _trusted_plan(model) -> tuple:
+    """Field order, UTC timestamp fields and static defaults of a model, computed once"""
+    fields, utc_fields, defaults = [], [], {}
+    for name, field in model.model_fields.items():
+        fields.append(name)
+        if any(isinstance(m, AfterValidator) and m.func is _utc for m in field.metadata):
+            utc_fields.append(name)
+        if field.default_factory in (list, dict):
+            defaults[name] = field.default_factory()
+        elif not field.is_required() and field.default_factory is None:
+            defaults[name] = field.default
+    return tuple(fields), tuple(utc_fields), defaults
+
+def trusted_row(model, row: dict) -> dict:
+    """
+    Shape a Mongo row like model(**row).model_dump() without validating it. Only for rows
+    this app wrote through the same models: missing fields get their defaults, unknown keys
+    are dropped and naive BSON timestamps are marked UTC, but values are not coerced.
+    """
+    fields, utc_fields, defaults = _trusted_plan(model)
+    out = {}
+    for name in fields:
+        if name in row:
+            out[name] = row[name]
+        elif name in defaults:
+            out[name] = defaults[name]
+    for name in utc_fields:
+        value = out.get(name)
+        if isinstance(value, datetime) and value.tzinfo is None:
+            out[name] = value.replace(tzinfo=timezone.utc)
+    return out
+
+def trusted_page_response(model, page: dict, etag: Optional[str] = None) -> FastJSONResponse:
+    """Paginated list response straight from fetch_page() rows, skipping response_model validation"""
+    return FastJSONResponse({**page, "items": [trusted_row(model, row) for row in page["items"]]},
+                            headers=revalidate_headers(etag) if etag else None)
+
+# References to fire-and-forget tasks, so they are not garbage collected mid-flight
+background_tasks = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    # Not part of the request that spawned it, so its queries do not count against that request
+    context = contextvars.copy_context()
+    context.run(request_db_commands.set, None)
+    task = asyncio.create_task(coro, context=context)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# ==================== COUNTERS ====================
+
+def _parse_plain_number(prefix: str):
+    """Parser for numbers like INC000001"""
+    def parse(value: str) -> Optional[int]:
         try:
-            numbers.append(int(num_str))
+            return int(value.replace(prefix, ''))
         except ValueError:
-            continue
-    
-    next_num = max(numbers) + 1 if numbers else 1
+            return None
+    return parse
+
+def _parse_dashed_number(prefix: str):
+    """Parser for numbers like THR-2024-001"""
+    def parse(value: str) -> Optional[int]:
+        if not value.startswith(f"{prefix}-"):
+            return None
+        try:
+            return int(value.split('-')[-1])
+        except ValueError:
+            return None
+    return parse
+
+async def _max_existing_number(collection: str, field: str, parse) -> int:
+    """Scan existing documents once to find the highest used number (counter seed)"""
+    docs = await db[collection].find({field: {"$type": "string"}}, {field: 1, "_id": 0}).to_list(None)
+    numbers = [n for n in (parse(doc[field]) for doc in docs) if n is not None]
+    return max(numbers) if numbers else 0
+
+async def _max_registry_id_value(registry_id: str, column_id: str) -> int:
+    field = f"data.{column_id}"
+    records = await db.registry_records.find(
+        {"registry_id": registry_id, field: {"$exists": True}}, {field: 1, "_id": 0}
+    ).to_list(None)
+    max_num = 0
+    for rec in records:
+        try:
+            max_num = max(max_num, int(rec['data'][column_id]))
+        except (ValueError, TypeError):
+            pass
+    return max_num
+
+def registry_counter_name(registry_id: str, column_id: str) -> str:
+    return f"registry:{registry_id}:{column_id}"
+
+async def next_sequence(name: str, seed, count: int = 1) -> int:
+    """
+    Atomically allocate the next value of a named counter in the counters collection.
+    Once seeded this is a single find_one_and_update round trip; seed() is an async
+    callable returning the current max and only runs the first time a counter is used.
+    With count > 1 a block of consecutive values is reserved and the first one returned.
+    """
+    counter = await db.counters.find_one_and_update(
+        {"_id": name}, {"$inc": {"seq": count}}, return_document=ReturnDocument.AFTER
+    )
+    if counter:
+        return counter["seq"] - count + 1
+
+    await _seed_sequence(name, seed)
+    counter = await db.counters.find_one_and_update(
+        {"_id": name}, {"$inc": {"seq": count}}, return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"] - count + 1
+
+async def _seed_sequence(name: str, seed, floor: int = 0):
+    # $max keeps concurrent seeding from several workers consistent
+    start = max(await seed(), floor)
+    try:
+        await db.counters.update_one({"_id": name}, {"$max": {"seq": start}}, upsert=True)
+    except DuplicateKeyError:
+        # Another worker created the counter first
+        await db.counters.update_one({"_id": name}, {"$max": {"seq": start}})
+
+async def raise_sequence(name: str, value: int, seed):
+    """
+    Make sure a counter never hands out a value that was supplied explicitly (imports).
+    A counter that does not exist yet is seeded first, so existing numbers stay covered too.
+    """
+    result = await db.counters.update_one({"_id": name}, {"$max": {"seq": value}})
+    if result.matched_count == 0:
+        await _seed_sequence(name, seed, value)
+
+async def generate_incident_number() -> str:
+    """Generate next incident number in format INC000001"""
+    next_num = await next_sequence(
+        "incident_number",
+        partial(_max_existing_number, "incidents", "incident_number", _parse_plain_number("INC"))
+    )
     return f"INC{next_num:06d}"
 
+async def generate_asset_numbers(count: int) -> List[str]:
+    """Reserve count consecutive asset numbers in format ACT000001"""
+    first = await next_sequence(
+        "asset_number",
+        partial(_max_existing_number, "assets", "asset_number", _parse_plain_number("ACT")),
+        count
+    )
+    return [f"ACT{n:06d}" for n in range(first, first + count)]
+
 async def generate_asset_number() -> str:
     """Generate next asset number in format ACT000001"""
-    assets = await db.assets.find({}, {"asset_number": 1}).to_list(None)
-    if not assets:
-        return "ACT000001"
-    
-    # Extract numbers and find max
-    numbers = []
-    for asset in assets:
-        num_str = asset.get('asset_number', '').replace('ACT', '')
-        try:
-            numbers.append(int(num_str))
-        except ValueError:
-            continue
-    
-    next_num = max(numbers) + 1 if numbers else 1
-    return f"ACT{next_num:06d}"
+    return (await generate_asset_numbers(1))[0]
 
 def calculate_risk_criticality(probability: int, impact: int) -> tuple:
     """
@@ -623,23 +1240,36 @@ def calculate_risk_criticality(probability: int, impact: int) -> tuple:
     
     return risk_level, criticality
 
+# Update pipeline stages recomputing risk_level and criticality from the stored probability and
+# impact, the same matrix as calculate_risk_criticality(); keep the two in sync
+RISK_SCORE_STAGES = [
+    {"$set": {"risk_level": {"$multiply": ["$probability", "$impact"]}}},
+    {"$set": {"criticality": {"$switch": {
+        "branches": [
+            {"case": {"$gte": ["$risk_level", 15]}, "then": "Критический"},
+            {"case": {"$gte": ["$risk_level", 10]}, "then": "Высокий"},
+            {"case": {"$gte": ["$risk_level", 5]}, "then": "Средний"},
+        ],
+        "default": "Низкий",
+    }}}},
+]
+
+def literal_set(fields: dict) -> dict:
+    """$set stage for an update pipeline; values are literals, so "$..." strings stay strings"""
+    return {"$set": {key: {"$literal": value} for key, value in fields.items()}}
+
+async def generate_risk_numbers(count: int) -> List[str]:
+    """Reserve count consecutive risk numbers in format RSK000001"""
+    first = await next_sequence(
+        "risk_number",
+        partial(_max_existing_number, "risks", "risk_number", _parse_plain_number("RSK")),
+        count
+    )
+    return [f"RSK{n:06d}" for n in range(first, first + count)]
+
 async def generate_risk_number() -> str:
     """Generate next risk number in format RSK000001"""
-    risks = await db.risks.find({}, {"risk_number": 1}).to_list(None)
-    if not risks:
-        return "RSK000001"
-    
-    # Extract numbers and find max
-    numbers = []
-    for risk in risks:
-        num_str = risk.get('risk_number', '').replace('RSK', '')
-        try:
-            numbers.append(int(num_str))
-        except ValueError:
-            continue
-    
-    next_num = max(numbers) + 1 if numbers else 1
-    return f"RSK{next_num:06d}"
+    return (await generate_risk_numbers(1))[0]
 
 def calculate_incident_metrics(incident_dict: dict) -> dict:
     """Calculate MTTA, MTTR, MTTC for an incident in minutes"""
@@ -682,13 +1312,286 @@ def calculate_incident_metrics(incident_dict: dict) -> dict:
     
     return incident_dict
 
-# ==================== AUTH HELPERS ====================
+# ==================== FILE STORAGE ====================
+
+# Binary files live in GridFS buckets; documents only keep metadata and a download URL
+incident_attachments_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="incident_attachments")
+comment_images_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="incident_comment_images")
+wiki_images_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="wiki_image_files")
+
+# Stored files never change under the same id, so clients may cache them forever
+IMMUTABLE_PUBLIC_CACHE = "public, max-age=31536000, immutable"
+IMMUTABLE_PRIVATE_CACHE = "private, max-age=31536000, immutable"
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+def decode_data_url(data_url: str) -> tuple:
+    """Split a base64 data URL into (content_type, raw bytes)"""
+    if not data_url or not data_url.startswith('data:') or ',' not in data_url:
+        raise HTTPException(status_code=400, detail="Expected a base64 data URL")
+    header, payload = data_url.split(',', 1)
+    content_type = header[len('data:'):].split(';', 1)[0] or 'application/octet-stream'
+    try:
+        return content_type, base64.b64decode(payload)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid base64 data")
+
+def _as_datetime(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def content_disposition(disposition: str, filename: str) -> str:
+    """Content-Disposition with an ASCII fallback and the RFC 5987 UTF-8 filename for Cyrillic names"""
+    stem, ext = os.path.splitext(filename)
+    fallback = (re.sub(r'[^A-Za-z0-9._-]+', '_', stem).strip('._-') or 'download') + re.sub(r'[^A-Za-z0-9.]', '', ext)
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def file_cache_headers(etag: Optional[str], last_modified, cache_control: str) -> dict:
+    """Validator and caching headers for an immutable stored file"""
+    headers = {"Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+    last_modified = _as_datetime(last_modified)
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: Optional[str], last_modified=None) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the stored validators"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if not etag:
+            return False
+        tags = [t.strip().removeprefix('W/').strip('"') for t in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    last_modified = _as_datetime(last_modified)
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """Parse a single-range "bytes=start-end" header, returns inclusive (start, end) or None"""
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start_str, _, end_str = range_header[len('bytes='):].strip().partition('-')
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+            if end < start:
+                # Invalid range-spec: ignored, the whole file is served (RFC 9110 14.2)
+                return None
+        else:
+            # Suffix range: last N bytes
+            start = max(size - int(end_str), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416, detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+async def stream_gridfs_file(bucket: AsyncIOMotorGridFSBucket, file_id: str, request: Request,
+                             content_type: Optional[str] = None, headers: Optional[dict] = None) -> StreamingResponse:
+    """Stream a GridFS file chunk by chunk, honouring single byte ranges"""
+    try:
+        grid_out = await bucket.open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    size = grid_out.length
+    byte_range = parse_range_header(request.headers.get('range'), size)
+    start, end = byte_range if byte_range else (0, size - 1)
+
+    async def body():
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    response_headers = {"Accept-Ranges": "bytes", "Content-Length": str(max(end - start + 1, 0))}
+    if byte_range:
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response_headers.update(headers or {})
+    media_type = content_type or (grid_out.metadata or {}).get('content_type') or 'application/octet-stream'
+    return StreamingResponse(
+        body(), status_code=206 if byte_range else 200, media_type=media_type, headers=response_headers
+    )
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def store_incident_attachment(incident_id: str, data: bytes, filename: str, content_type: str,
+                                    attachment_id: Optional[str] = None, created_at: Optional[datetime] = None) -> dict:
+    """Upload attachment bytes to GridFS and return the metadata kept on the incident"""
+    attachment_id = attachment_id or str(uuid.uuid4())
+    meta = {
+        "id": attachment_id,
+        "filename": filename,
+        "content_type": content_type,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "url": f"/api/incidents/{incident_id}/attachments/{attachment_id}",
+        "created_at": created_at or datetime.now(timezone.utc),
+    }
+    await incident_attachments_bucket.upload_from_stream_with_id(
+        attachment_id, filename or attachment_id, data,
+        metadata={"incident_id": incident_id, "content_type": content_type, "sha256": meta["sha256"]}
+    )
+    return meta
+
+async def store_wiki_image(image_id: str, data: bytes, filename: Optional[str], content_type: str,
+                           uploaded_by: Optional[str], uploaded_at: Optional[datetime] = None) -> dict:
+    """Upload wiki image bytes to GridFS and return the wiki_images metadata document"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    try:
+        await wiki_images_bucket.upload_from_stream_with_id(
+            image_id, filename or image_id, data, metadata={"content_type": content_type, "sha256": sha256}
+        )
+    except FileExists:
+        # Left over from an interrupted migration run
+        pass
+    return {
+        "id": image_id,
+        "filename": filename,
+        "content_type": content_type,
+        "size": len(data),
+        "sha256": sha256,
+        "uploaded_by": uploaded_by,
+        "uploaded_at": uploaded_at or datetime.now(timezone.utc),
+    }
+
+def comment_image_url(incident_id: str, comment_id: str) -> str:
+    return f"/api/incidents/{incident_id}/comments/{comment_id}/image"
+
+async def store_comment_image(incident_id: str, comment_id: str, data_url: str) -> dict:
+    """Upload a comment's data URL image to GridFS; returns the fields kept on the comment"""
+    content_type, data = decode_data_url(data_url)
+    sha256 = hashlib.sha256(data).hexdigest()
+    try:
+        await comment_images_bucket.upload_from_stream_with_id(
+            comment_id, comment_id, data,
+            metadata={"incident_id": incident_id, "content_type": content_type, "sha256": sha256}
+        )
+    except FileExists:
+        # Left over from an interrupted migration run
+        pass
+    return {"image": comment_image_url(incident_id, comment_id), "image_sha256": sha256}
+
+async def delete_comment_image_files(comment_ids: List[str]):
+    for comment_id in comment_ids:
+        try:
+            await comment_images_bucket.delete(comment_id)
+        except NoFile:
+            pass
+
+async def delete_incident_comments(incident_ids: List[str]):
+    """Delete the comments of incidents together with their image files"""
+    with_images = await db.incident_comments.distinct(
+        "id", {"incident_id": {"$in": incident_ids}, "image_sha256": {"$ne": None}}
+    )
+    await delete_comment_image_files(with_images)
+    await db.incident_comments.delete_many({"incident_id": {"$in": incident_ids}})
+
+async def delete_incident_attachment_files(attachment_ids: List[str]):
+    for attachment_id in attachment_ids:
+        try:
+            await incident_attachments_bucket.delete(attachment_id)
+        except NoFile:
+            pass
+
+async def externalize_incident_attachments(incident_id: str, attachments: List[dict],
+                                           current: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Attachment list to store for a create/update. New entries carry a data URL and are uploaded
+    to GridFS; every other entry must name an attachment already on the incident and is rebuilt
+    from the stored metadata, so clients cannot alter it or pull in another incident's file.
+    """
+    stored = {a['id']: a for a in current or [] if isinstance(a, dict) and a.get('id')}
+    plan = []
+    for att in attachments or []:
+        if not isinstance(att, dict):
+            raise HTTPException(status_code=400, detail="Invalid attachment")
+        if isinstance(att.get('data'), str) and att['data'].startswith('data:'):
+            plan.append((att.get('filename', ''), decode_data_url(att['data'])))
+        elif att.get('id') in stored:
+            plan.append(stored[att['id']])
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown attachment: {att.get('id')}")
+
+    # Everything is validated before the first upload, so a rejected request leaves no files behind
+    result = []
+    for item in plan:
+        if isinstance(item, tuple):
+            filename, (content_type, data) = item
+            item = await store_incident_attachment(incident_id, data, filename, content_type)
+        result.append(item)
+    return result
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# ==================== AUTH HELPERS ====================
+
+# bcrypt takes ~250ms per call; it runs on a bounded thread pool so it never blocks the event loop
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '2'))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+password_pool_lock = threading.Lock()
+password_pool_stats = {
+    "queued": 0,  # submitted, waiting for a free worker
+    "running": 0,
+    "completed": 0,
+    "max_queue_depth": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+}
+
+async def _run_password_task(func, *args):
+    submitted = time.perf_counter()
+    with password_pool_lock:
+        password_pool_stats["queued"] += 1
+        password_pool_stats["max_queue_depth"] = max(password_pool_stats["max_queue_depth"], password_pool_stats["queued"])
+
+    def task():
+        started = time.perf_counter()
+        with password_pool_lock:
+            password_pool_stats["queued"] -= 1
+            password_pool_stats["running"] += 1
+            password_pool_stats["total_wait_ms"] += (started - submitted) * 1000
+        try:
+            return func(*args)
+        finally:
+            with password_pool_lock:
+                password_pool_stats["running"] -= 1
+                password_pool_stats["completed"] += 1
+                password_pool_stats["total_run_ms"] += (time.perf_counter() - started) * 1000
+
+    return await asyncio.get_running_loop().run_in_executor(password_executor, task)
+
+def get_password_pool_stats() -> dict:
+    with password_pool_lock:
+        stats = dict(password_pool_stats)
+    completed = stats["completed"]
+    stats["concurrency"] = PASSWORD_HASH_CONCURRENCY
+    stats["avg_wait_ms"] = round(stats["total_wait_ms"] / completed, 2) if completed else None
+    stats["avg_run_ms"] = round(stats["total_run_ms"] / completed, 2) if completed else None
+    return stats
+
+async def hash_password(password: str) -> str:
+    return await _run_password_task(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_task(pwd_context.verify, plain_password, hashed_password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -696,27 +1599,117 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+# Per-worker cache of all roles, loaded with one query. Role writes invalidate the local worker;
+# other workers reload within ROLES_CACHE_TTL seconds, as with the user cache below.
+ROLES_CACHE_TTL = float(os.environ.get('ROLES_CACHE_TTL', '30'))
+# An unknown role id (e.g. created on another worker) reloads the cache at most this often
+ROLES_CACHE_MISS_RELOAD = 1.0
+roles_cache = {"loaded_at": 0.0, "expires": 0.0, "by_id": {}}
+
+async def get_cached_roles(refresh: bool = False) -> Dict[str, dict]:
+    """Role documents by id; treat them as read-only"""
+    now = time.monotonic()
+    if refresh or roles_cache["expires"] <= now:
+        roles = await db.roles.find({}, {"_id": 0}).to_list(None)
+        roles_cache.update(loaded_at=now, expires=now + ROLES_CACHE_TTL, by_id={r['id']: r for r in roles})
+    return roles_cache["by_id"]
+
+async def get_cached_role(role_id: Optional[str]) -> Optional[dict]:
+    if not role_id:
+        return None
+    roles = await get_cached_roles()
+    if role_id not in roles and time.monotonic() - roles_cache["loaded_at"] > ROLES_CACHE_MISS_RELOAD:
+        roles = await get_cached_roles(refresh=True)
+    return roles.get(role_id)
+
+def invalidate_roles_cache():
+    roles_cache["expires"] = 0.0
+    invalidate_admin_ids_cache()
+
+# Admin user ids for fan-out on incident status changes (get_admin_user_ids), per worker like the
+# caches above: user and role writes invalidate it locally, other workers refresh within the TTL
+ADMIN_IDS_CACHE_TTL = float(os.environ.get('ADMIN_IDS_CACHE_TTL', '30'))
+admin_ids_cache = {"expires": 0.0, "ids": frozenset()}
+
+def invalidate_admin_ids_cache():
+    admin_ids_cache["expires"] = 0.0
+
+async def resolve_user_role(user_doc: dict) -> dict:
+    """Fill role_name and permissions of a user document from its role"""
+    role_id = user_doc.get('role')
+    permissions = None
+
+    # Check if role is an ID (custom role) or legacy role name
+    role_doc = await get_cached_role(role_id)
+    if role_doc:
+        permissions = role_doc.get('permissions')
+        user_doc['role_name'] = role_doc.get('name')
+    elif role_id == "Администратор":
+        # Legacy admin role - full permissions
+        permissions = {
+            "dashboard": True, "incidents": True, "assets": True, "risks": True,
+            "threats": True, "vulnerabilities": True, "users": True, "wiki": True,
+            "registries": True, "settings": True
+        }
+        user_doc['role_name'] = "Администратор"
+
+    if permissions:
+        user_doc['permissions'] = permissions
+    return user_doc
+
+# Per-worker cache of resolved principals keyed by token subject (username).
+# Writes invalidate the local worker; other workers see changes within USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+user_cache: Dict[str, tuple] = {}
+user_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def invalidate_user_cache(user_id: Optional[str] = None, role_id: Optional[str] = None):
+    """Drop cached principals by user id, by role id, or everything when called without arguments"""
+    invalidate_admin_ids_cache()
+    if user_id is None and role_id is None:
+        keys = list(user_cache)
+    else:
+        keys = [
+            username for username, (_, user) in user_cache.items()
+            if (user_id is not None and user.id == user_id) or (role_id is not None and user.role == role_id)
+        ]
+    for username in keys:
+        user_cache.pop(username, None)
+    user_cache_stats["invalidations"] += len(keys)
+
+async def get_token_user(token: str, purpose: Optional[str] = None) -> User:
+    """
+    Principal of a signed token. Access tokens have no purpose claim; single-purpose tokens
+    (stream tickets) are only accepted where that purpose is asked for.
+    """
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("purpose") != purpose:
             raise HTTPException(status_code=401, detail="Invalid token")
+
+        cached = user_cache.get(username)
+        if cached and cached[0] > time.monotonic():
+            user_cache_stats["hits"] += 1
+            return cached[1]
+        user_cache_stats["misses"] += 1
         
         user_doc = await db.users.find_one({"username": username}, {"_id": 0, "password": 0})
         if not user_doc:
             raise HTTPException(status_code=401, detail="User not found")
         
-        if isinstance(user_doc.get('created_at'), str):
-            user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
         
-        return User(**user_doc)
+        user = User(**await resolve_user_role(user_doc))
+        user_cache[username] = (time.monotonic() + USER_CACHE_TTL, user)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    return await get_token_user(credentials.credentials)
+
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/register", response_model=User)
@@ -730,7 +1723,7 @@ async def register_user(user_data: UserCreate, current_user: User = Depends(get_
     
     # Get role name from role ID
     role_name = user_data.role
-    role = await db.roles.find_one({"id": user_data.role})
+    role = await get_cached_role(user_data.role)
     if role:
         role_name = role['name']
     
@@ -743,10 +1736,10 @@ async def register_user(user_data: UserCreate, current_user: User = Depends(get_
     )
     
     doc = user.model_dump()
-    doc['password'] = hash_password(user_data.password)
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['password'] = await hash_password(user_data.password)
     
     await db.users.insert_one(doc)
+    invalidate_admin_ids_cache()
     return user
 
 @api_router.post("/auth/login", response_model=Token)
@@ -755,39 +1748,16 @@ async def login(credentials: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(credentials.password, user_doc['password']):
+    if not await verify_password(credentials.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     access_token = create_access_token({"sub": user_doc['username']})
     
     user_doc.pop('password')
     user_doc.pop('_id')
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
     
     # Get role permissions
-    role_id = user_doc.get('role')
-    permissions = None
-    
-    # Check if role is an ID (custom role) or legacy role name
-    role_doc = await db.roles.find_one({"id": role_id})
-    if role_doc:
-        permissions = role_doc.get('permissions')
-        user_doc['role_name'] = role_doc.get('name')
-    elif role_id == "Администратор":
-        # Legacy admin role - full permissions
-        permissions = {
-            "dashboard": True, "incidents": True, "assets": True, "risks": True,
-            "threats": True, "vulnerabilities": True, "users": True, "wiki": True,
-            "registries": True, "settings": True
-        }
-        user_doc['role_name'] = "Администратор"
-    
-    # Add permissions to user doc
-    if permissions:
-        user_doc['permissions'] = permissions
-    
-    user = User(**user_doc)
+    user = User(**await resolve_user_role(user_doc))
     return Token(access_token=access_token, token_type="bearer", user=user)
 
 @api_router.get("/auth/me", response_model=User)
@@ -797,20 +1767,38 @@ async def get_me(current_user: User = Depends(get_current_user)):
 # ==================== USER ENDPOINTS ====================
 
 @api_router.get("/users", response_model=List[User])
-async def get_users(current_user: User = Depends(get_current_user)):
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
+async def get_users(
+    response: Response,
+    q: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Users ordered by full name, all of them unless limit is given. q matches username, full
+    name or email; X-Total-Count carries the number of matches for paging.
+    """
+    query = {}
+    if q and q.strip():
+        pattern = {"$regex": re.escape(q.strip()), "$options": "i"}
+        query = {"$or": [{"username": pattern}, {"full_name": pattern}, {"email": pattern}]}
+    cursor = db.users.find(query, {"_id": 0, "password": 0}).sort([("full_name", ASCENDING), ("id", ASCENDING)])
+    if limit:
+        cursor = cursor.skip((page - 1) * limit).limit(limit)
+        users, total = await asyncio.gather(cursor.to_list(limit), db.users.count_documents(query))
+    else:
+        users = await cursor.to_list(1000)
+        total = len(users)
+    response.headers["X-Total-Count"] = str(total)
+
+    # Role names from the roles cache in one pass; legacy users carry the role name itself
+    roles = await get_cached_roles()
     for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-        
-        # Get role name if role is an ID
-        if user.get('role') and not user.get('role_name'):
-            role = await db.roles.find_one({"id": user['role']})
-            if role:
-                user['role_name'] = role['name']
-            else:
-                # Legacy role names
-                user['role_name'] = user['role']
+        role = roles.get(user.get('role'))
+        if role:
+            user['role_name'] = role['name']
+        elif user.get('role') and not user.get('role_name'):
+            user['role_name'] = user['role']
     return users
 
 @api_router.delete("/users/{user_id}")
@@ -821,10 +1809,12 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_cache(user_id=user_id)
     return {"message": "User deleted"}
 
 @api_router.put("/users/{user_id}", response_model=User)
 async def update_user(user_id: str, user_data: UserUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update (role names come from the roles cache)"""
     if current_user.role != "Администратор":
         raise HTTPException(status_code=403, detail="Only admins can update users")
     
@@ -834,20 +1824,20 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: User =
     
     # If role is being updated, get role name
     if 'role' in update_dict:
-        role = await db.roles.find_one({"id": update_dict['role']})
+        role = await get_cached_role(update_dict['role'])
         if role:
             update_dict['role_name'] = role['name']
         else:
             # Might be legacy role name
             update_dict['role_name'] = update_dict['role']
     
-    result = await db.users.update_one({"id": user_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    user = await db.users.find_one_and_update(
+        {"id": user_id}, {"$set": update_dict},
+        projection={"_id": 0, "password": 0}, return_document=ReturnDocument.AFTER
+    )
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
+    invalidate_user_cache(user_id=user_id)
     
     return User(**user)
 
@@ -865,12 +1855,13 @@ async def change_user_password(user_id: str, password_data: PasswordChange, curr
     if current_user.id == user_id and current_user.role != "Администратор":
         if not password_data.old_password:
             raise HTTPException(status_code=400, detail="Old password required")
-        if not verify_password(password_data.old_password, user['password']):
+        if not await verify_password(password_data.old_password, user['password']):
             raise HTTPException(status_code=400, detail="Invalid old password")
     
     # Update password
-    new_hash = hash_password(password_data.new_password)
+    new_hash = await hash_password(password_data.new_password)
     await db.users.update_one({"id": user_id}, {"$set": {"password": new_hash}})
+    invalidate_user_cache(user_id=user_id)
     
     return {"message": "Password changed successfully"}
 
@@ -888,8 +1879,6 @@ async def create_role(role_data: RoleCreate, current_user: User = Depends(get_cu
     
     role = Role(**role_data.model_dump())
     doc = role.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     
     # Convert permissions to dict
     if hasattr(doc['permissions'], 'model_dump'):
@@ -898,6 +1887,7 @@ async def create_role(role_data: RoleCreate, current_user: User = Depends(get_cu
         doc['permissions'] = dict(doc['permissions'])
     
     await db.roles.insert_one(doc)
+    invalidate_roles_cache()
     return role
 
 @api_router.get("/roles", response_model=List[Role])
@@ -907,10 +1897,6 @@ async def get_roles(current_user: User = Depends(get_current_user)):
     
     roles = await db.roles.find({}, {"_id": 0}).to_list(1000)
     for role in roles:
-        if isinstance(role.get('created_at'), str):
-            role['created_at'] = datetime.fromisoformat(role['created_at'])
-        if isinstance(role.get('updated_at'), str):
-            role['updated_at'] = datetime.fromisoformat(role['updated_at'])
         if role.get('permissions') and isinstance(role['permissions'], dict):
             role['permissions'] = RolePermissions(**role['permissions'])
     return roles
@@ -924,10 +1910,6 @@ async def get_role(role_id: str, current_user: User = Depends(get_current_user))
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     
-    if isinstance(role.get('created_at'), str):
-        role['created_at'] = datetime.fromisoformat(role['created_at'])
-    if isinstance(role.get('updated_at'), str):
-        role['updated_at'] = datetime.fromisoformat(role['updated_at'])
     if role.get('permissions') and isinstance(role['permissions'], dict):
         role['permissions'] = RolePermissions(**role['permissions'])
     
@@ -949,17 +1931,15 @@ async def update_role(role_id: str, role_data: RoleUpdate, current_user: User =
         elif not isinstance(update_dict['permissions'], dict):
             update_dict['permissions'] = dict(update_dict['permissions'])
     
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
     result = await db.roles.update_one({"id": role_id}, {"$set": update_dict})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Role not found")
+    invalidate_roles_cache()
+    invalidate_user_cache(role_id=role_id)
     
     role = await db.roles.find_one({"id": role_id}, {"_id": 0})
-    if isinstance(role.get('created_at'), str):
-        role['created_at'] = datetime.fromisoformat(role['created_at'])
-    if isinstance(role.get('updated_at'), str):
-        role['updated_at'] = datetime.fromisoformat(role['updated_at'])
     if role.get('permissions') and isinstance(role['permissions'], dict):
         role['permissions'] = RolePermissions(**role['permissions'])
     
@@ -978,6 +1958,7 @@ async def delete_role(role_id: str, current_user: User = Depends(get_current_use
     result = await db.roles.delete_one({"id": role_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Role not found")
+    invalidate_roles_cache()
     
     return {"message": "Role deleted"}
 
@@ -990,12 +1971,9 @@ async def get_settings(current_user: User = Depends(get_current_user)):
         # Create default settings
         default_settings = Settings()
         doc = default_settings.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
         await db.settings.insert_one(doc)
         return default_settings
     
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return Settings(**settings)
 
 @api_router.put("/settings", response_model=Settings)
@@ -1007,7 +1985,7 @@ async def update_settings(settings_data: SettingsUpdate, current_user: User = De
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
     await db.settings.update_one(
         {"id": "settings"},
@@ -1016,10 +1994,249 @@ async def update_settings(settings_data: SettingsUpdate, current_user: User = De
     )
     
     settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return Settings(**settings)
 
+# ==================== BULK OPERATIONS ====================
+# Declared before the per-id routes so /{collection}/bulk is not taken for an id
+
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '5000'))
+
+# Fields a bulk filter may use; values match like the list endpoint filters
+BULK_FILTER_FIELDS = {
+    "risks": ["status", "criticality", "owner", "treatment_strategy"],
+    "incidents": ["status", "criticality", "system", "incident_type"],
+    "assets": ["status", "criticality", "category", "owner"],
+    "threats": ["category", "source", "related_vulnerability_id"],
+    "vulnerabilities": ["status", "severity", "related_asset_id"],
+}
+
+def bulk_selection_query(collection: str, selection: BulkSelection, scope: Optional[dict] = None) -> dict:
+    if bool(selection.ids) == bool(selection.filter):
+        raise HTTPException(status_code=400, detail="Provide either ids or filter")
+    if selection.ids:
+        if len(selection.ids) > BULK_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} ids per request")
+        return {"id": {"$in": selection.ids}}
+    unknown = set(selection.filter) - set(BULK_FILTER_FIELDS[collection])
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+    conditions = {
+        field: match_any(value if isinstance(value, list) else [value]) for field, value in selection.filter.items()
+    }
+    if all(condition is None for condition in conditions.values()):
+        raise HTTPException(status_code=400, detail="Filter must not be empty")
+    return build_list_query(collection, conditions, scope=scope)
+
+async def load_bulk_targets(collection: str, selection: BulkSelection, fields: List[str],
+                            scope: Optional[dict] = None) -> tuple:
+    """Current documents of the selection (only the given fields) and the requested ids that do not exist"""
+    query = bulk_selection_query(collection, selection, scope)
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in fields}}
+    docs = await db[collection].find(query, projection).to_list(BULK_MAX_ITEMS + 1)
+    if len(docs) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Selection matches more than {BULK_MAX_ITEMS} records")
+    found = {doc['id'] for doc in docs}
+    missing = [item_id for item_id in dict.fromkeys(selection.ids or []) if item_id not in found]
+    return docs, missing
+
+def _reject_bulk_numbers(update_dict: dict):
+    # Numbers are unique per record, so one value can never be set on several of them
+    numbers = sorted(field for field in update_dict if field.endswith("_number"))
+    if numbers:
+        raise HTTPException(status_code=400, detail=f"Cannot be changed in bulk: {', '.join(numbers)}")
+
+def _bulk_update_fields(update: BaseModel) -> dict:
+    update_dict = {k: v for k, v in update.model_dump().items() if v is not None}
+    if not update_dict:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    _reject_bulk_numbers(update_dict)
+    return update_dict
+
+async def run_bulk_update(collection: str, ops: list, op_ids: List[List[str]], missing: List[str],
+                          rejected: Optional[List[BulkItemResult]] = None) -> BulkResult:
+    """
+    Execute the prepared operations as one unordered bulk_write and report per-id outcomes.
+    op_ids[i] are the ids ops[i] targets; when an operation fails they are reported as failed.
+    """
+    failed = {}
+    matched = modified = 0
+    if ops:
+        try:
+            write = await db[collection].bulk_write(ops, ordered=False)
+            matched, modified = write.matched_count, write.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            matched, modified = details.get('nMatched', 0), details.get('nModified', 0)
+            for write_error in details.get('writeErrors', []):
+                message = "Duplicate identifier" if write_error.get('code') == 11000 else write_error.get('errmsg', 'Write failed')
+                for item_id in op_ids[write_error['index']]:
+                    failed[item_id] = message
+        await notify_write(collection)
+    return BulkResult(matched=matched, modified=modified, results=[
+        *(BulkItemResult(id=item_id, status="failed", detail=failed[item_id]) if item_id in failed
+          else BulkItemResult(id=item_id, status="updated") for ids in op_ids for item_id in ids),
+        *(rejected or []),
+        *(BulkItemResult(id=item_id, status="not_found") for item_id in missing),
+    ])
+
+async def run_bulk_delete(collection: str, selection: BulkSelection, fields: List[str] = None) -> tuple:
+    docs, missing = await load_bulk_targets(collection, selection, fields or [])
+    ids = [doc['id'] for doc in docs]
+    result = BulkResult(results=[
+        *(BulkItemResult(id=item_id, status="deleted") for item_id in ids),
+        *(BulkItemResult(id=item_id, status="not_found") for item_id in missing),
+    ])
+    if ids:
+        write = await db[collection].bulk_write([DeleteMany({"id": {"$in": ids}})], ordered=False)
+        result.deleted = write.deleted_count
+        await notify_write(collection)
+    return result, docs
+
+@api_router.patch("/risks/bulk", response_model=BulkResult)
+async def bulk_update_risks(request_data: BulkRiskUpdate, current_user: User = Depends(get_current_user)):
+    update_dict = _bulk_update_fields(request_data.update)
+    update_dict['updated_at'] = datetime.now(timezone.utc)
+    docs, missing = await load_bulk_targets("risks", request_data, [])
+    ids = [doc['id'] for doc in docs]
+
+    # Level and criticality depend on each risk's own probability/impact; the pipeline rescores per document
+    if 'probability' in update_dict or 'impact' in update_dict:
+        update = [literal_set(update_dict), *RISK_SCORE_STAGES]
+    else:
+        update = {"$set": update_dict}
+    ops = [UpdateMany({"id": {"$in": ids}}, update)] if ids else []
+    return await run_bulk_update("risks", ops, [ids] if ids else [], missing)
+
+@api_router.delete("/risks/bulk", response_model=BulkResult)
+async def bulk_delete_risks(selection: BulkSelection, current_user: User = Depends(get_current_user)):
+    result, _ = await run_bulk_delete("risks", selection)
+    return result
+
+@api_router.patch("/incidents/bulk", response_model=BulkResult)
+async def bulk_update_incidents(request_data: BulkIncidentUpdate, current_user: User = Depends(get_current_user)):
+    """Bulk variant of update_incident: same permission rules, status side effects, metrics and auto-notes"""
+    if request_data.update.attachments is not None:
+        raise HTTPException(status_code=400, detail="Attachments cannot be changed in bulk")
+    is_admin = current_user.role == "Администратор"
+    update_data = request_data.update.model_dump()
+    if not is_admin:
+        update_data['assigned_to'] = None  # Non-admin cannot reassign
+    base_update = {k: v for k, v in update_data.items() if v is not None}
+    if not base_update:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    _reject_bulk_numbers(base_update)
+    explicit_assignment = update_data.get('assigned_to') is not None
+
+    scope = None if is_admin else {"$or": [{"created_by": current_user.id}, {"assigned_to": current_user.id}]}
+    docs, missing = await load_bulk_targets("incidents", request_data, [
+        "status", "assigned_to", "created_by", "incident_time", "detection_time", "reaction_start_time",
+        "closed_at", *[field for field in base_update if field not in ("assigned_to",)]
+    ], scope if not request_data.ids else None)
+    admin_ids = await get_admin_user_ids() if base_update.get('status') == 'Завершен' else []
+
+    now = datetime.now(timezone.utc)
+    ops, op_ids, rejected, notes = [], [], [], []
+    changes = {}
+    for current in docs:
+        if not is_admin and current_user.id not in (current.get('assigned_to') or []) \
+                and current_user.id != current.get('created_by'):
+            rejected.append(BulkItemResult(id=current['id'], status="forbidden",
+                                           detail="Incident is not assigned to or created by you"))
+            continue
+        update_dict = dict(base_update)
+        if current.get('status') == 'Проверен' and update_dict.get('status') not in (None, 'Проверен') and not is_admin:
+            rejected.append(BulkItemResult(id=current['id'], status="forbidden",
+                                           detail="Только администратор может изменить статус «Проверен»"))
+            continue
+        if update_dict.get('status') == 'Проверен' and not update_dict.get('closed_at') and not current.get('closed_at'):
+            update_dict['closed_at'] = now
+        if admin_ids:
+            update_dict['assigned_to'] = list(set((current.get('assigned_to') or []) + admin_ids))
+        merged = calculate_incident_metrics({**current, **update_dict})
+        for metric in ('mtta', 'mttr', 'mttc'):
+            if metric in merged:
+                update_dict[metric] = merged[metric]
+        update_dict['updated_at'] = now
+        ops.append(UpdateOne({"id": current['id']}, {"$set": update_dict}))
+        op_ids.append([current['id']])
+        changes[current['id']] = (current, update_dict)
+
+    result = await run_bulk_update("incidents", ops, op_ids, missing, rejected)
+    # Notes and events only for the incidents that were actually written
+    failed = {item.id for item in result.results if item.status == "failed"}
+    changes = {incident_id: change for incident_id, change in changes.items() if incident_id not in failed}
+    user_names = await get_user_names(sorted({
+        uid for current, update_dict in changes.values() for uid in incident_assignment_changes(current, update_dict)
+    })) if explicit_assignment else {}
+    for incident_id, (current, update_dict) in changes.items():
+        for note_text in incident_change_notes(current, update_dict, explicit_assignment, user_names):
+            notes.append(incident_note(incident_id, note_text, current_user, now))
+
+    if notes:
+        await db.incident_comments.insert_many(notes, ordered=False)
+    await publish_live_events([
+        *(incident_event("updated", {**current, **update_dict}) for current, update_dict in changes.values()),
+        *(comment_event("created", note) for note in notes),
+    ])
+    return result
+
+@api_router.delete("/incidents/bulk", response_model=BulkResult)
+async def bulk_delete_incidents(selection: BulkSelection, current_user: User = Depends(get_current_user)):
+    result, docs = await run_bulk_delete("incidents", selection, ["attachments.id", "created_by", "assigned_to"])
+    ids = [doc['id'] for doc in docs]
+    if ids:
+        await delete_incident_attachment_files(
+            [a['id'] for doc in docs for a in doc.get('attachments', []) if a.get('id')]
+        )
+        await delete_incident_comments(ids)
+    await publish_live_events([incident_event("deleted", doc) for doc in docs])
+    return result
+
+@api_router.patch("/assets/bulk", response_model=BulkResult)
+async def bulk_update_assets(request_data: BulkAssetUpdate, current_user: User = Depends(get_current_user)):
+    update_dict = _bulk_update_fields(request_data.update)
+    update_dict['updated_at'] = datetime.now(timezone.utc)
+    docs, missing = await load_bulk_targets("assets", request_data, [])
+    ids = [doc['id'] for doc in docs]
+    ops = [UpdateMany({"id": {"$in": ids}}, {"$set": update_dict})] if ids else []
+    return await run_bulk_update("assets", ops, [ids] if ids else [], missing)
+
+@api_router.delete("/assets/bulk", response_model=BulkResult)
+async def bulk_delete_assets(selection: BulkSelection, current_user: User = Depends(get_current_user)):
+    result, _ = await run_bulk_delete("assets", selection)
+    return result
+
+@api_router.patch("/threats/bulk", response_model=BulkResult)
+async def bulk_update_threats(request_data: BulkThreatUpdate, current_user: User = Depends(get_current_user)):
+    update_dict = _bulk_update_fields(request_data.update)
+    update_dict['updated_at'] = datetime.now(timezone.utc)
+    docs, missing = await load_bulk_targets("threats", request_data, [])
+    ids = [doc['id'] for doc in docs]
+    ops = [UpdateMany({"id": {"$in": ids}}, {"$set": update_dict})] if ids else []
+    return await run_bulk_update("threats", ops, [ids] if ids else [], missing)
+
+@api_router.delete("/threats/bulk", response_model=BulkResult)
+async def bulk_delete_threats(selection: BulkSelection, current_user: User = Depends(get_current_user)):
+    result, _ = await run_bulk_delete("threats", selection)
+    return result
+
+@api_router.patch("/vulnerabilities/bulk", response_model=BulkResult)
+async def bulk_update_vulnerabilities(request_data: BulkVulnerabilityUpdate,
+                                      current_user: User = Depends(get_current_user)):
+    update_dict = _bulk_update_fields(request_data.update)
+    update_dict['updated_at'] = datetime.now(timezone.utc)
+    if update_dict.get('cvss_vector'):
+        update_dict['cvss_score'], update_dict['severity'] = calculate_cvss_score(update_dict['cvss_vector'])
+    docs, missing = await load_bulk_targets("vulnerabilities", request_data, [])
+    ids = [doc['id'] for doc in docs]
+    ops = [UpdateMany({"id": {"$in": ids}}, {"$set": update_dict})] if ids else []
+    return await run_bulk_update("vulnerabilities", ops, [ids] if ids else [], missing)
+
+@api_router.delete("/vulnerabilities/bulk", response_model=BulkResult)
+async def bulk_delete_vulnerabilities(selection: BulkSelection, current_user: User = Depends(get_current_user)):
+    result, _ = await run_bulk_delete("vulnerabilities", selection)
+    return result
+
 # ==================== RISK ENDPOINTS ====================
 
 @api_router.post("/risks", response_model=Risk)
@@ -1031,100 +2248,81 @@ async def create_risk(risk_data: RiskCreate, current_user: User = Depends(get_cu
     
     risk = Risk(**data_dict)
     doc = risk.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.risks.insert_one(doc)
+    await notify_write("risks")
     return risk
 
 @api_router.get("/risks", response_model=PaginatedRisks)
 async def get_risks(
-    page: int = 1,
-    limit: int = 20,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=1000),
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    status: Optional[List[str]] = Query(None),
+    criticality: Optional[List[str]] = Query(None),
+    owner: Optional[str] = None,
+    related_asset_id: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    review_before: Optional[datetime] = None,
+    q: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    # Calculate skip
-    skip = (page - 1) * limit
-    
-    # Determine sort direction
-    sort_direction = -1 if sort_order == "desc" else 1
-    
-    # Get total count
-    total = await db.risks.count_documents({})
-    
+    # Validate sort field and direction
+    sort_by, sort_direction = resolve_sort("risks", sort_by, sort_order)
+
+    # The date window applies to registration_date
+    query = build_list_query("risks", {
+        "status": match_any(status),
+        "criticality": match_any(criticality),
+        "owner": owner or None,
+        "related_assets": related_asset_id or None,
+        "registration_date": match_range(date_from, date_to),
+        "review_date": match_range(high=review_before),
+    }, q)
+
     # Get paginated and sorted risks
-    risks = await db.risks.find({}, {"_id": 0}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
-    
-    for risk in risks:
-        if isinstance(risk.get('created_at'), str):
-            risk['created_at'] = datetime.fromisoformat(risk['created_at'])
-        if isinstance(risk.get('updated_at'), str):
-            risk['updated_at'] = datetime.fromisoformat(risk['updated_at'])
-    
-    # Calculate total pages
-    total_pages = (total + limit - 1) // limit
-    
-    return PaginatedRisks(
-        items=risks,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
-    )
+    etag, version = await list_etag(request, Risk, "risks")
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("risks", query, sort_by, sort_direction, page, limit, cursor, include_total, version)
+    
+    return trusted_page_response(Risk, result, etag)
 
 @api_router.get("/risks/{risk_id}", response_model=Risk)
-async def get_risk(risk_id: str, current_user: User = Depends(get_current_user)):
+async def get_risk(risk_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "risks", risk_id, Risk)
+    if not_modified:
+        return not_modified
     risk = await db.risks.find_one({"id": risk_id}, {"_id": 0})
     if not risk:
         raise HTTPException(status_code=404, detail="Risk not found")
-    if isinstance(risk.get('created_at'), str):
-        risk['created_at'] = datetime.fromisoformat(risk['created_at'])
-    if isinstance(risk.get('updated_at'), str):
-        risk['updated_at'] = datetime.fromisoformat(risk['updated_at'])
+    response.headers.update(revalidate_headers(document_etag(Risk, risk)))
     return Risk(**risk)
 
 @api_router.put("/risks/{risk_id}", response_model=Risk)
 async def update_risk(risk_id: str, risk_data: RiskUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update (the pipeline rescores the risk), plus notify_write()"""
     update_dict = {k: v for k, v in risk_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    # If probability or impact changed, recalculate risk_level and criticality
-    if 'probability' in update_dict or 'impact' in update_dict:
-        # Get current risk to get missing values
-        current_risk = await db.risks.find_one({"id": risk_id}, {"_id": 0})
-        if not current_risk:
-            raise HTTPException(status_code=404, detail="Risk not found")
-        
-        probability = update_dict.get('probability', current_risk.get('probability'))
-        impact = update_dict.get('impact', current_risk.get('impact'))
-        
-        # Calculate risk_level
-        risk_level = probability * impact
-        update_dict['risk_level'] = risk_level
-        
-        # Calculate criticality
-        if risk_level >= 15:
-            update_dict['criticality'] = 'Критический'
-        elif risk_level >= 10:
-            update_dict['criticality'] = 'Высокий'
-        elif risk_level >= 5:
-            update_dict['criticality'] = 'Средний'
-        else:
-            update_dict['criticality'] = 'Низкий'
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    # If probability or impact changed, risk_level and criticality follow from the stored values
+    pipeline = [literal_set(update_dict)]
+    if 'probability' in update_dict or 'impact' in update_dict:
+        pipeline += RISK_SCORE_STAGES
     
-    result = await db.risks.update_one({"id": risk_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    risk = await db.risks.find_one_and_update(
+        {"id": risk_id}, pipeline, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if risk is None:
         raise HTTPException(status_code=404, detail="Risk not found")
-    
-    risk = await db.risks.find_one({"id": risk_id}, {"_id": 0})
-    if isinstance(risk.get('created_at'), str):
-        risk['created_at'] = datetime.fromisoformat(risk['created_at'])
-    if isinstance(risk.get('updated_at'), str):
-        risk['updated_at'] = datetime.fromisoformat(risk['updated_at'])
+    await notify_write("risks")
     return Risk(**risk)
 
 @api_router.delete("/risks/{risk_id}")
@@ -1132,6 +2330,7 @@ async def delete_risk(risk_id: str, current_user: User = Depends(get_current_use
     result = await db.risks.delete_one({"id": risk_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Risk not found")
+    await notify_write("risks")
     return {"message": "Risk deleted"}
 
 # ==================== INCIDENT ENDPOINTS ====================
@@ -1147,6 +2346,7 @@ async def create_incident(incident_data: IncidentCreate, current_user: User = De
     data_dict['created_by'] = current_user.id
 
     incident = Incident(**data_dict)
+    incident.attachments = await externalize_incident_attachments(incident.id, incident.attachments)
     doc = incident.model_dump()
 
     # Calculate metrics
@@ -1157,124 +2357,233 @@ async def create_incident(incident_data: IncidentCreate, current_user: User = De
     incident.mttr = doc.get('mttr')
     incident.mttc = doc.get('mttc')
 
-    # Serialize datetimes
-    doc['incident_time'] = doc['incident_time'].isoformat()
-    doc['detection_time'] = doc['detection_time'].isoformat()
-    if doc.get('reaction_start_time'):
-        doc['reaction_start_time'] = doc['reaction_start_time'].isoformat()
-    if doc.get('closed_at'):
-        doc['closed_at'] = doc['closed_at'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-
     await db.incidents.insert_one(doc)
+    await notify_write("incidents")
+    await publish_live_events([incident_event("created", doc)])
     return incident
 
 @api_router.get("/incidents", response_model=PaginatedIncidents)
 async def get_incidents(
-    page: int = 1,
-    limit: int = 20,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=1000),
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    status: Optional[List[str]] = Query(None),
+    criticality: Optional[List[str]] = Query(None),
+    system: Optional[List[str]] = Query(None),
+    incident_type: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    q: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    # Calculate skip
-    skip = (page - 1) * limit
-
-    # Determine sort direction
-    sort_direction = -1 if sort_order == "desc" else 1
+    # Validate sort field and direction
+    sort_by, sort_direction = resolve_sort("incidents", sort_by, sort_order)
 
     # Build query filter based on role
     is_admin = current_user.role == "Администратор"
     if is_admin:
-        query = {}
+        scope = None
     else:
         # Non-admin: see incidents created by them OR assigned to them
-        query = {
+        scope = {
             "$or": [
                 {"created_by": current_user.id},
                 {"assigned_to": current_user.id}
             ]
         }
 
-    # Get total count
-    total = await db.incidents.count_documents(query)
+    # The date window applies to incident_time, as in the metrics summary
+    query = build_list_query("incidents", {
+        "status": match_any(status),
+        "criticality": match_any(criticality),
+        "system": match_any(system),
+        "incident_type": incident_type or None,
+        "incident_time": match_range(date_from, date_to),
+    }, q, scope)
 
     # Get paginated and sorted incidents
-    incidents = await db.incidents.find(query, {"_id": 0}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
-
-    for incident in incidents:
-        # Parse datetime fields
-        for field in ['incident_time', 'detection_time', 'reaction_start_time', 'closed_at', 'created_at', 'updated_at']:
-            if incident.get(field) and isinstance(incident[field], str):
-                incident[field] = datetime.fromisoformat(incident[field])
-
-    # Calculate total pages
-    total_pages = (total + limit - 1) // limit
-
-    return PaginatedIncidents(
-        items=incidents,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
-    )
+    etag, version = await list_etag(request, Incident, "incidents", current_user.id if scope else None)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("incidents", query, sort_by, sort_direction, page, limit, cursor, include_total, version)
+
+    return trusted_page_response(Incident, result, etag)
 
 @api_router.get("/incidents/metrics/summary", response_model=IncidentMetrics)
-async def get_incident_metrics(current_user: User = Depends(get_current_user)):
-    incidents = await db.incidents.find({}, {"_id": 0}).to_list(1000)
-    
-    total_incidents = len(incidents)
-    closed_incidents = 0
-    
-    mtta_values = []
-    mttr_values = []
-    mttc_values = []
-    
-    for incident in incidents:
-        if incident.get('mtta'):
-            # Конвертируем минуты в часы
-            mtta_values.append(incident['mtta'] / 60)
-        if incident.get('mttr'):
-            # Конвертируем минуты в часы
-            mttr_values.append(incident['mttr'] / 60)
-        if incident.get('mttc'):
-            # Конвертируем минуты в часы
-            mttc_values.append(incident['mttc'] / 60)
-            closed_incidents += 1
-    
+async def get_incident_metrics(
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    criticality: Optional[str] = None,
+    system: Optional[str] = None,
+    incident_type: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """MTTA/MTTR/MTTC summary computed in MongoDB; the window applies to incident_time"""
+    query = {}
+    if date_from or date_to:
+        query['incident_time'] = {}
+        if date_from:
+            query['incident_time']['$gte'] = date_from
+        if date_to:
+            query['incident_time']['$lte'] = date_to
+    if criticality:
+        query['criticality'] = criticality
+    if system:
+        query['system'] = system
+    if incident_type:
+        query['incident_type'] = incident_type
+
+    metric_names = ['mtta', 'mttr', 'mttc']
+    group = {"_id": None, "total": {"$sum": 1}}
+    for name in metric_names:
+        group[f"{name}_count"] = {"$sum": {"$cond": [{"$eq": [f"${name}", None]}, 0, 1]}}
+        group[f"{name}_mean"] = {"$avg": f"${name}"}
+        group[f"{name}_pct"] = {"$percentile": {"input": f"${name}", "p": [0.5, 0.9, 0.95], "method": "approximate"}}
+
+    pipeline = [
+        {"$match": query},
+        # Only the metric fields travel through the pipeline; zero/missing values are skipped
+        # and minutes are converted to hours
+        {"$project": {"_id": 0, **{
+            name: {"$cond": [{"$eq": [_nonzero(name), None]}, None, {"$divide": [f"${name}", 60]}]}
+            for name in metric_names
+        }}},
+        {"$group": group},
+    ]
+    rows = await db.incidents.aggregate(pipeline).to_list(1)
+    row = rows[0] if rows else {"total": 0}
+
+    def rounded(value):
+        return round(value, 2) if value is not None else None
+
+    distributions = {}
+    for name in metric_names:
+        pct = row.get(f"{name}_pct") or [None, None, None]
+        distributions[name] = MetricDistribution(
+            count=row.get(f"{name}_count", 0),
+            mean=rounded(row.get(f"{name}_mean")),
+            median=rounded(pct[0]),
+            p90=rounded(pct[1]),
+            p95=rounded(pct[2]),
+        )
+
     return IncidentMetrics(
-        avg_mtta=round(sum(mtta_values) / len(mtta_values), 2) if mtta_values else None,
-        avg_mttr=round(sum(mttr_values) / len(mttr_values), 2) if mttr_values else None,
-        avg_mttc=round(sum(mttc_values) / len(mttc_values), 2) if mttc_values else None,
-        total_incidents=total_incidents,
-        closed_incidents=closed_incidents
+        avg_mtta=distributions['mtta'].mean,
+        avg_mttr=distributions['mttr'].mean,
+        avg_mttc=distributions['mttc'].mean,
+        total_incidents=row.get("total", 0),
+        closed_incidents=distributions['mttc'].count,
+        **distributions
     )
 
 @api_router.get("/incidents/{incident_id}", response_model=Incident)
-async def get_incident(incident_id: str, current_user: User = Depends(get_current_user)):
+async def get_incident(incident_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "incidents", incident_id, Incident)
+    if not_modified:
+        return not_modified
     incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
-    
-    for field in ['incident_time', 'detection_time', 'reaction_start_time', 'closed_at', 'created_at', 'updated_at']:
-        if incident.get(field) and isinstance(incident[field], str):
-            incident[field] = datetime.fromisoformat(incident[field])
+    response.headers.update(revalidate_headers(document_etag(Incident, incident)))
     return Incident(**incident)
 
-@api_router.put("/incidents/{incident_id}", response_model=Incident)
-async def update_incident(incident_id: str, incident_data: IncidentUpdate, current_user: User = Depends(get_current_user)):
-    current_incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
-    if not current_incident:
-        raise HTTPException(status_code=404, detail="Incident not found")
+async def get_admin_user_ids() -> List[str]:
+    """Users with the legacy admin role name or a role document named Администратор"""
+    if admin_ids_cache["expires"] <= time.monotonic():
+        roles = await get_cached_roles()
+        admin_roles = ["Администратор", *(r['id'] for r in roles.values() if r.get('name') == "Администратор")]
+        admin_users = await db.users.find({"role": {"$in": admin_roles}}, {"_id": 0, "id": 1}).to_list(None)
+        admin_ids_cache.update(expires=time.monotonic() + ADMIN_IDS_CACHE_TTL,
+                               ids=frozenset(u['id'] for u in admin_users))
+    return list(admin_ids_cache["ids"])
+
+def incident_note(incident_id: str, text: str, author: User, created_at: datetime) -> dict:
+    """Auto-note recording a tracked change; listed with the comments as type note"""
+    return {
+        "id": str(uuid.uuid4()),
+        "incident_id": incident_id,
+        "text": text,
+        "image": None,
+        "image_sha256": None,
+        "type": "note",
+        "user_id": author.id,
+        "user_name": author.full_name,
+        "created_at": created_at,
+    }
 
-    # Permission check: admin can edit all; non-admin can only edit assigned incidents
-    is_admin = current_user.role == "Администратор"
-    if not is_admin:
-        assigned = current_incident.get('assigned_to', [])
-        created_by = current_incident.get('created_by')
-        if current_user.id not in assigned and current_user.id != created_by:
-            raise HTTPException(status_code=403, detail="You can only edit incidents assigned to you or created by you")
+async def get_user_names(user_ids: List[str]) -> Dict[str, str]:
+    if not user_ids:
+        return {}
+    rows = await db.users.find({"id": {"$in": list(user_ids)}}, {"_id": 0, "id": 1, "full_name": 1}).to_list(None)
+    return {u['id']: u['full_name'] for u in rows}
+
+def incident_assignment_changes(current_incident: dict, update_dict: dict) -> List[str]:
+    """User ids added to or removed from assigned_to by an update"""
+    old_assigned = set(current_incident.get('assigned_to') or [])
+    new_assigned = set(update_dict.get('assigned_to') or [])
+    return sorted(old_assigned ^ new_assigned)
+
+def incident_change_notes(current_incident: dict, update_dict: dict, explicit_assignment: bool,
+                          user_names: Dict[str, str]) -> List[str]:
+    """Texts of the auto-notes recorded for an incident update"""
+    notes_to_add = []
+
+    # 1. Status change note
+    old_status = current_incident.get('status')
+    new_status = update_dict.get('status')
+    if new_status and new_status != old_status:
+        notes_to_add.append(f"Статус изменён: {old_status} → {new_status}")
+
+    # 2. Reassignment note (only if assigned_to was explicitly in request)
+    if explicit_assignment:
+        old_assigned = set(current_incident.get('assigned_to') or [])
+        new_assigned = set(update_dict.get('assigned_to') or [])
+        # Exclude admin auto-add on status change to avoid noise
+        net_added = new_assigned - old_assigned
+        net_removed = old_assigned - new_assigned
+        parts = []
+        if net_added:
+            parts.append("добавлены: " + ", ".join(user_names.get(uid, uid) for uid in sorted(net_added)))
+        if net_removed:
+            parts.append("удалены: " + ", ".join(user_names.get(uid, uid) for uid in sorted(net_removed)))
+        if parts:
+            notes_to_add.append("Переназначение — " + "; ".join(parts))
+
+    # 3. General edit note (when other meaningful fields changed, no status/assignment note yet)
+    if not notes_to_add:
+        tracked = ['description', 'measures', 'violator', 'system', 'incident_type', 'criticality',
+                   'incident_time', 'detection_time', 'reaction_start_time', 'login', 'detection_source']
+        for field in tracked:
+            if field in update_dict:
+                old_val = str(current_incident.get(field) or '')
+                new_val = str(update_dict.get(field) or '')
+                if old_val != new_val:
+                    notes_to_add.append("Инцидент обновлён")
+                    break
+    return notes_to_add
+
+@api_router.put("/incidents/{incident_id}", response_model=Incident)
+async def update_incident(incident_id: str, incident_data: IncidentUpdate, current_user: User = Depends(get_current_user)):
+    """
+    Round trips: the current incident (permissions, metrics, notes), one find_one_and_update,
+    notify_write(), one insert_many for the auto-notes and the live event append; the admin set
+    on completion and assignee names only when needed.
+    """
+    current_incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    if not current_incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+
+    # Permission check: admin can edit all; non-admin can only edit assigned incidents
+    is_admin = current_user.role == "Администратор"
+    if not is_admin:
+        assigned = current_incident.get('assigned_to', [])
+        created_by = current_incident.get('created_by')
+        if current_user.id not in assigned and current_user.id != created_by:
+            raise HTTPException(status_code=403, detail="You can only edit incidents assigned to you or created by you")
 
     # Only admin can change assigned_to
     update_data = incident_data.model_dump()
@@ -1294,23 +2603,27 @@ async def update_incident(incident_id: str, incident_data: IncidentUpdate, curre
     # Когда статус меняется на "Проверен" — автоматически ставим дату закрытия
     if update_dict.get('status') == 'Проверен' and not update_dict.get('closed_at'):
         if not current_incident.get('closed_at'):
-            update_dict['closed_at'] = datetime.now(timezone.utc).isoformat()
+            update_dict['closed_at'] = datetime.now(timezone.utc)
 
     # When status changes to "Завершен", auto-assign to all admin users
     if update_dict.get('status') == 'Завершен':
-        admin_users = await db.users.find({"role": "Администратор"}, {"_id": 0, "id": 1}).to_list(100)
-        admin_ids = [u['id'] for u in admin_users]
-        # Also get admins via role collection
-        admin_roles = await db.roles.find({"name": "Администратор"}, {"_id": 0, "id": 1}).to_list(10)
-        for ar in admin_roles:
-            role_users = await db.users.find({"role": ar['id']}, {"_id": 0, "id": 1}).to_list(100)
-            admin_ids.extend([u['id'] for u in role_users])
-        admin_ids = list(set(admin_ids))
+        admin_ids = await get_admin_user_ids()
         if admin_ids:
             current_assigned = current_incident.get('assigned_to', [])
             merged_assigned = list(set(current_assigned + admin_ids))
             update_dict['assigned_to'] = merged_assigned
 
+    # New attachments arrive as data URLs from the edit form and are stored as files; kept ones come from the incident
+    removed_attachment_ids = []
+    if 'attachments' in update_dict:
+        update_dict['attachments'] = await externalize_incident_attachments(
+            incident_id, update_dict['attachments'], current_incident.get('attachments')
+        )
+        kept_ids = {a.get('id') for a in update_dict['attachments']}
+        removed_attachment_ids = [
+            a['id'] for a in current_incident.get('attachments', []) if a.get('id') and a['id'] not in kept_ids
+        ]
+
     # Merge with current data for metric calculation
     merged_data = {**current_incident, **update_dict}
     merged_data = calculate_incident_metrics(merged_data)
@@ -1323,99 +2636,69 @@ async def update_incident(incident_id: str, incident_data: IncidentUpdate, curre
     if 'mttc' in merged_data:
         update_dict['mttc'] = merged_data['mttc']
 
-    # Serialize datetimes
-    for key in ['incident_time', 'detection_time', 'reaction_start_time', 'closed_at']:
-        if key in update_dict and isinstance(update_dict[key], datetime):
-            update_dict[key] = update_dict[key].isoformat()
-
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = await db.incidents.update_one({"id": incident_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    incident = await db.incidents.find_one_and_update(
+        {"id": incident_id}, {"$set": update_dict}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
+    await delete_incident_attachment_files(removed_attachment_ids)
+    await notify_write("incidents")
 
     # === Auto-notes for tracked changes ===
-    notes_to_add = []
-    note_time = datetime.now(timezone.utc).isoformat()
-
-    # 1. Status change note
-    old_status = current_incident.get('status')
-    new_status = update_dict.get('status')
-    if new_status and new_status != old_status:
-        notes_to_add.append(f"Статус изменён: {old_status} → {new_status}")
-
-    # 2. Reassignment note (only if assigned_to was explicitly in request)
-    if update_data.get('assigned_to') is not None:
-        old_assigned = set(current_incident.get('assigned_to') or [])
-        new_assigned = set(update_dict.get('assigned_to') or [])
-        # Exclude admin auto-add on status change to avoid noise
-        net_added = new_assigned - old_assigned
-        net_removed = old_assigned - new_assigned
-        if net_added or net_removed:
-            all_ids = list(new_assigned | old_assigned)
-            users_rows = await db.users.find({"id": {"$in": all_ids}}, {"_id": 0, "id": 1, "full_name": 1}).to_list(200)
-            uid_name = {u['id']: u['full_name'] for u in users_rows}
-            parts = []
-            if net_added:
-                parts.append("добавлены: " + ", ".join(uid_name.get(uid, uid) for uid in sorted(net_added)))
-            if net_removed:
-                parts.append("удалены: " + ", ".join(uid_name.get(uid, uid) for uid in sorted(net_removed)))
-            if parts:
-                notes_to_add.append("Переназначение — " + "; ".join(parts))
-
-    # 3. General edit note (when other meaningful fields changed, no status/assignment note yet)
-    if not notes_to_add:
-        tracked = ['description', 'measures', 'violator', 'system', 'incident_type', 'criticality',
-                   'incident_time', 'detection_time', 'reaction_start_time', 'login', 'detection_source']
-        for field in tracked:
-            if field in update_dict:
-                old_val = str(current_incident.get(field) or '')
-                new_val = str(update_dict.get(field) or '')
-                if old_val != new_val:
-                    notes_to_add.append("Инцидент обновлён")
-                    break
+    note_time = datetime.now(timezone.utc)
+    explicit_assignment = update_data.get('assigned_to') is not None
+    user_names = await get_user_names(
+        incident_assignment_changes(current_incident, update_dict) if explicit_assignment else []
+    )
+    notes_to_add = incident_change_notes(current_incident, update_dict, explicit_assignment, user_names)
 
-    for note_text in notes_to_add:
-        note_doc = {
-            "id": str(uuid.uuid4()),
-            "incident_id": incident_id,
-            "text": note_text,
-            "image": None,
-            "type": "note",
-            "user_id": current_user.id,
-            "user_name": current_user.full_name,
-            "created_at": note_time,
-        }
-        await db.incident_comments.insert_one(note_doc)
+    notes = [incident_note(incident_id, note_text, current_user, note_time) for note_text in notes_to_add]
+    if notes:
+        await db.incident_comments.insert_many(notes, ordered=False)
+    await publish_live_events([incident_event("updated", incident), *(comment_event("created", note) for note in notes)])
 
-    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
-    for field in ['incident_time', 'detection_time', 'reaction_start_time', 'closed_at', 'created_at', 'updated_at']:
-        if incident.get(field) and isinstance(incident[field], str):
-            incident[field] = datetime.fromisoformat(incident[field])
     return Incident(**incident)
 
 @api_router.delete("/incidents/{incident_id}")
 async def delete_incident(incident_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.incidents.delete_one({"id": incident_id})
-    if result.deleted_count == 0:
+    incident = await db.incidents.find_one_and_delete(
+        {"id": incident_id}, {"_id": 0, "id": 1, "attachments.id": 1, "created_by": 1, "assigned_to": 1}
+    )
+    if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
+    await delete_incident_attachment_files([a['id'] for a in incident.get('attachments', []) if a.get('id')])
     # Also delete comments
-    await db.incident_comments.delete_many({"incident_id": incident_id})
+    await delete_incident_comments([incident_id])
+    await notify_write("incidents")
+    await publish_live_events([incident_event("deleted", incident)])
     return {"message": "Incident deleted"}
 
 # ==================== INCIDENT COMMENTS ====================
 
-@api_router.get("/incidents/{incident_id}/comments", response_model=List[IncidentComment])
-async def get_incident_comments(incident_id: str, current_user: User = Depends(get_current_user)):
-    comments = await db.incident_comments.find(
-        {"incident_id": incident_id}, {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
-    result = []
-    for c in comments:
-        if isinstance(c.get('created_at'), str):
-            c['created_at'] = datetime.fromisoformat(c['created_at'])
-        result.append(IncidentComment(**c))
-    return result
+@api_router.get("/incidents/{incident_id}/comments", response_model=PaginatedIncidentComments)
+async def get_incident_comments(
+    incident_id: str,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    One page of an incident's thread, oldest first (order=asc) or newest first (order=desc).
+    Pass next_cursor back as cursor for the following page; images are only URLs, fetched
+    separately from /comments/{id}/image.
+    """
+    page = await fetch_page(
+        "incident_comments", {"incident_id": incident_id}, "created_at", 1 if order == "asc" else -1,
+        1, limit, cursor, include_total=False
+    )
+    return FastJSONResponse({
+        "items": [trusted_row(IncidentComment, row) for row in page["items"]],
+        "limit": limit,
+        "next_cursor": page["next_cursor"],
+    })
 
 @api_router.post("/incidents/{incident_id}/comments", response_model=IncidentComment)
 async def add_incident_comment(incident_id: str, comment_data: IncidentCommentCreate, current_user: User = Depends(get_current_user)):
@@ -1427,15 +2710,31 @@ async def add_incident_comment(incident_id: str, comment_data: IncidentCommentCr
     comment = IncidentComment(
         incident_id=incident_id,
         text=comment_data.text,
-        image=comment_data.image,
         user_id=current_user.id,
         user_name=current_user.full_name
     )
+    if comment_data.image:
+        image = await store_comment_image(incident_id, comment.id, comment_data.image)
+        comment = comment.model_copy(update=image)
     doc = comment.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.incident_comments.insert_one(doc)
+    await publish_live_events([comment_event("created", doc)])
     return comment
 
+@api_router.get("/incidents/{incident_id}/comments/{comment_id}/image")
+async def get_incident_comment_image(incident_id: str, comment_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    # Incident evidence: the client fetches it with its bearer token, not through a plain img src
+    comment = await db.incident_comments.find_one(
+        {"id": comment_id, "incident_id": incident_id, "image_sha256": {"$ne": None}},
+        {"_id": 0, "image_sha256": 1, "created_at": 1}
+    )
+    if not comment:
+        raise HTTPException(status_code=404, detail="Image not found")
+    cache_headers = file_cache_headers(comment['image_sha256'], comment.get('created_at'), IMMUTABLE_PRIVATE_CACHE)
+    if is_not_modified(request, comment['image_sha256'], comment.get('created_at')):
+        return Response(status_code=304, headers=cache_headers)
+    return await stream_gridfs_file(comment_images_bucket, comment_id, request, headers=cache_headers)
+
 @api_router.delete("/incidents/{incident_id}/comments/{comment_id}")
 async def delete_incident_comment(incident_id: str, comment_id: str, current_user: User = Depends(get_current_user)):
     comment = await db.incident_comments.find_one({"id": comment_id, "incident_id": incident_id})
@@ -1446,34 +2745,65 @@ async def delete_incident_comment(incident_id: str, comment_id: str, current_use
     if not is_admin and comment.get('user_id') != current_user.id:
         raise HTTPException(status_code=403, detail="Permission denied")
     await db.incident_comments.delete_one({"id": comment_id})
+    if comment.get('image_sha256'):
+        await delete_comment_image_files([comment_id])
+    await publish_live_events([comment_event("deleted", comment)])
     return {"message": "Comment deleted"}
 
 # ==================== INCIDENT ATTACHMENTS ====================
 
 @api_router.post("/incidents/{incident_id}/attachments")
 async def add_incident_attachment(incident_id: str, attachment: IncidentAttachmentCreate, current_user: User = Depends(get_current_user)):
-    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0, "id": 1, "created_by": 1, "assigned_to": 1})
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
-    att = {
-        "id": str(uuid.uuid4()),
-        "data": attachment.data,
-        "filename": attachment.filename,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.incidents.update_one({"id": incident_id}, {"$push": {"attachments": att}})
-    return {"message": "Attachment added", "id": att["id"]}
+    content_type, data = decode_data_url(attachment.data)
+    att = await store_incident_attachment(incident_id, data, attachment.filename, content_type)
+    result = await db.incidents.update_one(
+        {"id": incident_id},
+        {"$push": {"attachments": att}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        # Incident was deleted while uploading
+        await delete_incident_attachment_files([att["id"]])
+        raise HTTPException(status_code=404, detail="Incident not found")
+    await notify_write("incidents")
+    await publish_live_events([incident_event("updated", incident)])
+    return {"message": "Attachment added", "id": att["id"], "url": att["url"]}
+
+@api_router.get("/incidents/{incident_id}/attachments/{attachment_id}")
+async def download_incident_attachment(incident_id: str, attachment_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    # Incident evidence: the client fetches it with its bearer token, not through a plain img src
+    incident = await db.incidents.find_one(
+        {"id": incident_id, "attachments.id": attachment_id}, {"_id": 0, "attachments.$": 1}
+    )
+    if not incident:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    att = incident['attachments'][0]
+    cache_headers = file_cache_headers(att.get('sha256'), att.get('created_at'), IMMUTABLE_PRIVATE_CACHE)
+    if is_not_modified(request, att.get('sha256'), att.get('created_at')):
+        return Response(status_code=304, headers=cache_headers)
+    filename = att.get('filename') or attachment_id
+    return await stream_gridfs_file(
+        incident_attachments_bucket, attachment_id, request,
+        content_type=att.get('content_type'),
+        headers={**cache_headers, "Content-Disposition": content_disposition("inline", filename)}
+    )
 
 @api_router.delete("/incidents/{incident_id}/attachments/{attachment_id}")
 async def delete_incident_attachment(incident_id: str, attachment_id: str, current_user: User = Depends(get_current_user)):
-    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0})
+    incident = await db.incidents.find_one_and_update(
+        {"id": incident_id, "attachments.id": attachment_id},
+        {"$pull": {"attachments": {"id": attachment_id}}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "id": 1, "created_by": 1, "assigned_to": 1}
+    )
     if not incident:
-        raise HTTPException(status_code=404, detail="Incident not found")
-    attachments = incident.get('attachments', [])
-    new_attachments = [a for a in attachments if a.get('id') != attachment_id]
-    if len(new_attachments) == len(attachments):
+        if not await db.incidents.find_one({"id": incident_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Incident not found")
         raise HTTPException(status_code=404, detail="Attachment not found")
-    await db.incidents.update_one({"id": incident_id}, {"$set": {"attachments": new_attachments}})
+    await delete_incident_attachment_files([attachment_id])
+    await notify_write("incidents")
+    await publish_live_events([incident_event("updated", incident)])
     return {"message": "Attachment deleted"}
 
 # ==================== ASSET ENDPOINTS ====================
@@ -1487,88 +2817,72 @@ async def create_asset(asset_data: AssetCreate, current_user: User = Depends(get
     
     asset = Asset(**data_dict)
     doc = asset.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-    if doc.get('review_date'):
-        doc['review_date'] = doc['review_date'].isoformat()
     await db.assets.insert_one(doc)
+    await notify_write("assets")
     return asset
 
 @api_router.get("/assets", response_model=PaginatedAssets)
 async def get_assets(
-    page: int = 1,
-    limit: int = 20,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=1000),
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    status: Optional[List[str]] = Query(None),
+    criticality: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    owner: Optional[str] = None,
+    review_before: Optional[datetime] = None,
+    q: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    # Calculate skip
-    skip = (page - 1) * limit
-    
-    # Determine sort direction
-    sort_direction = -1 if sort_order == "desc" else 1
-    
-    # Get total count
-    total = await db.assets.count_documents({})
-    
+    # Validate sort field and direction
+    sort_by, sort_direction = resolve_sort("assets", sort_by, sort_order)
+
+    query = build_list_query("assets", {
+        "status": match_any(status),
+        "criticality": match_any(criticality),
+        "category": match_any(category),
+        "owner": owner or None,
+        "review_date": match_range(high=review_before),
+    }, q)
+
     # Get paginated and sorted assets
-    assets = await db.assets.find({}, {"_id": 0}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
-    
-    for asset in assets:
-        if isinstance(asset.get('created_at'), str):
-            asset['created_at'] = datetime.fromisoformat(asset['created_at'])
-        if isinstance(asset.get('updated_at'), str):
-            asset['updated_at'] = datetime.fromisoformat(asset['updated_at'])
-        if isinstance(asset.get('review_date'), str):
-            asset['review_date'] = datetime.fromisoformat(asset['review_date'])
-    
-    # Calculate total pages
-    total_pages = (total + limit - 1) // limit
-    
-    return PaginatedAssets(
-        items=assets,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
-    )
+    etag, version = await list_etag(request, Asset, "assets")
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("assets", query, sort_by, sort_direction, page, limit, cursor, include_total, version)
+    
+    return trusted_page_response(Asset, result, etag)
 
 @api_router.get("/assets/{asset_id}", response_model=Asset)
-async def get_asset(asset_id: str, current_user: User = Depends(get_current_user)):
+async def get_asset(asset_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "assets", asset_id, Asset)
+    if not_modified:
+        return not_modified
     asset = await db.assets.find_one({"id": asset_id}, {"_id": 0})
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    if isinstance(asset.get('created_at'), str):
-        asset['created_at'] = datetime.fromisoformat(asset['created_at'])
-    if isinstance(asset.get('updated_at'), str):
-        asset['updated_at'] = datetime.fromisoformat(asset['updated_at'])
-    if isinstance(asset.get('review_date'), str):
-        asset['review_date'] = datetime.fromisoformat(asset['review_date'])
+    response.headers.update(revalidate_headers(document_etag(Asset, asset)))
     return Asset(**asset)
 
 @api_router.put("/assets/{asset_id}", response_model=Asset)
 async def update_asset(asset_id: str, asset_data: AssetUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update, plus notify_write()"""
     update_dict = {k: v for k, v in asset_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    # Serialize datetime
-    if 'review_date' in update_dict and isinstance(update_dict['review_date'], datetime):
-        update_dict['review_date'] = update_dict['review_date'].isoformat()
-    
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
-    result = await db.assets.update_one({"id": asset_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    asset = await db.assets.find_one_and_update(
+        {"id": asset_id}, {"$set": update_dict}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if asset is None:
         raise HTTPException(status_code=404, detail="Asset not found")
-    
-    asset = await db.assets.find_one({"id": asset_id}, {"_id": 0})
-    if isinstance(asset.get('created_at'), str):
-        asset['created_at'] = datetime.fromisoformat(asset['created_at'])
-    if isinstance(asset.get('updated_at'), str):
-        asset['updated_at'] = datetime.fromisoformat(asset['updated_at'])
-    if isinstance(asset.get('review_date'), str):
-        asset['review_date'] = datetime.fromisoformat(asset['review_date'])
+    await notify_write("assets")
     return Asset(**asset)
 
 @api_router.delete("/assets/{asset_id}")
@@ -1576,19 +2890,21 @@ async def delete_asset(asset_id: str, current_user: User = Depends(get_current_u
     result = await db.assets.delete_one({"id": asset_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Asset not found")
+    await notify_write("assets")
     return {"message": "Asset deleted"}
 
 @api_router.post("/assets/{asset_id}/review")
 async def review_asset(asset_id: str, current_user: User = Depends(get_current_user)):
     """Mark asset as reviewed"""
     update_dict = {
-        'review_date': datetime.now(timezone.utc).isoformat(),
-        'updated_at': datetime.now(timezone.utc).isoformat()
+        'review_date': datetime.now(timezone.utc),
+        'updated_at': datetime.now(timezone.utc)
     }
     
     result = await db.assets.update_one({"id": asset_id}, {"$set": update_dict})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Asset not found")
+    await notify_write("assets")
     
     return {"message": "Asset reviewed", "review_date": update_dict['review_date']}
 
@@ -1596,20 +2912,10 @@ async def review_asset(asset_id: str, current_user: User = Depends(get_current_u
 
 async def generate_threat_number():
     """Generate unique threat number like THR-2024-001"""
-    existing = await db.threats.find({}, {"threat_number": 1, "_id": 0}).to_list(1000)
-    if not existing:
-        return "THR-2024-001"
-    
-    numbers = []
-    for threat in existing:
-        if threat.get('threat_number') and threat['threat_number'].startswith('THR-'):
-            try:
-                num = int(threat['threat_number'].split('-')[-1])
-                numbers.append(num)
-            except:
-                pass
-    
-    next_num = max(numbers) + 1 if numbers else 1
+    next_num = await next_sequence(
+        "threat_number",
+        partial(_max_existing_number, "threats", "threat_number", _parse_dashed_number("THR"))
+    )
     year = datetime.now().year
     return f"THR-{year}-{next_num:03d}"
 
@@ -1621,66 +2927,64 @@ async def create_threat(threat: ThreatCreate, current_user: User = Depends(get_c
         threat_dict['threat_number'] = await generate_threat_number()
     
     threat_dict['id'] = str(uuid.uuid4())
-    threat_dict['created_at'] = datetime.now(timezone.utc).isoformat()
-    threat_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    threat_dict['created_at'] = datetime.now(timezone.utc)
+    threat_dict['updated_at'] = datetime.now(timezone.utc)
     
     await db.threats.insert_one(threat_dict)
+    await notify_write("threats")
     return threat_dict
 
 @api_router.get("/threats", response_model=PaginatedThreats)
 async def get_threats(
-    page: int = 1,
-    limit: int = 20,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=1000),
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    category: Optional[List[str]] = Query(None),
+    source: Optional[List[str]] = Query(None),
+    related_vulnerability_id: Optional[str] = None,
+    q: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    skip = (page - 1) * limit
-    sort_direction = -1 if sort_order == "desc" else 1
-    total = await db.threats.count_documents({})
-    
-    threats = await db.threats.find({}, {"_id": 0}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
-    
-    for threat in threats:
-        for field in ['created_at', 'updated_at']:
-            if threat.get(field) and isinstance(threat[field], str):
-                threat[field] = datetime.fromisoformat(threat[field])
-    
-    total_pages = (total + limit - 1) // limit
-    
-    return PaginatedThreats(
-        items=threats,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
-    )
+    sort_by, sort_direction = resolve_sort("threats", sort_by, sort_order)
+    query = build_list_query("threats", {
+        "category": match_any(category),
+        "source": match_any(source),
+        "related_vulnerability_id": related_vulnerability_id or None,
+    }, q)
+    etag, version = await list_etag(request, Threat, "threats")
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("threats", query, sort_by, sort_direction, page, limit, cursor, include_total, version)
+    
+    return trusted_page_response(Threat, result, etag)
 
 @api_router.get("/threats/{threat_id}", response_model=Threat)
-async def get_threat(threat_id: str, current_user: User = Depends(get_current_user)):
+async def get_threat(threat_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "threats", threat_id, Threat)
+    if not_modified:
+        return not_modified
     threat = await db.threats.find_one({"id": threat_id}, {"_id": 0})
     if not threat:
         raise HTTPException(status_code=404, detail="Threat not found")
-    
-    for field in ['created_at', 'updated_at']:
-        if threat.get(field) and isinstance(threat[field], str):
-            threat[field] = datetime.fromisoformat(threat[field])
-    
+    response.headers.update(revalidate_headers(document_etag(Threat, threat)))
     return threat
 
 @api_router.put("/threats/{threat_id}", response_model=Threat)
 async def update_threat(threat_id: str, threat: ThreatUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update, plus notify_write()"""
     update_dict = {k: v for k, v in threat.model_dump().items() if v is not None}
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
-    result = await db.threats.update_one({"id": threat_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    updated = await db.threats.find_one_and_update(
+        {"id": threat_id}, {"$set": update_dict}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
         raise HTTPException(status_code=404, detail="Threat not found")
-    
-    updated = await db.threats.find_one({"id": threat_id}, {"_id": 0})
-    for field in ['created_at', 'updated_at']:
-        if updated.get(field) and isinstance(updated[field], str):
-            updated[field] = datetime.fromisoformat(updated[field])
+    await notify_write("threats")
     
     return updated
 
@@ -1689,28 +2993,24 @@ async def delete_threat(threat_id: str, current_user: User = Depends(get_current
     result = await db.threats.delete_one({"id": threat_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Threat not found")
+    await notify_write("threats")
     return {"message": "Threat deleted"}
 
 # ==================== VULNERABILITIES ====================
 
+async def generate_vulnerability_numbers(count: int) -> List[str]:
+    """Reserve count consecutive vulnerability numbers like VUL-2024-001"""
+    first = await next_sequence(
+        "vulnerability_number",
+        partial(_max_existing_number, "vulnerabilities", "vulnerability_number", _parse_dashed_number("VUL")),
+        count
+    )
+    year = datetime.now().year
+    return [f"VUL-{year}-{n:03d}" for n in range(first, first + count)]
+
 async def generate_vulnerability_number():
     """Generate unique vulnerability number like VUL-2024-001"""
-    existing = await db.vulnerabilities.find({}, {"vulnerability_number": 1, "_id": 0}).to_list(1000)
-    if not existing:
-        return "VUL-2024-001"
-    
-    numbers = []
-    for vuln in existing:
-        if vuln.get('vulnerability_number') and vuln['vulnerability_number'].startswith('VUL-'):
-            try:
-                num = int(vuln['vulnerability_number'].split('-')[-1])
-                numbers.append(num)
-            except:
-                pass
-    
-    next_num = max(numbers) + 1 if numbers else 1
-    year = datetime.now().year
-    return f"VUL-{year}-{next_num:03d}"
+    return (await generate_vulnerability_numbers(1))[0]
 
 def calculate_cvss_score(vector: str) -> tuple:
     """Calculate CVSS v3.1 Base Score from vector string"""
@@ -1797,63 +3097,64 @@ async def create_vulnerability(vulnerability: VulnerabilityCreate, current_user:
         vuln_dict['severity'] = severity
     
     vuln_dict['id'] = str(uuid.uuid4())
-    vuln_dict['created_at'] = datetime.now(timezone.utc).isoformat()
-    vuln_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    # Convert datetime fields to ISO string
-    if vuln_dict.get('discovery_date'):
-        vuln_dict['discovery_date'] = vuln_dict['discovery_date'].isoformat()
-    if vuln_dict.get('closure_date'):
-        vuln_dict['closure_date'] = vuln_dict['closure_date'].isoformat()
+    vuln_dict['created_at'] = datetime.now(timezone.utc)
+    vuln_dict['updated_at'] = datetime.now(timezone.utc)
     
     await db.vulnerabilities.insert_one(vuln_dict)
+    await notify_write("vulnerabilities")
     return vuln_dict
 
 @api_router.get("/vulnerabilities", response_model=PaginatedVulnerabilities)
 async def get_vulnerabilities(
-    page: int = 1,
-    limit: int = 20,
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=1000),
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    status: Optional[List[str]] = Query(None),
+    severity: Optional[List[str]] = Query(None),
+    related_asset_id: Optional[str] = None,
+    cvss_min: Optional[float] = Query(None, ge=0, le=10),
+    cvss_max: Optional[float] = Query(None, ge=0, le=10),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    q: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    skip = (page - 1) * limit
-    sort_direction = -1 if sort_order == "desc" else 1
-    total = await db.vulnerabilities.count_documents({})
-    
-    vulnerabilities = await db.vulnerabilities.find({}, {"_id": 0}).sort(sort_by, sort_direction).skip(skip).limit(limit).to_list(limit)
-    
-    for vuln in vulnerabilities:
-        for field in ['created_at', 'updated_at', 'discovery_date', 'closure_date']:
-            if vuln.get(field) and isinstance(vuln[field], str):
-                vuln[field] = datetime.fromisoformat(vuln[field])
-    
-    total_pages = (total + limit - 1) // limit
-    
-    return PaginatedVulnerabilities(
-        items=vulnerabilities,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
-    )
+    sort_by, sort_direction = resolve_sort("vulnerabilities", sort_by, sort_order)
+    # The date window applies to discovery_date
+    query = build_list_query("vulnerabilities", {
+        "status": match_any(status),
+        "severity": match_any(severity),
+        "related_asset_id": related_asset_id or None,
+        "cvss_score": match_range(cvss_min, cvss_max),
+        "discovery_date": match_range(date_from, date_to),
+    }, q)
+    etag, version = await list_etag(request, Vulnerability, "vulnerabilities")
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("vulnerabilities", query, sort_by, sort_direction, page, limit, cursor, include_total, version)
+    
+    return trusted_page_response(Vulnerability, result, etag)
 
 @api_router.get("/vulnerabilities/{vulnerability_id}", response_model=Vulnerability)
-async def get_vulnerability(vulnerability_id: str, current_user: User = Depends(get_current_user)):
+async def get_vulnerability(vulnerability_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "vulnerabilities", vulnerability_id, Vulnerability)
+    if not_modified:
+        return not_modified
     vuln = await db.vulnerabilities.find_one({"id": vulnerability_id}, {"_id": 0})
     if not vuln:
         raise HTTPException(status_code=404, detail="Vulnerability not found")
-    
-    for field in ['created_at', 'updated_at', 'discovery_date', 'closure_date']:
-        if vuln.get(field) and isinstance(vuln[field], str):
-            vuln[field] = datetime.fromisoformat(vuln[field])
-    
+    response.headers.update(revalidate_headers(document_etag(Vulnerability, vuln)))
     return vuln
 
 @api_router.put("/vulnerabilities/{vulnerability_id}", response_model=Vulnerability)
 async def update_vulnerability(vulnerability_id: str, vulnerability: VulnerabilityUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update, plus notify_write()"""
     update_dict = {k: v for k, v in vulnerability.model_dump().items() if v is not None}
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
     # Recalculate CVSS score if vector changed
     if 'cvss_vector' in update_dict and update_dict['cvss_vector']:
@@ -1861,19 +3162,12 @@ async def update_vulnerability(vulnerability_id: str, vulnerability: Vulnerabili
         update_dict['cvss_score'] = score
         update_dict['severity'] = severity
     
-    # Convert datetime fields
-    for field in ['discovery_date', 'closure_date']:
-        if field in update_dict and update_dict[field]:
-            update_dict[field] = update_dict[field].isoformat()
-    
-    result = await db.vulnerabilities.update_one({"id": vulnerability_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    updated = await db.vulnerabilities.find_one_and_update(
+        {"id": vulnerability_id}, {"$set": update_dict}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
         raise HTTPException(status_code=404, detail="Vulnerability not found")
-    
-    updated = await db.vulnerabilities.find_one({"id": vulnerability_id}, {"_id": 0})
-    for field in ['created_at', 'updated_at', 'discovery_date', 'closure_date']:
-        if updated.get(field) and isinstance(updated[field], str):
-            updated[field] = datetime.fromisoformat(updated[field])
+    await notify_write("vulnerabilities")
     
     return updated
 
@@ -1882,8 +3176,156 @@ async def delete_vulnerability(vulnerability_id: str, current_user: User = Depen
     result = await db.vulnerabilities.delete_one({"id": vulnerability_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Vulnerability not found")
+    await notify_write("vulnerabilities")
     return {"message": "Vulnerability deleted"}
 
+# ==================== GRAPH ====================
+
+GRAPH_COLLECTIONS = ["risks", "assets", "threats", "vulnerabilities"]
+
+# Only the fields the relationship view shows or links by
+GRAPH_PROJECTIONS = {
+    "risks": ["risk_number", "scenario", "criticality", "risk_level", "status", "owner",
+              "related_assets", "related_threats", "related_vulnerabilities"],
+    "assets": ["asset_number", "name", "category", "criticality", "owner", "status", "location", "threats"],
+    "threats": ["threat_number", "category", "source", "description", "mitre_attack_id", "related_vulnerability_id"],
+    "vulnerabilities": ["vulnerability_number", "description", "vulnerability_type", "severity", "cvss_score",
+                        "status", "related_asset_id"],
+}
+
+GRAPH_NODE_TYPES = {"risks": "risk", "assets": "asset", "threats": "threat", "vulnerabilities": "vulnerability"}
+
+# Reference fields that become edges: (source collection, field, target type, edge kind, reversed)
+GRAPH_LINKS = [
+    ("risks", "related_assets", "asset", "risk_asset", False),
+    ("risks", "related_threats", "threat", "risk_threat", False),
+    ("risks", "related_vulnerabilities", "vulnerability", "risk_vulnerability", False),
+    ("assets", "threats", "threat", "threat_asset", True),
+    ("threats", "related_vulnerability_id", "vulnerability", "threat_vuln", True),
+    ("vulnerabilities", "related_asset_id", "asset", "vuln_asset", False),
+]
+
+GRAPH_LABEL_LENGTH = 120
+
+# Full graph of the latest seen versions; root/depth views are cut from it in memory
+graph_cache: Dict[str, Any] = {"versions": None, "graph": None}
+
+def _graph_projection(collection: str) -> dict:
+    return {"_id": 0, "id": 1, **{field: 1 for field in GRAPH_PROJECTIONS[collection]}}
+
+def _graph_label(node_type: str, doc: dict) -> str:
+    label = {
+        "risk": doc.get('scenario') or doc.get('risk_number'),
+        "asset": doc.get('name') or doc.get('asset_number'),
+        "threat": doc.get('description') or doc.get('threat_number'),
+        "vulnerability": doc.get('description') or doc.get('vulnerability_number'),
+    }[node_type] or ""
+    return label[:GRAPH_LABEL_LENGTH]
+
+async def build_graph() -> dict:
+    """Nodes and edges of the whole register, fetched with one projected aggregation"""
+    pipeline = [{"$project": _graph_projection("risks")}, {"$addFields": {"_collection": "risks"}}]
+    for collection in GRAPH_COLLECTIONS[1:]:
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": [
+            {"$project": _graph_projection(collection)}, {"$addFields": {"_collection": collection}}
+        ]}})
+    docs = await db.risks.aggregate(pipeline).to_list(None)
+
+    nodes = {}
+    by_collection = {collection: [] for collection in GRAPH_COLLECTIONS}
+    for doc in docs:
+        collection = doc.pop("_collection")
+        node_type = GRAPH_NODE_TYPES[collection]
+        by_collection[collection].append(doc)
+        data = {k: v for k, v in doc.items() if k not in ("related_assets", "related_threats",
+                                                          "related_vulnerabilities", "threats")}
+        nodes[f"{node_type}::{doc['id']}"] = {
+            "id": f"{node_type}::{doc['id']}", "type": node_type, "label": _graph_label(node_type, doc), "data": data
+        }
+
+    edges = []
+    for collection, field, target_type, kind, reverse in GRAPH_LINKS:
+        source_type = GRAPH_NODE_TYPES[collection]
+        for doc in by_collection[collection]:
+            refs = doc.get(field) or []
+            for ref in refs if isinstance(refs, list) else [refs]:
+                source, target = f"{source_type}::{doc['id']}", f"{target_type}::{ref}"
+                # References to deleted entities are dropped
+                if target not in nodes:
+                    continue
+                edges.append({"source": target if reverse else source, "target": source if reverse else target,
+                              "kind": kind})
+
+    # Owners are shared leaf nodes
+    for collection, owner_type in (("risks", "risk_owner"), ("assets", "asset_owner")):
+        node_type = GRAPH_NODE_TYPES[collection]
+        for doc in by_collection[collection]:
+            owner = doc.get('owner')
+            if not owner:
+                continue
+            owner_id = f"{owner_type}::{owner}"
+            nodes.setdefault(owner_id, {"id": owner_id, "type": owner_type, "label": owner, "data": {}})
+            edges.append({"source": f"{node_type}::{doc['id']}", "target": owner_id, "kind": owner_type})
+
+    return {"nodes": nodes, "edges": edges}
+
+def _graph_neighbourhood(graph: dict, root: str, depth: int) -> tuple:
+    """Node ids within depth hops of root; owner nodes are included but not walked through"""
+    adjacency: Dict[str, List[str]] = {}
+    for edge in graph["edges"]:
+        adjacency.setdefault(edge["source"], []).append(edge["target"])
+        adjacency.setdefault(edge["target"], []).append(edge["source"])
+    seen = {root}
+    frontier = [root]
+    for _ in range(depth):
+        next_frontier = []
+        for node_id in frontier:
+            if graph["nodes"][node_id]["type"].endswith("_owner") and node_id != root:
+                continue
+            for neighbour in adjacency.get(node_id, []):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+    return seen
+
+async def get_graph_cached() -> tuple:
+    versions = await get_collection_versions(GRAPH_COLLECTIONS)
+    if graph_cache["versions"] != versions:
+        graph_cache["graph"] = await build_graph()
+        graph_cache["versions"] = versions
+    return graph_cache["graph"], versions
+
+@api_router.get("/graph")
+async def get_graph(
+    root_type: Optional[str] = None,
+    root_id: Optional[str] = None,
+    depth: int = Query(2, ge=1, le=6),
+    include_isolated: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Relationship graph of risks, assets, threats and vulnerabilities as nodes and edges"""
+    graph, versions = await get_graph_cached()
+
+    if root_id:
+        if (root_type or "asset") not in GRAPH_NODE_TYPES.values():
+            raise HTTPException(status_code=400, detail=f"Unsupported root type: {root_type}")
+        root = f"{root_type or 'asset'}::{root_id}"
+        if root not in graph["nodes"]:
+            raise HTTPException(status_code=404, detail="Root entity not found")
+        keep = _graph_neighbourhood(graph, root, depth)
+        nodes = [graph["nodes"][node_id] for node_id in keep]
+        edges = [e for e in graph["edges"] if e["source"] in keep and e["target"] in keep]
+    else:
+        edges = graph["edges"]
+        if include_isolated:
+            nodes = list(graph["nodes"].values())
+        else:
+            connected = {e["source"] for e in edges} | {e["target"] for e in edges}
+            nodes = [node for node_id, node in graph["nodes"].items() if node_id in connected]
+
+    return {"nodes": nodes, "edges": edges, "versions": versions}
+
 # ==================== MITRE ATT&CK ====================
 
 @api_router.get("/mitre-attack")
@@ -1896,75 +3338,14 @@ async def get_mitre_attack_techniques(current_user: User = Depends(get_current_u
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
-    total_risks = await db.risks.count_documents({})
-    total_incidents = await db.incidents.count_documents({})
-    total_assets = await db.assets.count_documents({})
-    
-    critical_risks = await db.risks.count_documents({"criticality": "Критический"})
-    open_incidents = await db.incidents.count_documents({"status": "Открыт"})
-    critical_assets = await db.assets.count_documents({"criticality": "Высокая"})
-    
-    # Calculate average metrics
-    incidents = await db.incidents.find({}, {"_id": 0, "mtta": 1, "mttr": 1, "mttc": 1}).to_list(1000)
-    
-    mtta_values = [inc['mtta'] for inc in incidents if inc.get('mtta')]
-    mttr_values = [inc['mttr'] for inc in incidents if inc.get('mttr')]
-    mttc_values = [inc['mttc'] for inc in incidents if inc.get('mttc')]
-    
-    # Convert from minutes to hours
-    avg_mtta = round(sum(mtta_values) / len(mtta_values) / 60, 2) if mtta_values else None
-    avg_mttr = round(sum(mttr_values) / len(mttr_values) / 60, 2) if mttr_values else None
-    avg_mttc = round(sum(mttc_values) / len(mttc_values) / 60, 2) if mttc_values else None
-    
-    return DashboardStats(
-        total_risks=total_risks,
-        total_incidents=total_incidents,
-        total_assets=total_assets,
-        critical_risks=critical_risks,
-        open_incidents=open_incidents,
-        critical_assets=critical_assets,
-        avg_mtta=avg_mtta,
-        avg_mttr=avg_mttr,
-        avg_mttc=avg_mttc
-    )
+    dashboard = await get_materialized_dashboard()
+    return DashboardStats(**dashboard['stats'])
 
 @api_router.get("/dashboard/risk-analytics")
 async def get_risk_analytics(current_user: User = Depends(get_current_user)):
     """Get detailed risk analytics for dashboard charts"""
-    
-    # Risk distribution by criticality
-    risks_by_criticality = {}
-    for criticality in ["Низкий", "Средний", "Высокий", "Критический"]:
-        count = await db.risks.count_documents({"criticality": criticality})
-        risks_by_criticality[criticality] = count
-    
-    # Risk distribution by status
-    risks_by_status = {}
-    for status in ["Открыт", "В обработке", "Принят", "Закрыт"]:
-        count = await db.risks.count_documents({"status": status})
-        risks_by_status[status] = count
-    
-    # Top 10 most critical risks
-    top_risks = await db.risks.find(
-        {},
-        {"_id": 0, "id": 1, "risk_number": 1, "scenario": 1, "risk_level": 1, "criticality": 1, "owner": 1}
-    ).sort("risk_level", -1).limit(10).to_list(10)
-    
-    # Risk distribution by owner
-    pipeline = [
-        {"$group": {"_id": "$owner", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    risks_by_owner = await db.risks.aggregate(pipeline).to_list(10)
-    owner_distribution = {item["_id"]: item["count"] for item in risks_by_owner if item["_id"]}
-    
-    return {
-        "risks_by_criticality": risks_by_criticality,
-        "risks_by_status": risks_by_status,
-        "top_risks": top_risks,
-        "risks_by_owner": owner_distribution
-    }
+    dashboard = await get_materialized_dashboard()
+    return dashboard['risk_analytics']
 
 # ==================== WIKI ENDPOINTS ====================
 
@@ -1977,19 +3358,12 @@ async def create_wiki_page(page_data: WikiPageCreate, current_user: User = Depen
     
     page = WikiPage(**page_dict, created_by=current_user.id)
     doc = page.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.wiki_pages.insert_one(doc)
     return page
 
 @api_router.get("/wiki", response_model=List[WikiPage])
 async def get_wiki_pages(current_user: User = Depends(get_current_user)):
     pages = await db.wiki_pages.find({}, {"_id": 0}).sort("order", 1).to_list(1000)
-    for page in pages:
-        if isinstance(page.get('created_at'), str):
-            page['created_at'] = datetime.fromisoformat(page['created_at'])
-        if isinstance(page.get('updated_at'), str):
-            page['updated_at'] = datetime.fromisoformat(page['updated_at'])
     return pages
 
 @api_router.post("/wiki/upload-image")
@@ -2006,73 +3380,62 @@ async def upload_wiki_image(
     if len(file_content) > 5 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="Image size must be less than 5MB")
 
-    # Convert to base64
-    image_base64 = base64.b64encode(file_content).decode('utf-8')
-    image_data_url = f"data:{file.content_type};base64,{image_base64}"
-
-    # Save to database
+    # Save raw bytes to GridFS, metadata to wiki_images
     image_id = str(uuid.uuid4())
-    image_doc = {
-        "id": image_id,
-        "filename": file.filename,
-        "content_type": file.content_type,
-        "data": image_data_url,
-        "size": len(file_content),
-        "uploaded_by": current_user.id,
-        "uploaded_at": datetime.now(timezone.utc).isoformat()
-    }
-
+    image_doc = await store_wiki_image(image_id, file_content, file.filename, file.content_type, current_user.id)
     await db.wiki_images.insert_one(image_doc)
 
     # Return URL that can be used in the editor
     return {"url": f"/api/wiki/image/{image_id}", "id": image_id}
 
 @api_router.get("/wiki/image/{image_id}")
-async def get_wiki_image(image_id: str, credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+async def get_wiki_image(image_id: str, request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
     # Allow access to images even without auth (for img tags)
     image = await db.wiki_images.find_one({"id": image_id}, {"_id": 0})
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    # Return the image data URL
-    data_url = image.get('data', '')
-    if data_url.startswith('data:'):
-        # Extract base64 data
-        header, base64_data = data_url.split(',', 1)
-        image_bytes = base64.b64decode(base64_data)
-        content_type = image.get('content_type', 'image/png')
-        return Response(content=image_bytes, media_type=content_type)
-    else:
-        raise HTTPException(status_code=404, detail="Image data not found")
+    content_type = image.get('content_type', 'image/png')
+    data_url = image.get('data')
+    if data_url:
+        # Not migrated yet: serve the legacy data URL, still with validators
+        _, image_bytes = decode_data_url(data_url)
+        etag = hashlib.sha256(image_bytes).hexdigest()
+        cache_headers = file_cache_headers(etag, image.get('uploaded_at'), IMMUTABLE_PUBLIC_CACHE)
+        if is_not_modified(request, etag, image.get('uploaded_at')):
+            return Response(status_code=304, headers=cache_headers)
+        return Response(content=image_bytes, media_type=content_type, headers=cache_headers)
+
+    cache_headers = file_cache_headers(image.get('sha256'), image.get('uploaded_at'), IMMUTABLE_PUBLIC_CACHE)
+    if is_not_modified(request, image.get('sha256'), image.get('uploaded_at')):
+        return Response(status_code=304, headers=cache_headers)
+    return await stream_gridfs_file(wiki_images_bucket, image_id, request, content_type=content_type, headers=cache_headers)
 
 @api_router.get("/wiki/{page_id}", response_model=WikiPage)
-async def get_wiki_page(page_id: str, current_user: User = Depends(get_current_user)):
+async def get_wiki_page(page_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "wiki_pages", page_id, WikiPage)
+    if not_modified:
+        return not_modified
     page = await db.wiki_pages.find_one({"id": page_id}, {"_id": 0})
     if not page:
         raise HTTPException(status_code=404, detail="Wiki page not found")
-    if isinstance(page.get('created_at'), str):
-        page['created_at'] = datetime.fromisoformat(page['created_at'])
-    if isinstance(page.get('updated_at'), str):
-        page['updated_at'] = datetime.fromisoformat(page['updated_at'])
+    response.headers.update(revalidate_headers(document_etag(WikiPage, page)))
     return WikiPage(**page)
 
 @api_router.put("/wiki/{page_id}", response_model=WikiPage)
 async def update_wiki_page(page_id: str, page_data: WikiPageUpdate, current_user: User = Depends(get_current_user)):
+    """Round trips: one find_one_and_update"""
     update_dict = {k: v for k, v in page_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = await db.wiki_pages.update_one({"id": page_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    page = await db.wiki_pages.find_one_and_update(
+        {"id": page_id}, {"$set": update_dict}, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if page is None:
         raise HTTPException(status_code=404, detail="Wiki page not found")
-
-    page = await db.wiki_pages.find_one({"id": page_id}, {"_id": 0})
-    if isinstance(page.get('created_at'), str):
-        page['created_at'] = datetime.fromisoformat(page['created_at'])
-    if isinstance(page.get('updated_at'), str):
-        page['updated_at'] = datetime.fromisoformat(page['updated_at'])
     return WikiPage(**page)
 
 @api_router.post("/wiki/{page_id}/move")
@@ -2082,7 +3445,7 @@ async def move_wiki_page(page_id: str, move_data: WikiPageMove, current_user: Us
         {"$set": {
             "parent_id": move_data.parent_id,
             "order": move_data.order,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     if result.matched_count == 0:
@@ -2103,12 +3466,86 @@ async def delete_wiki_page(page_id: str, current_user: User = Depends(get_curren
 
 # ==================== REGISTRY ENDPOINTS ====================
 
+REGISTRY_SORT_FIELDS = ["created_at", "updated_at"]
+REGISTRY_FILTER_OPS = {"ne": "$ne", "gt": "$gt", "gte": "$gte", "lt": "$lt", "lte": "$lte"}
+REGISTRY_TEXT_TYPES = ("text", "select", "multiselect")
+
+def registry_columns_by_id(registry: dict) -> Dict[str, dict]:
+    return {col['id']: col for col in registry.get('columns') or [] if isinstance(col, dict)}
+
+def _coerce_cell(column_type: Optional[str], value):
+    """Stored form of a cell for its column type, so sorting and range filters compare like values"""
+    if value is None or value == '':
+        return False if column_type == 'checkbox' else None
+    if column_type == 'number':
+        if isinstance(value, bool):
+            raise ValueError(value)
+        number = float(str(value).replace(',', '.').replace(' ', '')) if isinstance(value, str) else float(value)
+        return int(number) if number.is_integer() else number
+    if column_type == 'id':
+        return int(value)
+    if column_type == 'date':
+        # ISO dates (YYYY-MM-DD) order correctly as strings
+        return datetime.fromisoformat(str(value)[:10]).date().isoformat()
+    if column_type == 'checkbox':
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes', 'да')
+        return bool(value)
+    if column_type == 'multiselect':
+        return [str(v) for v in value] if isinstance(value, list) else [str(value)]
+    return value if isinstance(value, str) else str(value)
+
+def coerce_registry_value(column: dict, value):
+    try:
+        return _coerce_cell(column.get('column_type'), value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid value for column '{column.get('name')}': {value}")
+
+def coerce_registry_data(columns: Dict[str, dict], data: dict, stored: Optional[dict] = None) -> dict:
+    """
+    Typed form of submitted cells. On updates, stored is the record's current data: a cell sent
+    back unchanged that does not fit its column type keeps its legacy value instead of failing,
+    so records written before the types were enforced stay editable. Keys of removed columns
+    are kept as they are.
+    """
+    stored = stored or {}
+    result = {}
+    for key, value in data.items():
+        if key not in columns:
+            result[key] = value
+        elif key in stored and stored[key] == value:
+            try:
+                result[key] = _coerce_cell(columns[key].get('column_type'), value)
+            except (ValueError, TypeError):
+                result[key] = value
+        else:
+            result[key] = coerce_registry_value(columns[key], value)
+    return result
+
+def registry_filter(columns: Dict[str, dict], spec: str) -> dict:
+    """Parse a column_id:op:value filter into a typed condition on data.<column_id>"""
+    try:
+        column_id, op, raw = spec.split(':', 2)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Filter must be column:op:value, got {spec}")
+    column = columns.get(column_id)
+    if not column:
+        raise HTTPException(status_code=400, detail=f"Unknown column: {column_id}")
+    field = f"data.{column_id}"
+    if op == "contains":
+        return {field: {"$regex": re.escape(raw), "$options": "i"}}
+    if op == "in":
+        return {field: {"$in": [coerce_registry_value(column, v) for v in raw.split(',')]}}
+    if op == "eq":
+        return {field: coerce_registry_value(column, raw)}
+    if op in REGISTRY_FILTER_OPS:
+        return {field: {REGISTRY_FILTER_OPS[op]: coerce_registry_value(column, raw)}}
+    raise HTTPException(status_code=400, detail=f"Unsupported filter operator: {op}")
+
 @api_router.post("/registries", response_model=Registry)
 async def create_registry(registry_data: RegistryCreate, current_user: User = Depends(get_current_user)):
     registry = Registry(**registry_data.model_dump(), created_by=current_user.id)
     doc = registry.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     # Convert columns to dicts
     doc['columns'] = [col.model_dump() if hasattr(col, 'model_dump') else col for col in doc['columns']]
     await db.registries.insert_one(doc)
@@ -2118,24 +3555,20 @@ async def create_registry(registry_data: RegistryCreate, current_user: User = De
 async def get_registries(current_user: User = Depends(get_current_user)):
     registries = await db.registries.find({}, {"_id": 0}).to_list(1000)
     for reg in registries:
-        if isinstance(reg.get('created_at'), str):
-            reg['created_at'] = datetime.fromisoformat(reg['created_at'])
-        if isinstance(reg.get('updated_at'), str):
-            reg['updated_at'] = datetime.fromisoformat(reg['updated_at'])
         # Convert columns dicts back to RegistryColumn models
         if reg.get('columns'):
             reg['columns'] = [RegistryColumn(**col) if isinstance(col, dict) else col for col in reg['columns']]
     return registries
 
 @api_router.get("/registries/{registry_id}", response_model=Registry)
-async def get_registry(registry_id: str, current_user: User = Depends(get_current_user)):
+async def get_registry(registry_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    not_modified = await document_not_modified(request, "registries", registry_id, Registry)
+    if not_modified:
+        return not_modified
     registry = await db.registries.find_one({"id": registry_id}, {"_id": 0})
     if not registry:
         raise HTTPException(status_code=404, detail="Registry not found")
-    if isinstance(registry.get('created_at'), str):
-        registry['created_at'] = datetime.fromisoformat(registry['created_at'])
-    if isinstance(registry.get('updated_at'), str):
-        registry['updated_at'] = datetime.fromisoformat(registry['updated_at'])
+    response.headers.update(revalidate_headers(document_etag(Registry, registry)))
     # Convert columns dicts back to RegistryColumn models
     if registry.get('columns'):
         registry['columns'] = [RegistryColumn(**col) if isinstance(col, dict) else col for col in registry['columns']]
@@ -2143,6 +3576,10 @@ async def get_registry(registry_id: str, current_user: User = Depends(get_curren
 
 @api_router.put("/registries/{registry_id}", response_model=Registry)
 async def update_registry(registry_id: str, registry_data: RegistryUpdate, current_user: User = Depends(get_current_user)):
+    """
+    Round trips: one find_one_and_update returning the previous document, which gives both the
+    old columns and, with the $set applied locally, the response; plus index drops for changed columns.
+    """
     update_dict = {k: v for k, v in registry_data.model_dump().items() if v is not None}
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
@@ -2151,17 +3588,22 @@ async def update_registry(registry_id: str, registry_data: RegistryUpdate, curre
     if 'columns' in update_dict:
         update_dict['columns'] = [col.model_dump() if hasattr(col, 'model_dump') else col for col in update_dict['columns']]
     
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
-    result = await db.registries.update_one({"id": registry_id}, {"$set": update_dict})
-    if result.matched_count == 0:
+    previous = await db.registries.find_one_and_update(
+        {"id": registry_id}, {"$set": update_dict}, projection={"_id": 0}
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Registry not found")
-    
-    registry = await db.registries.find_one({"id": registry_id}, {"_id": 0})
-    if isinstance(registry.get('created_at'), str):
-        registry['created_at'] = datetime.fromisoformat(registry['created_at'])
-    if isinstance(registry.get('updated_at'), str):
-        registry['updated_at'] = datetime.fromisoformat(registry['updated_at'])
+    if 'columns' in update_dict:
+        # Removed or retyped columns no longer need their index
+        new_columns = {col['id']: col.get('column_type') for col in update_dict['columns']}
+        stale = [col_id for col_id, col in registry_columns_by_id(previous).items()
+                 if new_columns.get(col_id) != col.get('column_type')]
+        if stale:
+            await drop_registry_column_indexes(registry_id, stale)
+    
+    registry = {**previous, **update_dict}
     # Convert columns dicts back to RegistryColumn models
     if registry.get('columns'):
         registry['columns'] = [RegistryColumn(**col) if isinstance(col, dict) else col for col in registry['columns']]
@@ -2171,6 +3613,9 @@ async def update_registry(registry_id: str, registry_data: RegistryUpdate, curre
 async def delete_registry(registry_id: str, current_user: User = Depends(get_current_user)):
     # Delete all records in this registry
     await db.registry_records.delete_many({"registry_id": registry_id})
+    await db.counters.delete_many({"_id": {"$regex": f"^{re.escape(registry_counter_name(registry_id, ''))}"}})
+    await drop_registry_column_indexes(registry_id)
+    await notify_write("registry_records")
     
     result = await db.registries.delete_one({"id": registry_id})
     if result.deleted_count == 0:
@@ -2191,51 +3636,103 @@ async def create_registry_record(registry_id: str, record_data: RegistryRecordCr
             if isinstance(col, dict) and col.get('column_type') == 'id':
                 col_id = col.get('id')
                 # Generate next number for this ID column
-                existing_records = await db.registry_records.find({"registry_id": registry_id}).to_list(None)
-                max_num = 0
-                for rec in existing_records:
-                    if rec.get('data', {}).get(col_id):
-                        try:
-                            num = int(rec['data'][col_id])
-                            max_num = max(max_num, num)
-                        except (ValueError, TypeError):
-                            pass
-                record_data.data[col_id] = str(max_num + 1)
+                next_num = await next_sequence(
+                    registry_counter_name(registry_id, col_id),
+                    partial(_max_registry_id_value, registry_id, col_id)
+                )
+                record_data.data[col_id] = next_num
     
+    record_data.data = coerce_registry_data(registry_columns_by_id(registry), record_data.data)
     record = RegistryRecord(**record_data.model_dump(), registry_id=registry_id, created_by=current_user.id)
     doc = record.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
     await db.registry_records.insert_one(doc)
+    await notify_write("registry_records")
     return record
 
-@api_router.get("/registries/{registry_id}/records", response_model=List[RegistryRecord])
-async def get_registry_records(registry_id: str, current_user: User = Depends(get_current_user)):
-    records = await db.registry_records.find({"registry_id": registry_id}, {"_id": 0}).to_list(10000)
-    for rec in records:
-        if isinstance(rec.get('created_at'), str):
-            rec['created_at'] = datetime.fromisoformat(rec['created_at'])
-        if isinstance(rec.get('updated_at'), str):
-            rec['updated_at'] = datetime.fromisoformat(rec['updated_at'])
-    return records
+@api_router.get("/registries/{registry_id}/records", response_model=PaginatedRegistryRecords)
+async def get_registry_records(
+    request: Request,
+    registry_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=1000),
+    sort_by: Optional[str] = "created_at",
+    sort_order: Optional[str] = "asc",
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    filters: Optional[List[str]] = Query(None, alias="filter"),
+    q: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Records of a registry. sort_by is created_at, updated_at or a column id; each filter is
+    column_id:op:value with op one of eq, ne, gt, gte, lt, lte, in, contains, and the value
+    is converted to the column type before comparing.
+    """
+    registry = await db.registries.find_one({"id": registry_id}, {"_id": 0, "columns": 1, "updated_at": 1})
+    if not registry:
+        raise HTTPException(status_code=404, detail="Registry not found")
+    columns = registry_columns_by_id(registry)
+
+    sort_by = sort_by or "created_at"
+    if sort_by in REGISTRY_SORT_FIELDS:
+        sort_field = sort_by
+    elif sort_by in columns:
+        sort_field = f"data.{sort_by}"
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort field: {sort_by}")
+
+    clauses = [{"registry_id": registry_id}]
+    clauses += [registry_filter(columns, spec) for spec in filters or []]
+    if q and q.strip():
+        pattern = {"$regex": re.escape(q.strip()), "$options": "i"}
+        text_columns = [col_id for col_id, col in columns.items() if col.get('column_type') in REGISTRY_TEXT_TYPES]
+        clauses.append({"$or": [{f"data.{col_id}": pattern} for col_id in text_columns]} if text_columns
+                       else {"id": None})
+    query = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    # Columns that keep being sorted or filtered on get their own partial index
+    used_columns = {spec.split(':', 1)[0] for spec in filters or []}
+    if sort_by in columns:
+        used_columns.add(sort_by)
+    for column_id in used_columns:
+        spawn_background(track_registry_column_use(registry_id, column_id))
+
+    # Column edits change how filters and values are read, so the registry's own stamp is part of it
+    etag, version = await list_etag(request, RegistryRecord, "registry_records", registry.get("updated_at"))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    result = await fetch_page("registry_records", query, sort_field, -1 if sort_order == "desc" else 1,
+                              page, limit, cursor, include_total, version)
+    return trusted_page_response(RegistryRecord, result, etag)
 
 @api_router.put("/registries/{registry_id}/records/{record_id}", response_model=RegistryRecord)
 async def update_registry_record(registry_id: str, record_id: str, record_data: RegistryRecordUpdate, current_user: User = Depends(get_current_user)):
-    update_dict = record_data.model_dump()
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    """
+    Round trips: the registry's columns and the record's current data (to type the values),
+    one find_one_and_update, plus notify_write(). Only the submitted cells are written, so
+    cells the request does not carry keep their stored values.
+    """
+    registry, current = await asyncio.gather(
+        db.registries.find_one({"id": registry_id}, {"_id": 0, "columns": 1}),
+        db.registry_records.find_one({"id": record_id, "registry_id": registry_id}, {"_id": 0, "data": 1}),
+    )
+    if not registry:
+        raise HTTPException(status_code=404, detail="Registry not found")
+    if not current:
+        raise HTTPException(status_code=404, detail="Record not found")
+    data = coerce_registry_data(registry_columns_by_id(registry), record_data.data, current.get('data'))
+    update_dict = {f"data.{key}": value for key, value in data.items()}
+    update_dict['updated_at'] = datetime.now(timezone.utc)
     
-    result = await db.registry_records.update_one(
+    record = await db.registry_records.find_one_and_update(
         {"id": record_id, "registry_id": registry_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if record is None:
         raise HTTPException(status_code=404, detail="Record not found")
-    
-    record = await db.registry_records.find_one({"id": record_id}, {"_id": 0})
-    if isinstance(record.get('created_at'), str):
-        record['created_at'] = datetime.fromisoformat(record['created_at'])
-    if isinstance(record.get('updated_at'), str):
-        record['updated_at'] = datetime.fromisoformat(record['updated_at'])
+    await notify_write("registry_records")
     return RegistryRecord(**record)
 
 @api_router.delete("/registries/{registry_id}/records/{record_id}")
@@ -2243,47 +3740,1353 @@ async def delete_registry_record(registry_id: str, record_id: str, current_user:
     result = await db.registry_records.delete_one({"id": record_id, "registry_id": registry_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Record not found")
+    await notify_write("registry_records")
     return {"message": "Record deleted"}
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+XLSX_MAX_ROWS = 1048576
+
+def _export_columns(registry: dict) -> List[tuple]:
+    return [
+        (col['id'], col['name']) if isinstance(col, dict) else (col.id, col.name)
+        for col in registry.get('columns') or []
+    ]
+
+def _export_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return IMPORT_LIST_SEPARATOR.join(map(str, value))
+    if isinstance(value, dict):
+        return json_util.dumps(value, ensure_ascii=False)
+    return value
+
+async def iter_registry_row_batches(registry_id: str, column_ids: List[str]):
+    """Yield lists of export rows, reading the records cursor batch by batch"""
+    cursor = db.registry_records.find(
+        {"registry_id": registry_id}, {"_id": 0, "data": 1}
+    ).sort("created_at", ASCENDING).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for rec in cursor:
+        data = rec.get('data') or {}
+        batch.append([_export_value(data.get(col_id)) for col_id in column_ids])
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def stream_registry_csv(registry_id: str, columns: List[tuple]):
+    # BOM so Excel opens UTF-8 (Cyrillic) CSV correctly
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow([name for _, name in columns])
+    async for batch in iter_registry_row_batches(registry_id, [col_id for col_id, _ in columns]):
+        writer.writerows(batch)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _write_xlsx_rows(worksheet, first_row: int, rows: List[list]):
+    for offset, row in enumerate(rows):
+        worksheet.write_row(first_row + offset, 0, row)
+
+async def build_registry_xlsx(registry_id: str, sheet_name: str, columns: List[tuple]) -> str:
+    """
+    Write the registry to a temporary .xlsx file and return its path. constant_memory mode flushes
+    every row to disk, so memory does not grow with the registry; xlsxwriter calls run in a thread.
+    """
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        # Sheet names are limited to 31 chars and cannot contain []:*?/\
+        worksheet = workbook.add_worksheet(re.sub(r'[\[\]:*?/\\]', '_', sheet_name)[:31] or 'Registry')
+        header_format = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, [name for _, name in columns], header_format)
+        next_row = 1
+        async for batch in iter_registry_row_batches(registry_id, [col_id for col_id, _ in columns]):
+            await asyncio.to_thread(_write_xlsx_rows, worksheet, next_row, batch)
+            next_row += len(batch)
+        await asyncio.to_thread(workbook.close)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
 @api_router.get("/registries/{registry_id}/export")
-async def export_registry(registry_id: str, current_user: User = Depends(get_current_user)):
-    from fastapi.responses import StreamingResponse
-    import io
-    import csv
-    
-    # Get registry and records
-    registry = await db.registries.find_one({"id": registry_id})
+async def export_registry(
+    registry_id: str,
+    file_format: str = Query("csv", alias="format", pattern="^(csv|xlsx)$"),
+    current_user: User = Depends(get_current_user)
+):
+    registry = await db.registries.find_one({"id": registry_id}, {"_id": 0, "name": 1, "columns": 1})
     if not registry:
         raise HTTPException(status_code=404, detail="Registry not found")
-    
-    records = await db.registry_records.find({"registry_id": registry_id}, {"_id": 0}).to_list(10000)
-    
-    # Prepare CSV
-    output = io.StringIO()
-    
-    if registry.get('columns'):
-        # Write headers
-        columns = registry['columns']
-        headers = [col['name'] if isinstance(col, dict) else col.name for col in columns]
-        writer = csv.DictWriter(output, fieldnames=headers)
-        writer.writeheader()
-        
-        # Write data
-        for rec in records:
-            row = {}
-            for col in columns:
-                col_id = col['id'] if isinstance(col, dict) else col.id
-                col_name = col['name'] if isinstance(col, dict) else col.name
-                row[col_name] = rec.get('data', {}).get(col_id, '')
-            writer.writerow(row)
-    
-    output.seek(0)
+    columns = _export_columns(registry)
+    filename = f"{registry['name']}.{file_format}"
+
+    if file_format == "xlsx":
+        if await db.registry_records.count_documents({"registry_id": registry_id}) >= XLSX_MAX_ROWS:
+            raise HTTPException(status_code=400, detail="Registry exceeds the XLSX row limit, export as CSV")
+        path = await build_registry_xlsx(registry_id, registry['name'], columns)
+        # The background task runs once the response is over, also when the client went away early
+        return FileResponse(
+            path,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": content_disposition("attachment", filename)},
+            background=BackgroundTask(_unlink_quietly, path)
+        )
+
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={registry['name']}.csv"}
+        stream_registry_csv(registry_id, columns),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": content_disposition("attachment", filename)}
     )
 
+# ==================== BULK IMPORT ====================
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+# List values in CSV cells (related ids, multiselect options)
+IMPORT_LIST_SEPARATOR = "; "
+
+def _fill_risk_row(row: dict) -> dict:
+    # Level and criticality follow from the matrix, as in the risk form
+    if row.get('probability') and row.get('impact') and not row.get('risk_level'):
+        try:
+            row['risk_level'], computed = calculate_risk_criticality(int(row['probability']), int(row['impact']))
+            row.setdefault('criticality', computed)
+        except (ValueError, TypeError):
+            pass
+    return row
+
+def _fill_vulnerability_doc(doc: dict) -> dict:
+    if doc.get('cvss_vector'):
+        doc['cvss_score'], doc['severity'] = calculate_cvss_score(doc['cvss_vector'])
+    return doc
+
+# Entities that can be imported: create model for validation, stored model, number generation
+IMPORT_TARGETS = {
+    "assets": {
+        "create_model": AssetCreate, "model": Asset, "number_field": "asset_number",
+        "parse_number": _parse_plain_number("ACT"), "generate": generate_asset_numbers,
+    },
+    "risks": {
+        "create_model": RiskCreate, "model": Risk, "number_field": "risk_number",
+        "parse_number": _parse_plain_number("RSK"), "generate": generate_risk_numbers,
+        "fill_row": _fill_risk_row,
+    },
+    "vulnerabilities": {
+        "create_model": VulnerabilityCreate, "model": Vulnerability, "number_field": "vulnerability_number",
+        "parse_number": _parse_dashed_number("VUL"), "generate": generate_vulnerability_numbers,
+        "fill_doc": _fill_vulnerability_doc,
+    },
+}
+
+def _list_fields(model) -> set:
+    fields = set()
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is Union:
+            annotation = next((a for a in get_args(annotation) if a is not type(None)), annotation)
+        if get_origin(annotation) is list:
+            fields.add(name)
+    return fields
+
+def _split_list(value: str) -> List[str]:
+    return [part.strip() for part in value.split(IMPORT_LIST_SEPARATOR.strip()) if part.strip()]
+
+def _validation_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()]
+
+async def iter_import_batches(file: UploadFile, file_format: str):
+    """
+    Yield batches of (row number, raw row dict or error) from an uploaded CSV or NDJSON file.
+    Lines are read from the spooled upload in a worker thread, one batch at a time.
+    """
+    text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    if file_format == "csv":
+        reader = ((row_number, row) for row_number, row in enumerate(csv.DictReader(text), start=1))
+    else:
+        reader = ((row_number, line) for row_number, line in enumerate(text, start=1) if line.strip())
+    try:
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(reader, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            rows = []
+            for row_number, row in batch:
+                if file_format == "csv":
+                    # Empty cells mean "not set" so model defaults apply
+                    rows.append((row_number, {k: v for k, v in row.items() if k and v not in (None, '')}))
+                    continue
+                try:
+                    value = json.loads(row)
+                    if not isinstance(value, dict):
+                        raise ValueError("expected a JSON object")
+                    rows.append((row_number, value))
+                except ValueError as e:
+                    rows.append((row_number, ValueError(f"Invalid JSON: {e}")))
+            yield rows
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read import file: {e}")
+    finally:
+        text.detach()
+
+def resolve_import_format(file: UploadFile, file_format: Optional[str]) -> str:
+    if file_format:
+        return file_format
+    name = (file.filename or '').lower()
+    return "ndjson" if name.endswith(('.ndjson', '.jsonl', '.json')) else "csv"
+
+async def insert_import_batch(collection: str, docs: List[dict], rows: List[int], report: ImportReport):
+    """Unordered insert_many: one bad document does not stop the rest of the batch"""
+    if not docs:
+        return
+    try:
+        result = await db[collection].insert_many(docs, ordered=False)
+        report.inserted += len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details
+        report.inserted += details.get('nInserted', 0)
+        for write_error in details.get('writeErrors', []):
+            message = "Duplicate identifier" if write_error.get('code') == 11000 else write_error.get('errmsg', 'Write failed')
+            report.add_error(rows[write_error['index']], [message])
+
+@api_router.post("/import/{entity}", response_model=ImportReport)
+async def import_entities(
+    entity: str,
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Bulk-create assets, risks or vulnerabilities from CSV (header row of field names) or NDJSON.
+    Rows are validated with the same models as the single-record endpoints; missing numbers are
+    allocated in one block per batch. With dry_run nothing is written and no numbers are used.
+    """
+    target = IMPORT_TARGETS.get(entity)
+    if not target:
+        raise HTTPException(status_code=404, detail=f"Import is not supported for {entity}")
+    file_format = resolve_import_format(file, file_format)
+    create_model, model, number_field = target["create_model"], target["model"], target["number_field"]
+    list_fields = _list_fields(create_model)
+    report = ImportReport(dry_run=dry_run)
+    seen_numbers = set()
+
+    async for batch in iter_import_batches(file, file_format):
+        valid = []
+        for row_number, row in batch:
+            report.total_rows += 1
+            if isinstance(row, Exception):
+                report.add_error(row_number, [str(row)])
+                continue
+            if file_format == "csv":
+                row = {k: _split_list(v) if k in list_fields else v for k, v in row.items()}
+            if target.get("fill_row"):
+                row = target["fill_row"](row)
+            try:
+                data = create_model(**row).model_dump()
+                if target.get("fill_doc"):
+                    data = target["fill_doc"](data)
+            except ValidationError as e:
+                report.add_error(row_number, _validation_messages(e))
+                continue
+            except ValueError as e:
+                report.add_error(row_number, [str(e)])
+                continue
+            number = data.get(number_field)
+            if number:
+                if number in seen_numbers:
+                    report.add_error(row_number, [f"{number_field} {number} is repeated in the file"])
+                    continue
+                seen_numbers.add(number)
+            valid.append((row_number, data))
+
+        # Supplied numbers that already exist are reported up front rather than as insert failures
+        supplied = [data[number_field] for _, data in valid if data.get(number_field)]
+        if supplied:
+            existing = {
+                doc[number_field] for doc in await db[entity].find(
+                    {number_field: {"$in": supplied}}, {"_id": 0, number_field: 1}
+                ).to_list(None)
+            }
+            for row_number, data in valid:
+                if data.get(number_field) in existing:
+                    report.add_error(row_number, [f"{number_field} {data[number_field]} already exists"])
+            valid = [(row_number, data) for row_number, data in valid if data.get(number_field) not in existing]
+
+        report.valid_rows += len(valid)
+        if dry_run or not valid:
+            continue
+
+        # Raised before this batch's numbers are allocated, so none of them collides with a supplied one
+        max_supplied = max(
+            [n for n in (target["parse_number"](data[number_field]) for _, data in valid if data.get(number_field)) if n],
+            default=0
+        )
+        if max_supplied:
+            await raise_sequence(
+                number_field, max_supplied,
+                partial(_max_existing_number, entity, number_field, target["parse_number"])
+            )
+        missing = [data for _, data in valid if not data.get(number_field)]
+        if missing:
+            for data, number in zip(missing, await target["generate"](len(missing))):
+                data[number_field] = number
+        docs = [model(**data).model_dump() for _, data in valid]
+        await insert_import_batch(entity, docs, [row_number for row_number, _ in valid], report)
+
+    if not dry_run and report.inserted:
+        await notify_write(entity)
+    return report
+
+@api_router.post("/registries/{registry_id}/import", response_model=ImportReport)
+async def import_registry_records(
+    registry_id: str,
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Bulk-create registry records. Keys are column names (as in the CSV export) or column ids;
+    values are converted to the column type and id columns left empty are numbered in blocks.
+    """
+    registry = await db.registries.find_one({"id": registry_id}, {"_id": 0, "columns": 1})
+    if not registry:
+        raise HTTPException(status_code=404, detail="Registry not found")
+    columns = registry_columns_by_id(registry)
+    by_name = {col.get('name'): col_id for col_id, col in columns.items()}
+    id_columns = [col_id for col_id, col in columns.items() if col.get('column_type') == 'id']
+    file_format = resolve_import_format(file, file_format)
+    report = ImportReport(dry_run=dry_run)
+
+    async for batch in iter_import_batches(file, file_format):
+        valid = []
+        for row_number, row in batch:
+            report.total_rows += 1
+            if isinstance(row, Exception):
+                report.add_error(row_number, [str(row)])
+                continue
+            unknown = [key for key in row if key not in columns and key not in by_name]
+            if unknown:
+                report.add_error(row_number, [f"Unknown column: {key}" for key in unknown])
+                continue
+            data = {}
+            errors = []
+            for key, value in row.items():
+                col_id = key if key in columns else by_name[key]
+                column = columns[col_id]
+                if file_format == "csv" and column.get('column_type') == 'multiselect':
+                    value = _split_list(value)
+                try:
+                    data[col_id] = _coerce_cell(column.get('column_type'), value)
+                except (ValueError, TypeError):
+                    errors.append(f"{column.get('name')}: invalid value {value!r}")
+            if errors:
+                report.add_error(row_number, errors)
+                continue
+            valid.append((row_number, data))
+
+        report.valid_rows += len(valid)
+        if dry_run or not valid:
+            continue
+
+        for col_id in id_columns:
+            counter = registry_counter_name(registry_id, col_id)
+            seed = partial(_max_registry_id_value, registry_id, col_id)
+            # Raised before this batch's values are allocated, so none of them collides with a supplied one
+            max_supplied = max((data[col_id] for _, data in valid if data.get(col_id) is not None), default=0)
+            if max_supplied:
+                await raise_sequence(counter, max_supplied, seed)
+            missing = [data for _, data in valid if data.get(col_id) is None]
+            if not missing:
+                continue
+            first = await next_sequence(counter, seed, len(missing))
+            for offset, data in enumerate(missing):
+                data[col_id] = first + offset
+        docs = [
+            RegistryRecord(data=data, registry_id=registry_id, created_by=current_user.id).model_dump()
+            for _, data in valid
+        ]
+        await insert_import_batch("registry_records", docs, [row_number for row_number, _ in valid], report)
+
+    if not dry_run and report.inserted:
+        await notify_write("registry_records")
+    return report
+
+# ==================== DASHBOARD AGGREGATION ====================
+
+# The dashboard is served from a materialized document in dashboard_stats, with one section per
+# source collection. A write recomputes only the section of the collection it changed (one $facet
+# over that collection, debounced), not the whole dashboard; reads recompute sections older than
+# DASHBOARD_STATS_MAX_AGE seconds. Counters are not adjusted per write: averages and the top-10
+# list cannot be maintained from deltas, and a per-collection recompute stays exact.
+DASHBOARD_COLLECTIONS = ("risks", "incidents", "assets")
+DASHBOARD_STATS_MAX_AGE = float(os.environ.get('DASHBOARD_STATS_MAX_AGE', '60'))
+DASHBOARD_REFRESH_DEBOUNCE = float(os.environ.get('DASHBOARD_REFRESH_DEBOUNCE', '2'))
+dashboard_refresh_lock = asyncio.Lock()
+dashboard_refresh_pending = set()
+
+def _nonzero(field: str) -> dict:
+    # Matches the old Python averaging, which skipped missing and zero values
+    return {"$cond": [{"$eq": [{"$ifNull": [f"${field}", 0]}, 0]}, None, f"${field}"]}
+
+def _facet_count(facet: List[dict]) -> int:
+    return facet[0]["n"] if facet else 0
+
+def _hours(minutes: Optional[float]) -> Optional[float]:
+    return round(minutes / 60, 2) if minutes is not None else None
+
+async def compute_risks_section() -> dict:
+    pipeline = [{"$facet": {
+        "total": [{"$count": "n"}],
+        "by_criticality": [{"$group": {"_id": "$criticality", "count": {"$sum": 1}}}],
+        "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+        "top_risks": [
+            {"$sort": {"risk_level": -1}},
+            {"$limit": 10},
+            {"$project": {"_id": 0, "id": 1, "risk_number": 1, "scenario": 1, "risk_level": 1, "criticality": 1, "owner": 1}},
+        ],
+        "by_owner": [
+            {"$group": {"_id": "$owner", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 10},
+        ],
+    }}]
+    risks = (await db.risks.aggregate(pipeline).to_list(1))[0]
+    by_criticality = {item["_id"]: item["count"] for item in risks["by_criticality"]}
+    by_status = {item["_id"]: item["count"] for item in risks["by_status"]}
+    return {
+        "stats": {
+            "total_risks": _facet_count(risks["total"]),
+            "critical_risks": by_criticality.get("Критический", 0),
+        },
+        "risk_analytics": {
+            "risks_by_criticality": {c: by_criticality.get(c, 0) for c in ["Низкий", "Средний", "Высокий", "Критический"]},
+            "risks_by_status": {s: by_status.get(s, 0) for s in ["Открыт", "В обработке", "Принят", "Закрыт"]},
+            "top_risks": risks["top_risks"],
+            "risks_by_owner": {item["_id"]: item["count"] for item in risks["by_owner"] if item["_id"]},
+        },
+    }
+
+async def compute_incidents_section() -> dict:
+    pipeline = [{"$facet": {
+        "total": [{"$count": "n"}],
+        "open": [{"$match": {"status": "Открыт"}}, {"$count": "n"}],
+        "metrics": [{"$group": {
+            "_id": None,
+            "avg_mtta": {"$avg": _nonzero("mtta")},
+            "avg_mttr": {"$avg": _nonzero("mttr")},
+            "avg_mttc": {"$avg": _nonzero("mttc")},
+        }}],
+    }}]
+    incidents = (await db.incidents.aggregate(pipeline).to_list(1))[0]
+    metrics = incidents["metrics"][0] if incidents["metrics"] else {}
+    return {"stats": {
+        "total_incidents": _facet_count(incidents["total"]),
+        "open_incidents": _facet_count(incidents["open"]),
+        # Convert from minutes to hours
+        "avg_mtta": _hours(metrics.get("avg_mtta")),
+        "avg_mttr": _hours(metrics.get("avg_mttr")),
+        "avg_mttc": _hours(metrics.get("avg_mttc")),
+    }}
+
+async def compute_assets_section() -> dict:
+    pipeline = [{"$facet": {
+        "total": [{"$count": "n"}],
+        "critical": [{"$match": {"criticality": "Высокая"}}, {"$count": "n"}],
+    }}]
+    assets = (await db.assets.aggregate(pipeline).to_list(1))[0]
+    return {"stats": {
+        "total_assets": _facet_count(assets["total"]),
+        "critical_assets": _facet_count(assets["critical"]),
+    }}
+
+DASHBOARD_SECTIONS = {
+    "risks": compute_risks_section,
+    "incidents": compute_incidents_section,
+    "assets": compute_assets_section,
+}
+
+def _stale_sections(doc: Optional[dict], collections, max_age: float) -> List[str]:
+    sections = (doc or {}).get("sections", {})
+    now = datetime.now(timezone.utc)
+    return [
+        collection for collection in collections
+        if collection not in sections or not sections[collection].get("computed_at")
+        or (now - _as_datetime(sections[collection]["computed_at"])).total_seconds() > max_age
+    ]
+
+async def refresh_dashboard(collections, max_age: Optional[float] = None) -> dict:
+    """
+    Recompute the sections of the given collections, concurrently, and store them; with max_age
+    only those still stale once the lock is held. Returns the whole materialized document.
+    """
+    async with dashboard_refresh_lock:
+        if max_age is not None:
+            doc = await db.dashboard_stats.find_one({"_id": "dashboard"})
+            collections = _stale_sections(doc, collections, max_age)
+            if not collections:
+                return doc
+        results = await asyncio.gather(*(DASHBOARD_SECTIONS[c]() for c in collections))
+        now = datetime.now(timezone.utc)
+        return await db.dashboard_stats.find_one_and_update(
+            {"_id": "dashboard"},
+            {"$set": {f"sections.{c}": {**result, "computed_at": now} for c, result in zip(collections, results)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+async def get_materialized_dashboard() -> dict:
+    """Dashboard stats and risk analytics assembled from the materialized sections"""
+    doc = await db.dashboard_stats.find_one({"_id": "dashboard"})
+    stale = _stale_sections(doc, DASHBOARD_COLLECTIONS, DASHBOARD_STATS_MAX_AGE)
+    if stale:
+        doc = await refresh_dashboard(stale, max_age=DASHBOARD_STATS_MAX_AGE)
+    sections = [doc["sections"][c] for c in DASHBOARD_COLLECTIONS]
+    return {
+        "stats": {key: value for section in sections for key, value in section["stats"].items()},
+        "risk_analytics": doc["sections"]["risks"]["risk_analytics"],
+    }
+
+async def _debounced_dashboard_refresh():
+    await asyncio.sleep(DASHBOARD_REFRESH_DEBOUNCE)
+    collections = sorted(dashboard_refresh_pending)
+    dashboard_refresh_pending.clear()
+    try:
+        await refresh_dashboard(collections)
+    except Exception as e:
+        logger.warning(f"Dashboard refresh failed: {e}")
+
+def schedule_dashboard_refresh(collection: str):
+    """Coalesce a burst of writes into a single background refresh of the changed sections"""
+    scheduled = bool(dashboard_refresh_pending)
+    dashboard_refresh_pending.add(collection)
+    if not scheduled:
+        spawn_background(_debounced_dashboard_refresh())
+
+# ==================== WRITE NOTIFICATIONS ====================
+
+async def bump_collection_version(collection: str) -> int:
+    try:
+        doc = await db.collection_versions.find_one_and_update(
+            {"_id": collection}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Lost the race creating the stamp; it exists now
+        doc = await db.collection_versions.find_one_and_update(
+            {"_id": collection}, {"$inc": {"version": 1}}, return_document=ReturnDocument.AFTER
+        )
+    return doc["version"]
+
+async def get_collection_versions(collections: List[str]) -> Dict[str, int]:
+    """Current version stamps; shared by all workers, so they can key caches derived from the data"""
+    docs = await db.collection_versions.find({"_id": {"$in": collections}}).to_list(None)
+    versions = {doc["_id"]: doc.get("version", 0) for doc in docs}
+    return {collection: versions.get(collection, 0) for collection in collections}
+
+async def notify_write(collection: str):
+    """Called by handlers after a successful write to keep derived data in sync"""
+    invalidate_count_cache(collection)
+    await bump_collection_version(collection)
+    if collection in DASHBOARD_COLLECTIONS:
+        schedule_dashboard_refresh(collection)
+
+# ==================== CONDITIONAL REQUESTS ====================
+
+# JSON lists and documents may be stored by the browser but must be revalidated on every use
+REVALIDATE_CACHE = "private, no-cache"
+
+def representation_etag(model, *parts) -> str:
+    """
+    Weak validator for a JSON representation of model derived from parts. The model's field
+    names are part of it, so a deploy that changes the response shape invalidates old copies.
+    """
+    fields = _trusted_plan(model)[0]
+    return hashlib.sha1(repr((model.__name__, fields) + parts).encode()).hexdigest()[:32]
+
+def revalidate_headers(etag: str) -> dict:
+    return {"ETag": f'W/"{etag}"', "Cache-Control": REVALIDATE_CACHE}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=revalidate_headers(etag))
+
+async def list_etag(request: Request, model, collection: str, *extra) -> tuple:
+    """
+    Validator of a list endpoint: the collection's version stamp plus the query string.
+    Read before the page is fetched, so a write racing the fetch can only make the stored
+    copy look older than it is. Returns (etag, version); the version keys the count cache.
+    """
+    version = (await get_collection_versions([collection]))[collection]
+    query = sorted(request.query_params.multi_items())
+    return representation_etag(model, request.url.path, query, version, *extra), version
+
+def document_etag(model, doc: dict) -> str:
+    return representation_etag(model, doc.get("id"), doc.get("updated_at"))
+
+async def document_not_modified(request: Request, collection: str, doc_id: str, model) -> Optional[Response]:
+    """304 for a detail endpoint when the client's copy is current, checked on updated_at alone"""
+    if request.headers.get('if-none-match') is None:
+        return None
+    stamp = await db[collection].find_one({"id": doc_id}, {"_id": 0, "id": 1, "updated_at": 1})
+    if not stamp:
+        return None
+    etag = document_etag(model, stamp)
+    return not_modified_response(etag) if is_not_modified(request, etag) else None
+
+# ==================== LIVE EVENTS ====================
+
+# Handlers append small events to the capped live_events collection. Every worker follows that
+# collection in insertion order and fans events out to its own SSE subscribers, so clients on any
+# of the workers see the same events in the same order. Events only say what changed; clients
+# refetch the affected list or comments (cheap with the ETags above).
+LIVE_EVENTS_SIZE_BYTES = int(os.environ.get('LIVE_EVENTS_SIZE_BYTES', str(4 * 1024 * 1024)))
+LIVE_EVENTS_POLL_INTERVAL = float(os.environ.get('LIVE_EVENTS_POLL_INTERVAL', '1'))
+LIVE_EVENTS_HEARTBEAT = float(os.environ.get('LIVE_EVENTS_HEARTBEAT', '15'))
+LIVE_EVENTS_QUEUE_SIZE = 256
+# Events of other workers can carry a slightly older timestamp than ones already seen
+LIVE_EVENTS_OVERLAP = timedelta(seconds=5)
+LIVE_EVENTS_SEEN_LIMIT = 2000
+CHANGE_STREAMS_UNSUPPORTED = 40573  # "The $changeStream stage is only supported on replica sets"
+
+INCIDENTS_CHANNEL = "incidents"
+
+# channel -> {(queue, user_id)}; user_id is None for admins, who see every incident
+live_subscribers: Dict[str, set] = {}
+live_feed_state = {"mode": None, "delivered": 0, "dropped": 0, "restarts": 0}
+
+def incident_channel(incident_id: str) -> str:
+    return f"incident:{incident_id}"
+
+def incident_event(action: str, incident: dict) -> dict:
+    """created/updated/deleted event of an incident; audience is who may see it in the incidents list"""
+    audience = {incident.get('created_by'), *(incident.get('assigned_to') or [])} - {None}
+    return {"kind": "incident", "action": action, "incident_id": incident['id'],
+            "audience": sorted(audience), "at": datetime.now(timezone.utc)}
+
+def comment_event(action: str, comment: dict) -> dict:
+    """created/deleted event of a comment; auto-notes written by update_incident have auto set"""
+    return {"kind": "comment", "action": action, "incident_id": comment['incident_id'], "id": comment['id'],
+            "auto": comment.get('type') == "note", "at": datetime.now(timezone.utc)}
+
+async def publish_live_events(events: List[dict]):
+    """Append events after the write they describe; a failure here must not fail that write"""
+    if not events:
+        return
+    try:
+        await db.live_events.insert_many(events, ordered=True)
+    except PyMongoError as e:
+        logger.warning(f"Could not publish {len(events)} live events: {e}")
+
+def _offer(queue: asyncio.Queue, item: dict):
+    if queue.full():
+        # A stalled client gets one resync instead of an unbounded backlog
+        while not queue.empty():
+            queue.get_nowait()
+        live_feed_state["dropped"] += 1
+        item = {"kind": "resync"}
+    queue.put_nowait(item)
+
+def dispatch_live_event(event: dict):
+    payload = {k: v for k, v in event.items() if k not in ("_id", "audience")}
+    channels = [incident_channel(event['incident_id'])]
+    if event.get('kind') == "incident":
+        channels.append(INCIDENTS_CHANNEL)
+    for channel in channels:
+        for queue, user_id in live_subscribers.get(channel, ()):
+            if channel == INCIDENTS_CHANNEL and user_id is not None and user_id not in event.get('audience', []):
+                continue
+            _offer(queue, payload)
+            live_feed_state["delivered"] += 1
+
+def broadcast_resync():
+    for subscribers in live_subscribers.values():
+        for queue, _ in subscribers:
+            _offer(queue, {"kind": "resync"})
+
+async def ensure_live_events_collection():
+    try:
+        await db.create_collection("live_events", capped=True, size=LIVE_EVENTS_SIZE_BYTES)
+    except (CollectionInvalid, OperationFailure):
+        # Created already, possibly by another worker a moment ago
+        pass
+
+async def watch_live_events():
+    async with db.live_events.watch([{"$match": {"operationType": "insert"}}]) as stream:
+        async for change in stream:
+            dispatch_live_event(change['fullDocument'])
+
+async def tail_live_events(position: dict):
+    """
+    Stand-in for change streams on a standalone mongod: a tailable cursor over the capped
+    collection, reopened from shortly before the newest event seen whenever it dies. Ids in
+    position["seen"] are not delivered twice.
+    """
+    seen = position["seen"]
+    query = {"at": {"$gte": position["since"] - LIVE_EVENTS_OVERLAP}} if position["since"] else {}
+    cursor = db.live_events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+    while cursor.alive:
+        async for event in cursor:
+            if event['_id'] in seen:
+                continue
+            seen[event['_id']] = True
+            if len(seen) > LIVE_EVENTS_SEEN_LIMIT:
+                seen.popitem(last=False)
+            position["since"] = max(position["since"] or event['at'], event['at'])
+            dispatch_live_event(event)
+        await asyncio.sleep(LIVE_EVENTS_POLL_INTERVAL)
+
+async def follow_live_events():
+    """Per-worker feed: a change stream where the deployment has one, tailing otherwise"""
+    await ensure_live_events_collection()
+    # Start at the newest event so a (re)started worker does not replay history
+    position = {"since": None, "seen": collections.OrderedDict()}
+    newest = await db.live_events.find_one({}, {"at": 1}, sort=[("$natural", -1)])
+    if newest:
+        position["since"] = newest['at']
+        async for event in db.live_events.find({"at": {"$gte": newest['at'] - LIVE_EVENTS_OVERLAP}}, {"_id": 1}):
+            position["seen"][event['_id']] = True
+
+    use_change_stream = True
+    while True:
+        interrupted = True
+        try:
+            live_feed_state["mode"] = "change_stream" if use_change_stream else "tailing"
+            if use_change_stream:
+                await watch_live_events()
+            else:
+                # The cursor also dies while the collection is empty; position carries over
+                await tail_live_events(position)
+                interrupted = False
+        except OperationFailure as e:
+            if use_change_stream and e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.info("Change streams are not available, tailing live_events instead")
+                use_change_stream = False
+                continue
+            logger.warning(f"Live event feed interrupted: {e}")
+        except PyMongoError as e:
+            logger.warning(f"Live event feed interrupted: {e}")
+        if interrupted:
+            # Events may have been missed while reconnecting; clients refetch
+            live_feed_state["restarts"] += 1
+            broadcast_resync()
+        await asyncio.sleep(LIVE_EVENTS_POLL_INTERVAL)
+
+@app.on_event("startup")
+async def start_live_events():
+    spawn_background(follow_live_events())
+
+# EventSource cannot set headers, so browsers pass a stream ticket as ?ticket=. Tickets are
+# short-lived and only valid for the event streams, so one that ends up in an access log is
+# of no use for long and never for the rest of the API.
+STREAM_TICKET_PURPOSE = "events"
+STREAM_TICKET_TTL = timedelta(seconds=int(os.environ.get('STREAM_TICKET_TTL', '60')))
+
+@api_router.post("/events/ticket")
+async def create_stream_ticket(current_user: User = Depends(get_current_user)):
+    """Ticket for opening an event stream; it is checked when the stream connects"""
+    ticket = jwt.encode({
+        "sub": current_user.username,
+        "purpose": STREAM_TICKET_PURPOSE,
+        "exp": datetime.now(timezone.utc) + STREAM_TICKET_TTL,
+    }, SECRET_KEY, algorithm=ALGORITHM)
+    return {"ticket": ticket, "expires_in": int(STREAM_TICKET_TTL.total_seconds())}
+
+async def get_stream_user(ticket: Optional[str], credentials: Optional[HTTPAuthorizationCredentials]) -> User:
+    if credentials is not None:
+        return await get_current_user(credentials)
+    if not ticket:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_token_user(ticket, STREAM_TICKET_PURPOSE)
+
+def live_event_response(channel: str, user_id: Optional[str]) -> StreamingResponse:
+    queue = asyncio.Queue(maxsize=LIVE_EVENTS_QUEUE_SIZE)
+    subscriber = (queue, user_id)
+
+    async def stream():
+        live_subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), LIVE_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield b": ping\n\n"
+                    continue
+                yield b"event: " + event['kind'].encode() + b"\ndata: " + \
+                    orjson.dumps(event, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z) + b"\n\n"
+        finally:
+            subscribers = live_subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    live_subscribers.pop(channel, None)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/events/incidents")
+async def stream_incident_list_events(ticket: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+    """Server-sent events for the incidents list, limited to incidents the caller can see"""
+    current_user = await get_stream_user(ticket, credentials)
+    is_admin = current_user.role == "Администратор"
+    return live_event_response(INCIDENTS_CHANNEL, None if is_admin else current_user.id)
+
+@api_router.get("/events/incidents/{incident_id}")
+async def stream_incident_events(incident_id: str, ticket: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+    """Server-sent events for one incident: its updates and its comments, auto-notes included"""
+    current_user = await get_stream_user(ticket, credentials)
+    incident = await db.incidents.find_one({"id": incident_id}, {"_id": 0, "created_by": 1, "assigned_to": 1})
+    if not incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    # Same visibility as the incidents list: admins, the creator and the assignees
+    if current_user.role != "Администратор" and current_user.id != incident.get('created_by') \
+            and current_user.id not in (incident.get('assigned_to') or []):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return live_event_response(incident_channel(incident_id), None)
+
+@api_router.get("/admin/live-events")
+async def get_live_events_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can view live event metrics")
+    return {**live_feed_state, "subscribers": {channel: len(subs) for channel, subs in live_subscribers.items()}}
+
+# ==================== INDEXES ====================
+
+def _sort_indexes(collection: str) -> List[IndexModel]:
+    # (field, id) matches the tie-broken sort used by the list endpoints
+    return [IndexModel([(field, ASCENDING), ("id", ASCENDING)]) for field in SORTABLE_FIELDS[collection]]
+
+def _filter_indexes(*prefixes: tuple) -> List[IndexModel]:
+    # Equality/range filters followed by the default created_at sort, so a filtered
+    # first page is an index walk rather than an in-memory sort
+    return [
+        IndexModel([*[(field, ASCENDING) for field in prefix], ("created_at", ASCENDING), ("id", ASCENDING)])
+        for prefix in prefixes
+    ]
+
+def _text_index(collection: str) -> IndexModel:
+    return IndexModel(
+        [(field, TEXT) for field in TEXT_SEARCH_FIELDS[collection]],
+        name=f"{collection}_text", default_language="russian", language_override="text_language"
+    )
+
+# Declared indexes per collection; ensure_indexes() builds whatever is missing
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING)]),
+    ],
+    "roles": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING)]),
+    ],
+    "risks": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("risk_number", ASCENDING)], unique=True),
+        *_sort_indexes("risks"),
+        *_filter_indexes(("status", "criticality"), ("criticality",), ("owner",), ("related_assets",)),
+        _text_index("risks"),
+    ],
+    "incidents": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("incident_number", ASCENDING)], unique=True),
+        IndexModel([("created_by", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("assigned_to", ASCENDING), ("created_at", DESCENDING)]),
+        *_sort_indexes("incidents"),
+        *_filter_indexes(("status", "criticality"), ("criticality",), ("system",), ("incident_type",)),
+        _text_index("incidents"),
+    ],
+    "incident_comments": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Thread pages seek on (created_at, id) within an incident, in either direction
+        IndexModel([("incident_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "assets": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("asset_number", ASCENDING)], unique=True),
+        *_sort_indexes("assets"),
+        *_filter_indexes(("status", "criticality"), ("criticality",), ("category",), ("owner",)),
+        _text_index("assets"),
+    ],
+    "threats": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("threat_number", ASCENDING)], unique=True),
+        *_sort_indexes("threats"),
+        *_filter_indexes(("category", "source"), ("source",), ("related_vulnerability_id",)),
+        _text_index("threats"),
+    ],
+    "vulnerabilities": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("vulnerability_number", ASCENDING)], unique=True),
+        *_sort_indexes("vulnerabilities"),
+        *_filter_indexes(("status", "severity"), ("severity",), ("related_asset_id",)),
+        _text_index("vulnerabilities"),
+    ],
+    "wiki_pages": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("parent_id", ASCENDING), ("order", ASCENDING)]),
+        IndexModel([("order", ASCENDING)]),
+    ],
+    "wiki_images": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "registries": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "registry_records": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("registry_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("registry_id", ASCENDING), ("updated_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "settings": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "mitre_attack": [
+        IndexModel([("technique_id", ASCENDING)]),
+    ],
+}
+
+# Index options that must match for an existing index to count as "in sync"
+INDEX_COMPARED_OPTIONS = ["unique", "partialFilterExpression", "sparse", "expireAfterSeconds"]
+
+index_build_state = {
+    "started_at": None,
+    "finished_at": None,
+    "errors": {},
+}
+
+def _index_signature(spec: dict) -> dict:
+    key = [(k, v) for k, v in spec["key"].items()] if isinstance(spec["key"], dict) else list(spec["key"])
+    if any(v == TEXT for _, v in key):
+        # MongoDB reports text indexes as _fts/_ftsx keys with the fields under "weights"
+        key = [(TEXT, sorted(spec.get("weights") or [k for k, v in key if v == TEXT]))]
+    return {
+        "key": key,
+        **{opt: spec.get(opt) for opt in INDEX_COMPARED_OPTIONS if spec.get(opt) is not None},
+    }
+
+async def get_index_drift() -> dict:
+    """Compare declared INDEX_SPECS with the indexes present in MongoDB"""
+    report = {}
+    for collection, models in INDEX_SPECS.items():
+        existing = await db[collection].index_information()
+        existing.pop("_id_", None)
+        missing, mismatched = [], []
+        for model in models:
+            declared = model.document
+            name = declared["name"]
+            if name not in existing:
+                missing.append(name)
+            elif _index_signature(declared) != _index_signature(existing[name]):
+                mismatched.append(name)
+        declared_names = {model.document["name"] for model in models}
+        report[collection] = {
+            "missing": missing,
+            "mismatched": mismatched,
+            "undeclared": sorted(name for name in existing
+                                 if name not in declared_names and not name.startswith(REGISTRY_INDEX_PREFIX)),
+        }
+    return report
+
+async def ensure_indexes():
+    """Build missing declared indexes; failures are recorded instead of aborting startup"""
+    index_build_state["started_at"] = datetime.now(timezone.utc)
+    index_build_state["finished_at"] = None
+    index_build_state["errors"] = {}
+    for collection, models in INDEX_SPECS.items():
+        existing = await db[collection].index_information()
+        for model in models:
+            name = model.document["name"]
+            if name in existing:
+                continue
+            try:
+                await db[collection].create_indexes([model])
+                logger.info(f"Index {collection}.{name} created")
+            except OperationFailure as e:
+                # e.g. duplicate *_number values in legacy data block a unique index
+                index_build_state["errors"][f"{collection}.{name}"] = str(e)
+                logger.warning(f"Index {collection}.{name} failed: {e}")
+    index_build_state["finished_at"] = datetime.now(timezone.utc)
+
+# Per-registry column indexes, created once a column is sorted/filtered on often enough.
+# They are partial on registry_id, so each covers only its own registry's records.
+REGISTRY_INDEX_PREFIX = "registry_col_"
+REGISTRY_INDEX_MIN_USES = int(os.environ.get('REGISTRY_INDEX_MIN_USES', '20'))
+# MongoDB allows 64 indexes per collection; leave room for the declared ones
+REGISTRY_INDEX_LIMIT = int(os.environ.get('REGISTRY_INDEX_LIMIT', '40'))
+
+def registry_index_name(registry_id: str, column_id: str) -> str:
+    return f"{REGISTRY_INDEX_PREFIX}{registry_id}_{column_id}"
+
+async def track_registry_column_use(registry_id: str, column_id: str):
+    try:
+        usage = await db.registry_column_usage.find_one_and_update(
+            {"_id": f"{registry_id}:{column_id}"},
+            {"$inc": {"uses": 1},
+             "$set": {"registry_id": registry_id, "column_id": column_id, "last_used_at": datetime.now(timezone.utc)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return
+    if usage["uses"] >= REGISTRY_INDEX_MIN_USES and not usage.get("indexed"):
+        await ensure_registry_column_index(registry_id, column_id)
+
+async def ensure_registry_column_index(registry_id: str, column_id: str):
+    name = registry_index_name(registry_id, column_id)
+    existing = await db.registry_records.index_information()
+    if name not in existing:
+        if sum(1 for n in existing if n.startswith(REGISTRY_INDEX_PREFIX)) >= REGISTRY_INDEX_LIMIT:
+            logger.info(f"Registry index limit reached, not indexing {name}")
+            return
+        try:
+            await db.registry_records.create_indexes([IndexModel(
+                [(f"data.{column_id}", ASCENDING), ("id", ASCENDING)],
+                name=name, partialFilterExpression={"registry_id": registry_id}
+            )])
+            logger.info(f"Index registry_records.{name} created")
+        except OperationFailure as e:
+            logger.warning(f"Index registry_records.{name} failed: {e}")
+            return
+    await db.registry_column_usage.update_one({"_id": f"{registry_id}:{column_id}"}, {"$set": {"indexed": True}})
+
+async def drop_registry_column_indexes(registry_id: str, column_ids: Optional[List[str]] = None):
+    """Drop managed indexes of a registry, or of some of its columns"""
+    prefix = registry_index_name(registry_id, "")
+    for name in await db.registry_records.index_information():
+        if name.startswith(prefix) and (column_ids is None or name[len(prefix):] in column_ids):
+            try:
+                await db.registry_records.drop_index(name)
+            except OperationFailure:
+                pass
+    usage_query = {"registry_id": registry_id}
+    if column_ids is not None:
+        usage_query["column_id"] = {"$in": column_ids}
+    await db.registry_column_usage.delete_many(usage_query)
+
+@app.exception_handler(DuplicateKeyError)
+async def duplicate_key_handler(request: Request, exc: DuplicateKeyError):
+    # Unique indexes on id/*_number/username reject duplicates that used to slip through
+    return JSONResponse(status_code=409, content={"detail": "Record with this identifier already exists"})
+
+@app.on_event("startup")
+async def start_index_build():
+    # Runs in the background so startup (and the other workers) are not blocked by large builds
+    spawn_background(ensure_indexes())
+
+@api_router.get("/admin/indexes")
+async def get_index_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can view indexes")
+
+    drift = await get_index_drift()
+    in_sync = all(not d["missing"] and not d["mismatched"] for d in drift.values())
+    return {"in_sync": in_sync, "build": index_build_state, "collections": drift}
+
+@api_router.post("/admin/indexes/sync")
+async def sync_indexes(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can manage indexes")
+
+    spawn_background(ensure_indexes())
+    return {"message": "Index build started"}
+
+# ==================== MIGRATIONS ====================
+
+MIGRATION_LEASE = timedelta(minutes=10)
+# The running worker renews its lease this often; others poll to see whether it finished
+MIGRATION_RENEW_INTERVAL = MIGRATION_LEASE.total_seconds() / 3
+MIGRATION_POLL_INTERVAL = 5.0
+
+async def migrate_embedded_incident_attachments():
+    """Move base64 attachments embedded in incident documents into GridFS"""
+    cursor = db.incidents.find(
+        {"attachments.data": {"$exists": True}}, {"_id": 0, "id": 1, "attachments": 1}
+    )
+    moved = 0
+    async for incident in cursor:
+        for att in incident.get('attachments', []):
+            if not att.get('data') or not att.get('id'):
+                continue
+            try:
+                content_type, data = decode_data_url(att['data'])
+            except HTTPException:
+                logger.warning(f"Skipping undecodable attachment {att['id']} of incident {incident['id']}")
+                continue
+            try:
+                meta = await store_incident_attachment(
+                    incident['id'], data, att.get('filename', ''), content_type,
+                    attachment_id=att['id'], created_at=att.get('created_at')
+                )
+            except FileExists:
+                # Uploaded by an interrupted earlier run; rebuild metadata from the stored bytes
+                meta = {
+                    "id": att['id'], "filename": att.get('filename', ''), "content_type": content_type,
+                    "size": len(data), "sha256": hashlib.sha256(data).hexdigest(),
+                    "url": f"/api/incidents/{incident['id']}/attachments/{att['id']}",
+                    "created_at": att.get('created_at') or datetime.now(timezone.utc),
+                }
+            # Only replace the entry if it still holds the embedded data
+            await db.incidents.update_one(
+                {"id": incident['id'], "attachments": {"$elemMatch": {"id": att['id'], "data": {"$exists": True}}}},
+                {"$set": {"attachments.$": meta}}
+            )
+            moved += 1
+    if moved:
+        # Drop list and document ETags built from the embedded form
+        await notify_write("incidents")
+    logger.info(f"Moved {moved} embedded incident attachments to GridFS")
+
+async def migrate_wiki_images_to_gridfs():
+    """Move base64 wiki images into GridFS and drop the data URL from wiki_images"""
+    moved = 0
+    async for image in db.wiki_images.find({"data": {"$exists": True}}, {"_id": 0}):
+        try:
+            content_type, data = decode_data_url(image['data'])
+        except HTTPException:
+            logger.warning(f"Skipping undecodable wiki image {image.get('id')}")
+            continue
+        doc = await store_wiki_image(
+            image['id'], data, image.get('filename'), image.get('content_type') or content_type,
+            image.get('uploaded_by'), image.get('uploaded_at')
+        )
+        await db.wiki_images.update_one(
+            {"id": image['id'], "data": {"$exists": True}},
+            {"$set": doc, "$unset": {"data": ""}}
+        )
+        moved += 1
+    if moved:
+        await notify_write("wiki_images")
+    logger.info(f"Moved {moved} wiki images to GridFS")
+
+async def migrate_comment_images_to_gridfs():
+    """Move base64 comment images into GridFS and keep only their URL on the comment"""
+    moved = 0
+    async for comment in db.incident_comments.find(
+        {"image": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "incident_id": 1, "image": 1}
+    ):
+        try:
+            image = await store_comment_image(comment['incident_id'], comment['id'], comment['image'])
+        except HTTPException:
+            logger.warning(f"Skipping undecodable image of comment {comment['id']}")
+            continue
+        await db.incident_comments.update_one({"id": comment['id'], "image": comment['image']}, {"$set": image})
+        moved += 1
+    # Superseded by the (incident_id, created_at, id) index used for thread pages
+    try:
+        await db.incident_comments.drop_index("incident_id_1_created_at_1")
+    except OperationFailure:
+        pass
+    if moved:
+        await notify_write("incident_comments")
+    logger.info(f"Moved {moved} comment images to GridFS")
+
+# Date fields that older versions wrote as ISO strings
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "roles": ["created_at", "updated_at"],
+    "risks": ["registration_date", "review_date", "created_at", "updated_at"],
+    "incidents": ["incident_time", "detection_time", "reaction_start_time", "closed_at", "created_at", "updated_at"],
+    "incident_comments": ["created_at"],
+    "assets": ["review_date", "created_at", "updated_at"],
+    "threats": ["created_at", "updated_at"],
+    "vulnerabilities": ["discovery_date", "closure_date", "created_at", "updated_at"],
+    "settings": ["updated_at"],
+    "wiki_pages": ["created_at", "updated_at"],
+    "wiki_images": ["uploaded_at"],
+    "registries": ["created_at", "updated_at"],
+    "registry_records": ["created_at", "updated_at"],
+}
+
+MIGRATION_BATCH_SIZE = 500
+
+def _parse_iso(value: str):
+    if not value:
+        return None
+    try:
+        # Offsets are kept (pymongo converts to UTC); naive wall-clock values are stored as is
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return value
+
+async def migrate_iso_strings_to_dates():
+    """Convert ISO string date fields to native BSON dates so they sort and range-query correctly"""
+    for collection, fields in DATE_FIELDS.items():
+        converted = 0
+        ops = []
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        projection = {field: 1 for field in fields}
+        async for doc in db[collection].find(query, projection):
+            update = {}
+            for field in fields:
+                value = doc.get(field)
+                if isinstance(value, str):
+                    parsed = _parse_iso(value)
+                    if parsed is not value:
+                        update[field] = parsed
+            if not update:
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+            if len(ops) >= MIGRATION_BATCH_SIZE:
+                await db[collection].bulk_write(ops, ordered=False)
+                converted += len(ops)
+                ops = []
+        if ops:
+            await db[collection].bulk_write(ops, ordered=False)
+            converted += len(ops)
+        if converted:
+            await notify_write(collection)
+            logger.info(f"Converted date fields of {converted} documents in {collection}")
+
+async def migrate_registry_typed_values():
+    """Store registry cells as their column type (numbers, ids, booleans) instead of form strings"""
+    changed = 0
+    async for registry in db.registries.find({}, {"_id": 0, "id": 1, "columns": 1}):
+        columns = registry_columns_by_id(registry)
+        ops = []
+        async for rec in db.registry_records.find({"registry_id": registry['id']}, {"_id": 1, "data": 1}):
+            update = {}
+            for col_id, value in (rec.get('data') or {}).items():
+                if col_id not in columns:
+                    continue
+                try:
+                    typed = _coerce_cell(columns[col_id].get('column_type'), value)
+                except (ValueError, TypeError):
+                    continue
+                if typed != value or type(typed) is not type(value):
+                    update[f"data.{col_id}"] = typed
+            if update:
+                ops.append(UpdateOne({"_id": rec["_id"]}, {"$set": update}))
+            if len(ops) >= MIGRATION_BATCH_SIZE:
+                await db.registry_records.bulk_write(ops, ordered=False)
+                changed += len(ops)
+                ops = []
+        if ops:
+            await db.registry_records.bulk_write(ops, ordered=False)
+            changed += len(ops)
+    if changed:
+        await notify_write("registry_records")
+
+# One-shot data migrations, run in order in the background at startup.
+# Each must be idempotent: a worker may resume a migration another worker left unfinished.
+MIGRATIONS = [
+    ("incident_attachments_to_gridfs", migrate_embedded_incident_attachments),
+    ("wiki_images_to_gridfs", migrate_wiki_images_to_gridfs),
+    ("iso_strings_to_dates", migrate_iso_strings_to_dates),
+    ("registry_typed_values", migrate_registry_typed_values),
+    ("comment_images_to_gridfs", migrate_comment_images_to_gridfs),
+]
+
+async def claim_migration(name: str, owner: str) -> bool:
+    """Take the lease of an unfinished migration; False while another worker holds it or once it finished"""
+    now = datetime.now(timezone.utc)
+    try:
+        # The upsert fails with a duplicate key while the lease is held or the migration is finished
+        claimed = await db.migrations.find_one_and_update(
+            {"_id": name, "finished_at": None, "lease_until": {"$lt": now}},
+            {"$set": {"lease_until": now + MIGRATION_LEASE, "started_at": now, "owner": owner}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False
+    return claimed is not None
+
+async def acquire_migration(name: str, owner: str) -> bool:
+    """Wait until the migration is claimed by this worker (True) or finished by another one (False)"""
+    while not await claim_migration(name, owner):
+        state = await db.migrations.find_one({"_id": name}, {"finished_at": 1})
+        if state and state.get("finished_at"):
+            return False
+        await asyncio.sleep(MIGRATION_POLL_INTERVAL)
+    return True
+
+async def renew_migration_lease(name: str, owner: str):
+    """Keep extending the lease while the migration runs, so no other worker starts it as well"""
+    while True:
+        await asyncio.sleep(MIGRATION_RENEW_INTERVAL)
+        result = await db.migrations.update_one(
+            {"_id": name, "owner": owner, "finished_at": None},
+            {"$set": {"lease_until": datetime.now(timezone.utc) + MIGRATION_LEASE}}
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Migration {name} lost its lease")
+            return
+
+async def run_migrations():
+    """
+    Run the migrations in order. A migration held by another worker is waited for rather than
+    skipped, and the first failure stops the run, so a migration never starts before the ones
+    listed ahead of it have finished.
+    """
+    owner = str(uuid.uuid4())
+    for name, migration in MIGRATIONS:
+        if not await acquire_migration(name, owner):
+            continue
+        renewal = asyncio.create_task(renew_migration_lease(name, owner))
+        try:
+            await migration()
+        except Exception as e:
+            logger.error(f"Migration {name} failed: {e}")
+            await db.migrations.update_one(
+                {"_id": name, "owner": owner},
+                {"$set": {"lease_until": datetime.now(timezone.utc), "error": str(e)}}
+            )
+            return
+        finally:
+            renewal.cancel()
+        await db.migrations.update_one(
+            {"_id": name},
+            {"$set": {"finished_at": datetime.now(timezone.utc), "error": None}}
+        )
+        logger.info(f"Migration {name} finished")
+
+@app.on_event("startup")
+async def start_migrations():
+    spawn_background(run_migrations())
+
+@api_router.get("/admin/migrations")
+async def get_migrations_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can view migrations")
+
+    state = {m["_id"]: m for m in await db.migrations.find({}).to_list(None)}
+    return [
+        {
+            "name": name,
+            "started_at": state.get(name, {}).get("started_at"),
+            "finished_at": state.get(name, {}).get("finished_at"),
+            "error": state.get(name, {}).get("error"),
+        }
+        for name, _ in MIGRATIONS
+    ]
+
+@api_router.get("/admin/password-pool")
+async def get_password_pool_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can view password pool metrics")
+    return get_password_pool_stats()
+
+@api_router.get("/admin/user-cache")
+async def get_user_cache_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "Администратор":
+        raise HTTPException(status_code=403, detail="Only admins can view cache metrics")
+    return {**user_cache_stats, "size": len(user_cache), "ttl_seconds": USER_CACHE_TTL}
+
 # ==================== INIT ADMIN AND MITRE ====================
 
 @app.on_event("startup")
@@ -2300,8 +5103,6 @@ async def create_admin():
             )
         )
         doc = admin_role_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['updated_at'] = doc['updated_at'].isoformat()
         if hasattr(doc['permissions'], 'model_dump'):
             doc['permissions'] = doc['permissions'].model_dump()
         await db.roles.insert_one(doc)
@@ -2322,8 +5123,6 @@ async def create_admin():
             )
         )
         doc = engineer_role_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['updated_at'] = doc['updated_at'].isoformat()
         if hasattr(doc['permissions'], 'model_dump'):
             doc['permissions'] = doc['permissions'].model_dump()
         await db.roles.insert_one(doc)
@@ -2341,8 +5140,6 @@ async def create_admin():
             )
         )
         doc = specialist_role_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['updated_at'] = doc['updated_at'].isoformat()
         if hasattr(doc['permissions'], 'model_dump'):
             doc['permissions'] = doc['permissions'].model_dump()
         await db.roles.insert_one(doc)
@@ -2359,8 +5156,7 @@ async def create_admin():
             role_name="Администратор"
         )
         doc = admin_user.model_dump()
-        doc['password'] = hash_password("admin123")
-        doc['created_at'] = doc['created_at'].isoformat()
+        doc['password'] = await hash_password("admin123")
         await db.users.insert_one(doc)
         logger.info("Admin user created: username=admin, password=admin123")
     
@@ -2416,6 +5212,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "Server-Timing"],
 )
 
 logging.basicConfig(
@@ -2424,6 +5221,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Served on the backend port only; nginx proxies just /api/
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE_LATEST)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    password_executor.shutdown(wait=False)
+    if PROMETHEUS_MULTIPROC:
+        # Drops this worker's live gauges (in-flight requests) from the aggregate
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,61 @@
+import { useEffect, useRef } from 'react';
+import axios from 'axios';
+import { API } from '../App';
+
+const EVENT_TYPES = ['incident', 'comment', 'resync'];
+const RECONNECT_DELAY_MS = 3000;
+
+// Subscribes to a server-sent event stream under /api/events/. onEvent gets the parsed event;
+// { kind: 'resync' } means events may have been missed (e.g. after a reconnect) and the
+// caller should refetch. EventSource cannot send headers, so each connection first gets a
+// short-lived stream ticket and passes it in the query; reconnects fetch a fresh one.
+export function useLiveEvents(path, onEvent, enabled = true) {
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+
+  useEffect(() => {
+    if (!enabled || typeof EventSource === 'undefined') return undefined;
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+    let connectedBefore = false;
+
+    const listener = (e) => {
+      try { handler.current(JSON.parse(e.data)); } catch { /* ignore malformed event */ }
+    };
+
+    const scheduleReconnect = () => {
+      if (!closed) retryTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+
+    const connect = async () => {
+      let ticket;
+      try {
+        const res = await axios.post(`${API}/events/ticket`);
+        ticket = res.data.ticket;
+      } catch {
+        scheduleReconnect();
+        return;
+      }
+      if (closed) return;
+      source = new EventSource(`${API}/events/${path}?ticket=${encodeURIComponent(ticket)}`);
+      source.onopen = () => {
+        if (connectedBefore) handler.current({ kind: 'resync' });
+        connectedBefore = true;
+      };
+      // The ticket may have expired by the time the browser retries on its own, so reconnect here
+      source.onerror = () => {
+        source.close();
+        scheduleReconnect();
+      };
+      EVENT_TYPES.forEach(type => source.addEventListener(type, listener));
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [path, enabled]);
+}
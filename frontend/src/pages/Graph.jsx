@@ -37,8 +37,6 @@ const NAV_PATH = {
   vulnerability: '/vulnerabilities',
 };
 
-const nid = (type, id) => `${type}::${id}`;
-
 /* split label into ≤3 lines of ≤12 chars each (asset nodes are bigger now) */
 const wrapLines = (text, maxLen = 12, maxLines = 3) => {
   if (!text) return [''];
@@ -120,95 +118,15 @@ const Graph = () => {
     if (tipRef.current) { tipRef.current.remove(); tipRef.current = null; }
 
     try {
-      const [risksRes, assetsRes, threatsRes, vulnsRes] = await Promise.all([
-        axios.get(`${API}/risks`,           { params: { limit: 500, skip: 0 } }),
-        axios.get(`${API}/assets`,          { params: { limit: 500, skip: 0 } }),
-        axios.get(`${API}/threats`,         { params: { limit: 500, skip: 0 } }),
-        axios.get(`${API}/vulnerabilities`, { params: { limit: 500, skip: 0 } }),
-      ]);
-
-      const risks  = risksRes.data?.items   ?? risksRes.data   ?? [];
-      const assets = assetsRes.data?.items  ?? assetsRes.data  ?? [];
-      const threats= threatsRes.data?.items ?? threatsRes.data ?? [];
-      const vulns  = vulnsRes.data?.items   ?? vulnsRes.data   ?? [];
-
-      const nodes  = [];
-      const links  = [];
-      const nodeMap = new Map();
-
-      const addNode = (id, type, label, meta = {}) => {
-        if (nodeMap.has(id)) return;
-        // label must come AFTER NODE_CFG spread so actual entity name wins
-        const node = { id, type, meta, ...NODE_CFG[type], label };
-        nodeMap.set(id, node);
-        nodes.push(node);
-      };
-
-      /* entity nodes — use actual names */
-      risks.forEach(r =>
-        addNode(nid('risk', r.id), 'risk',
-          r.scenario || r.risk_number || 'Риск', { obj: r }));
-      assets.forEach(a =>
-        addNode(nid('asset', a.id), 'asset',
-          a.name || a.asset_number || 'Актив', { obj: a }));
-      threats.forEach(t =>
-        addNode(nid('threat', t.id), 'threat',
-          t.description || t.threat_number || 'Угроза', { obj: t }));
-      vulns.forEach(v =>
-        addNode(nid('vulnerability', v.id), 'vulnerability',
-          v.description || v.vulnerability_number || 'Уязвимость', { obj: v }));
-
-      /* owner nodes */
-      [...new Set(risks.filter(r => r.owner).map(r => r.owner))].forEach(o =>
-        addNode(nid('risk_owner', o), 'risk_owner', o, {}));
-      [...new Set(assets.filter(a => a.owner).map(a => a.owner))].forEach(o =>
-        addNode(nid('asset_owner', o), 'asset_owner', o, {}));
-
-      const addLink = (s, t, kind) => {
-        if (nodeMap.has(s) && nodeMap.has(t)) links.push({ source: s, target: t, kind });
-      };
-
-      /* ── asset-centric link topology ────────────────────────────
-         Base = Актив. Everything points to the asset it affects.
-         Secondary edges show causal chain between non-asset nodes. */
-      risks.forEach(r => {
-        const src = nid('risk', r.id);
-        // Risk → Asset (risk affects asset)
-        (r.related_assets || []).forEach(id =>
-          addLink(src, nid('asset', id), 'risk_asset'));
-        // Risk → Threat / Vuln (causal chain, secondary)
-        (r.related_threats || []).forEach(id =>
-          addLink(src, nid('threat', id), 'risk_threat'));
-        (r.related_vulnerabilities || []).forEach(id =>
-          addLink(src, nid('vulnerability', id), 'risk_vulnerability'));
-        if (r.owner) addLink(src, nid('risk_owner', r.owner), 'risk_owner');
-      });
-      assets.forEach(a => {
-        const assetNode = nid('asset', a.id);
-        // Threat → Asset (threat targets asset)
-        (a.threats || []).forEach(id =>
-          addLink(nid('threat', id), assetNode, 'threat_asset'));
-        if (a.owner) addLink(assetNode, nid('asset_owner', a.owner), 'asset_owner');
-      });
-      threats.forEach(t => {
-        // Vuln → Threat (vuln enables threat)
-        if (t.related_vulnerability_id)
-          addLink(nid('vulnerability', t.related_vulnerability_id),
-                  nid('threat', t.id), 'threat_vuln');
-      });
-      vulns.forEach(v => {
-        // Vuln → Asset (vulnerability resides in asset)
-        if (v.related_asset_id)
-          addLink(nid('vulnerability', v.id),
-                  nid('asset', v.related_asset_id), 'vuln_asset');
-      });
+      // Nodes and edges are joined server-side; isolated nodes are already dropped
+      const { data } = await axios.get(`${API}/graph`);
 
-      /* filter isolated nodes */
-      const connectedIds = new Set();
-      links.forEach(l => { connectedIds.add(l.source); connectedIds.add(l.target); });
-      const filteredNodes = nodes.filter(n => connectedIds.has(n.id));
+      const nodes = data.nodes.map(n =>
+        // label must come AFTER NODE_CFG spread so actual entity name wins
+        ({ id: n.id, type: n.type, meta: { obj: n.data }, ...NODE_CFG[n.type], label: n.label || NODE_CFG[n.type].label }));
+      const links = data.edges.map(e => ({ source: e.source, target: e.target, kind: e.kind }));
 
-      renderGraph({ nodes: filteredNodes, links });
+      renderGraph({ nodes, links });
     } catch (e) {
       console.error('Graph build error', e);
     } finally {
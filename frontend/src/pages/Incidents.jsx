@@ -12,9 +12,58 @@ import { Badge } from '@/components/ui/badge';
 import { Checkbox } from '@/components/ui/checkbox';
 import { Plus, Trash2, Download, Settings, Clock, Timer, CheckCircle2, Filter, ChevronLeft, ChevronRight, ChevronsLeft, ChevronsRight, ArrowUpDown, Eye, Edit, X, UserCheck, MessageSquare, Send, Users, Image, Paperclip, Calendar, AlertCircle } from 'lucide-react';
 import { toast } from 'sonner';
+import { useLiveEvents } from '@/hooks/use-live-events';
 
 const INCIDENT_STATUSES = ['Новая', 'В работе', 'Завершен', 'Проверен'];
 
+// Stored files come back as /api/... URLs; unsaved form items still carry a data URL
+const API_BASE = API.replace(/\/api$/, '');
+const fileSrc = (url, data) => (url ? (url.startsWith('/api') ? `${API_BASE}${url}` : url) : data);
+
+// Incident files need the bearer token, so they are fetched with axios and shown from an object URL.
+// The fetch starts once the image comes into view; data URLs are shown as they are.
+const AuthImage = ({ url, data, className = '', ...props }) => {
+  const ref = useRef(null);
+  const [src, setSrc] = useState(url ? null : data);
+
+  useEffect(() => {
+    if (!url || !url.startsWith('/api')) {
+      setSrc(fileSrc(url, data));
+      return undefined;
+    }
+    setSrc(null);
+    let objectUrl = null;
+    let cancelled = false;
+    const fetchFile = async () => {
+      try {
+        const res = await axios.get(fileSrc(url), { responseType: 'blob' });
+        if (cancelled) return;
+        objectUrl = URL.createObjectURL(res.data);
+        setSrc(objectUrl);
+      } catch { /* keep the placeholder */ }
+    };
+    let observer = null;
+    if (typeof IntersectionObserver === 'undefined' || !ref.current) {
+      fetchFile();
+    } else {
+      observer = new IntersectionObserver((entries) => {
+        if (entries.some(e => e.isIntersecting)) {
+          observer.disconnect();
+          fetchFile();
+        }
+      }, { rootMargin: '200px' });
+      observer.observe(ref.current);
+    }
+    return () => {
+      cancelled = true;
+      if (observer) observer.disconnect();
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [url, data]);
+
+  return <img ref={ref} src={src || undefined} className={`${className} ${src ? '' : 'min-h-[40px] min-w-[40px] bg-slate-200/60 dark:bg-slate-700/60'}`} {...props} />;
+};
+
 const getStatusColor = (status) => {
   switch (status) {
     case 'Новая':    return 'bg-blue-100 text-blue-800 dark:bg-blue-900/40 dark:text-blue-300';
@@ -99,8 +148,12 @@ const MultiUserSelect = ({ users, selected, onChange, disabled }) => {
 };
 
 // ── CommentsSection ────────────────────────────────────────────────
+const COMMENTS_PAGE_SIZE = 30;
+
 const CommentsSection = ({ incidentId, user }) => {
   const [comments, setComments] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [text, setText] = useState('');
   const [pendingImage, setPendingImage] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -108,19 +161,67 @@ const CommentsSection = ({ incidentId, user }) => {
   const bottomRef = useRef(null);
   const messagesRef = useRef(null);
   const imgInputRef = useRef(null);
+  const keepScrollRef = useRef(false);
+  const commentsRef = useRef(comments);
+  commentsRef.current = comments;
+
+  const fetchPage = (cursor) => axios.get(`${API}/incidents/${incidentId}/comments`, {
+    params: { order: 'desc', limit: COMMENTS_PAGE_SIZE, cursor: cursor || undefined },
+  });
 
+  // Newest page first; older pages already loaded are kept below it
   const load = async () => {
     try {
-      const res = await axios.get(`${API}/incidents/${incidentId}/comments`);
-      setComments(res.data);
+      const res = await fetchPage();
+      const latest = res.data.items.slice().reverse();
+      const prev = commentsRef.current;
+      // Older pages stay only if they still join the newest page without a gap
+      const joined = res.data.next_cursor && latest.length > 0
+        && prev.some(c => c.created_at < latest[0].created_at)
+        && prev.some(c => c.created_at >= latest[0].created_at);
+      if (joined) {
+        setComments([...prev.filter(c => c.created_at < latest[0].created_at), ...latest]);
+      } else {
+        setComments(latest);
+        setOlderCursor(res.data.next_cursor);
+      }
     } catch { /* ignore */ }
     finally { setLoading(false); }
   };
 
-  useEffect(() => { load(); }, [incidentId]); // eslint-disable-line
+  const loadOlder = async () => {
+    if (!olderCursor) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetchPage(olderCursor);
+      keepScrollRef.current = true;
+      setComments(prev => {
+        const seen = new Set(prev.map(c => c.id));
+        return [...res.data.items.filter(c => !seen.has(c.id)).reverse(), ...prev];
+      });
+      setOlderCursor(res.data.next_cursor);
+    } catch { toast.error('Ошибка загрузки комментариев'); }
+    finally { setLoadingOlder(false); }
+  };
+
+  useEffect(() => {
+    setComments([]);
+    setOlderCursor(null);
+    setLoading(true);
+    load();
+  }, [incidentId]); // eslint-disable-line
+
+  // New comments and auto-notes from other analysts arrive without polling
+  useLiveEvents(`incidents/${incidentId}`, (event) => {
+    if (event.kind === 'comment' || event.kind === 'resync') load();
+  });
 
-  // Scroll within the messages container only, not the whole dialog
+  // Scroll within the messages container only, not the whole dialog; stay put when older pages are prepended
   useEffect(() => {
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     if (messagesRef.current) {
       messagesRef.current.scrollTop = messagesRef.current.scrollHeight;
     }
@@ -159,6 +260,7 @@ const CommentsSection = ({ incidentId, user }) => {
     if (!window.confirm('Удалить комментарий?')) return;
     try {
       await axios.delete(`${API}/incidents/${incidentId}/comments/${commentId}`);
+      setComments(prev => prev.filter(c => c.id !== commentId));
       load();
     } catch { toast.error('Ошибка удаления'); }
   };
@@ -173,8 +275,8 @@ const CommentsSection = ({ incidentId, user }) => {
           className="fixed inset-0 z-[200] bg-black/85 flex items-center justify-center p-6"
           onClick={() => setLightboxSrc(null)}
         >
-          <img
-            src={lightboxSrc}
+          <AuthImage
+            url={lightboxSrc}
             alt="preview"
             className="max-w-full max-h-full rounded-xl shadow-2xl object-contain"
             onClick={e => e.stopPropagation()}
@@ -191,7 +293,7 @@ const CommentsSection = ({ incidentId, user }) => {
       <div className="flex items-center gap-2 mb-1">
         <MessageSquare className="w-4 h-4 text-cyan-500" />
         <span className="font-semibold text-sm dark:text-white">Комментарии</span>
-        <Badge className="bg-slate-100 text-slate-600 dark:bg-slate-700 dark:text-slate-300 text-xs">{comments.length}</Badge>
+        <Badge className="bg-slate-100 text-slate-600 dark:bg-slate-700 dark:text-slate-300 text-xs">{comments.length}{olderCursor ? '+' : ''}</Badge>
       </div>
 
       <div className="border border-slate-200 dark:border-slate-700 rounded-xl overflow-hidden">
@@ -201,6 +303,17 @@ const CommentsSection = ({ incidentId, user }) => {
           className="p-3 space-y-3 bg-slate-50 dark:bg-slate-900/50 max-h-72 overflow-y-auto"
         >
           {loading && <div className="text-center text-sm text-slate-400 py-4">Загрузка...</div>}
+          {!loading && olderCursor && (
+            <div className="text-center">
+              <button
+                onClick={loadOlder}
+                disabled={loadingOlder}
+                className="text-xs text-cyan-600 hover:text-cyan-700 dark:text-cyan-400 disabled:opacity-50"
+              >
+                {loadingOlder ? 'Загрузка...' : 'Показать более ранние'}
+              </button>
+            </div>
+          )}
           {!loading && comments.length === 0 && (
             <div className="text-center text-sm text-slate-400 py-4">Пока нет комментариев. Будьте первым!</div>
           )}
@@ -246,8 +359,8 @@ const CommentsSection = ({ incidentId, user }) => {
                   <div className={`px-3 py-2 rounded-xl text-sm break-words ${isOwn ? 'bg-cyan-500 text-white rounded-tr-sm' : 'bg-white dark:bg-slate-800 text-slate-800 dark:text-slate-200 border border-slate-200 dark:border-slate-700 rounded-tl-sm'}`}>
                     {c.text && <p>{c.text}</p>}
                     {c.image && (
-                      <img
-                        src={c.image}
+                      <AuthImage
+                        url={c.image}
                         alt="вложение"
                         className="mt-1 max-w-[220px] rounded-lg cursor-pointer hover:opacity-90 transition-opacity"
                         onClick={() => setLightboxSrc(c.image)}
@@ -391,6 +504,14 @@ const Incidents = ({ user }) => {
     fetchIncidents();
   }, [page, limit, sortBy, sortOrder]); // eslint-disable-line
 
+  // Refetch the page when incidents change elsewhere; bursts (bulk edits) collapse into one request
+  const liveRefetchRef = useRef(null);
+  useLiveEvents('incidents', () => {
+    clearTimeout(liveRefetchRef.current);
+    liveRefetchRef.current = setTimeout(() => fetchIncidents(), 300);
+  });
+  useEffect(() => () => clearTimeout(liveRefetchRef.current), []);
+
   useEffect(() => {
     localStorage.setItem('incidents_visible_columns_v2', JSON.stringify(visibleColumns));
   }, [visibleColumns]);
@@ -879,8 +1000,8 @@ const Incidents = ({ user }) => {
                   <div className="grid grid-cols-4 gap-2">
                     {formData.attachments.map((att) => (
                       <div key={att.id} className="relative group rounded-lg overflow-hidden border border-slate-200 dark:border-slate-700 aspect-square bg-slate-100 dark:bg-slate-800">
-                        <img src={att.data} alt={att.filename} className="w-full h-full object-cover cursor-pointer group-hover:opacity-80"
-                          onClick={() => setLightboxAtt({ src: att.data, filename: att.filename })} />
+                        <AuthImage url={att.url} data={att.data} alt={att.filename} className="w-full h-full object-cover cursor-pointer group-hover:opacity-80"
+                          onClick={() => setLightboxAtt({ url: att.url, data: att.data, filename: att.filename })} />
                         <button type="button" onClick={() => removeAttachmentFromForm(att.id)}
                           className="absolute top-1 right-1 bg-red-500/90 text-white rounded-full w-5 h-5 flex items-center justify-center opacity-0 group-hover:opacity-100 text-xs">×</button>
                       </div>
@@ -915,8 +1036,9 @@ const Incidents = ({ user }) => {
                 className="fixed inset-0 z-[200] bg-black/88 flex flex-col items-center justify-center p-8"
                 onClick={() => setLightboxAtt(null)}
               >
-                <img
-                  src={lightboxAtt.src}
+                <AuthImage
+                  url={lightboxAtt.url}
+                  data={lightboxAtt.data}
                   alt={lightboxAtt.filename}
                   className="max-w-full max-h-[85vh] rounded-xl shadow-2xl object-contain"
                   onClick={e => e.stopPropagation()}
@@ -1157,11 +1279,12 @@ const Incidents = ({ user }) => {
                       <div className="grid grid-cols-4 gap-2">
                         {viewingIncident.attachments.map((att) => (
                           <div key={att.id} className="relative group rounded-xl overflow-hidden border border-slate-200 dark:border-slate-700 bg-slate-100 dark:bg-slate-800 aspect-square">
-                            <img
-                              src={att.data}
+                            <AuthImage
+                              url={att.url}
+                              data={att.data}
                               alt={att.filename || 'вложение'}
                               className="w-full h-full object-cover cursor-pointer group-hover:opacity-80 transition-opacity"
-                              onClick={() => setLightboxAtt({ src: att.data, filename: att.filename })}
+                              onClick={() => setLightboxAtt({ url: att.url, data: att.data, filename: att.filename })}
                             />
                             {isAdmin && (
                               <button
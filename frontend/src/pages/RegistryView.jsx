@@ -16,7 +16,10 @@ const RegistryView = ({ user }) => {
   const navigate = useNavigate();
   const [registry, setRegistry] = useState(null);
   const [records, setRecords] = useState([]);
-  const [filteredRecords, setFilteredRecords] = useState([]);
+  const [totalRecords, setTotalRecords] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [sortBy, setSortBy] = useState('created_at');
+  const [sortOrder, setSortOrder] = useState('asc');
   const [loading, setLoading] = useState(true);
   const [isFormDialogOpen, setIsFormDialogOpen] = useState(false);
   const [isEditStructureOpen, setIsEditStructureOpen] = useState(false);
@@ -30,23 +33,13 @@ const RegistryView = ({ user }) => {
 
   useEffect(() => {
     fetchRegistry();
-    fetchRecords();
   }, [registryId]);
 
   useEffect(() => {
-    // Filter records based on search
-    if (!searchQuery.trim()) {
-      setFilteredRecords(records);
-    } else {
-      const query = searchQuery.toLowerCase();
-      const filtered = records.filter(record => {
-        return Object.values(record.data || {}).some(value => 
-          String(value).toLowerCase().includes(query)
-        );
-      });
-      setFilteredRecords(filtered);
-    }
-  }, [searchQuery, records]);
+    // Search, sort and paging are done by the server; debounce typing
+    const timer = setTimeout(() => fetchRecords(), searchQuery ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [registryId, searchQuery, sortBy, sortOrder]);
 
   const fetchRegistry = async () => {
     try {
@@ -63,19 +56,38 @@ const RegistryView = ({ user }) => {
     }
   };
 
-  const fetchRecords = async () => {
+  const fetchRecords = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(`${API}/registries/${registryId}/records`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: {
+          limit: 50,
+          sort_by: sortBy,
+          sort_order: sortOrder,
+          q: searchQuery.trim() || undefined,
+          cursor: cursor || undefined,
+          include_total: !cursor,
+        }
       });
-      setRecords(response.data);
-      setFilteredRecords(response.data);
+      const { items, total, next_cursor } = response.data;
+      setRecords(prev => (cursor ? [...prev, ...items] : items));
+      if (!cursor) setTotalRecords(total);
+      setNextCursor(next_cursor);
     } catch (error) {
       toast.error('Ошибка загрузки записей');
     }
   };
 
+  const toggleSort = (columnId) => {
+    if (sortBy === columnId) {
+      setSortOrder(sortOrder === 'asc' ? 'desc' : 'asc');
+    } else {
+      setSortBy(columnId);
+      setSortOrder('asc');
+    }
+  };
+
   const openCreateDialog = () => {
     const initialData = {};
     registry.columns.forEach(col => {
@@ -200,10 +212,11 @@ const RegistryView = ({ user }) => {
     }
   };
 
-  const exportRegistry = async () => {
+  const exportRegistry = async (format = 'csv') => {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(`${API}/registries/${registryId}/export`, {
+        params: { format },
         headers: { Authorization: `Bearer ${token}` },
         responseType: 'blob'
       });
@@ -211,7 +224,7 @@ const RegistryView = ({ user }) => {
       const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
       link.href = url;
-      link.setAttribute('download', `${registry.name}.csv`);
+      link.setAttribute('download', `${registry.name}.${format}`);
       document.body.appendChild(link);
       link.click();
       link.remove();
@@ -389,9 +402,13 @@ const RegistryView = ({ user }) => {
             <Settings className="w-4 h-4 mr-2" />
             Структура
           </Button>
-          <Button onClick={exportRegistry} variant="outline">
+          <Button onClick={() => exportRegistry('csv')} variant="outline">
+            <Download className="w-4 h-4 mr-2" />
+            Экспорт CSV
+          </Button>
+          <Button onClick={() => exportRegistry('xlsx')} variant="outline">
             <Download className="w-4 h-4 mr-2" />
-            Экспорт
+            Экспорт XLSX
           </Button>
           <Button onClick={openCreateDialog} className="bg-gradient-to-r from-cyan-500 to-cyan-600">
             <Plus className="w-4 h-4 mr-2" />
@@ -423,10 +440,10 @@ const RegistryView = ({ user }) => {
       {/* Table */}
       <Card>
         <CardHeader>
-          <CardTitle>Записи ({filteredRecords.length})</CardTitle>
+          <CardTitle>Записи ({totalRecords})</CardTitle>
         </CardHeader>
         <CardContent>
-          {filteredRecords.length === 0 ? (
+          {records.length === 0 ? (
             <div className="text-center py-12">
               <p className="text-slate-500 mb-4">
                 {searchQuery ? 'Ничего не найдено' : 'Нет записей в реестре'}
@@ -443,8 +460,13 @@ const RegistryView = ({ user }) => {
                 <thead>
                   <tr className="border-b border-slate-200">
                     {registry.columns.map((col) => (
-                      <th key={col.id} className="text-left p-3 text-sm font-semibold text-slate-700">
+                      <th
+                        key={col.id}
+                        onClick={() => toggleSort(col.id)}
+                        className="text-left p-3 text-sm font-semibold text-slate-700 cursor-pointer select-none"
+                      >
                         {col.name}
+                        {sortBy === col.id && (sortOrder === 'asc' ? ' ▲' : ' ▼')}
                       </th>
                     ))}
                     <th className="text-right p-3 text-sm font-semibold text-slate-700">
@@ -453,7 +475,7 @@ const RegistryView = ({ user }) => {
                   </tr>
                 </thead>
                 <tbody>
-                  {filteredRecords.map((record) => (
+                  {records.map((record) => (
                     <tr key={record.id} className="border-b border-slate-100 hover:bg-slate-50">
                       {registry.columns.map((col) => (
                         <td key={col.id} className="p-3 text-sm text-slate-900">
@@ -483,6 +505,13 @@ const RegistryView = ({ user }) => {
                   ))}
                 </tbody>
               </table>
+              {nextCursor && (
+                <div className="flex justify-center pt-4">
+                  <Button variant="outline" onClick={() => fetchRecords(nextCursor)}>
+                    Показать ещё
+                  </Button>
+                </div>
+              )}
             </div>
           )}
         </CardContent>
@@ -9,11 +9,16 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
 import { Badge } from '@/components/ui/badge';
-import { Plus, Trash2, UserCircle, Edit, Key } from 'lucide-react';
+import { Plus, Trash2, UserCircle, Edit, Key, Search, ChevronLeft, ChevronRight } from 'lucide-react';
 import { toast } from 'sonner';
 
+const USERS_PAGE_SIZE = 50;
+
 const Users = ({ user }) => {
   const [users, setUsers] = useState([]);
+  const [search, setSearch] = useState('');
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
   const [roles, setRoles] = useState([]);
   const [loading, setLoading] = useState(true);
   const [dialogOpen, setDialogOpen] = useState(false);
@@ -41,9 +46,14 @@ const Users = ({ user }) => {
   });
 
   useEffect(() => {
-    fetchUsers();
     fetchRoles();
-  }, []);
+  }, []); // eslint-disable-line
+
+  // Search and paging run on the server; typing is debounced
+  useEffect(() => {
+    const timer = setTimeout(fetchUsers, 300);
+    return () => clearTimeout(timer);
+  }, [search, page]); // eslint-disable-line
 
   const fetchRoles = async () => {
     try {
@@ -59,8 +69,11 @@ const Users = ({ user }) => {
 
   const fetchUsers = async () => {
     try {
-      const response = await axios.get(`${API}/users`);
+      const response = await axios.get(`${API}/users`, {
+        params: { q: search || undefined, page, limit: USERS_PAGE_SIZE }
+      });
       setUsers(response.data);
+      setTotal(Number(response.headers['x-total-count'] || response.data.length));
     } catch (error) {
       toast.error('Ошибка загрузки пользователей');
     } finally {
@@ -287,6 +300,16 @@ const Users = ({ user }) => {
         </Card>
       )}
 
+      <div className="relative max-w-sm">
+        <Search className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-slate-400" />
+        <Input
+          value={search}
+          onChange={(e) => { setSearch(e.target.value); setPage(1); }}
+          placeholder="Поиск по имени, логину или email"
+          className="pl-9"
+        />
+      </div>
+
       <Card className="border-slate-200">
         <CardContent className="p-0">
           <div className="overflow-x-auto">
@@ -368,6 +391,21 @@ const Users = ({ user }) => {
               </TableBody>
             </Table>
           </div>
+          {total > USERS_PAGE_SIZE && (
+            <div className="flex items-center justify-between px-4 py-3 border-t border-slate-200 text-sm text-slate-600">
+              <span>
+                {(page - 1) * USERS_PAGE_SIZE + 1}–{Math.min(page * USERS_PAGE_SIZE, total)} из {total}
+              </span>
+              <div className="flex gap-2">
+                <Button variant="outline" size="sm" disabled={page === 1} onClick={() => setPage(page - 1)}>
+                  <ChevronLeft className="w-4 h-4" />
+                </Button>
+                <Button variant="outline" size="sm" disabled={page * USERS_PAGE_SIZE >= total} onClick={() => setPage(page + 1)}>
+                  <ChevronRight className="w-4 h-4" />
+                </Button>
+              </div>
+            </div>
+          )}
         </CardContent>
       </Card>
 
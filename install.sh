@@ -158,17 +158,7 @@ chmod -R 755 "$FRONTEND_DIR/build"
 
 # 7. Настройка Supervisor и Nginx
 echo -e "${GREEN}[6/7] Настройка сервисов...${NC}"
-cat > /etc/supervisor/conf.d/securisk-backend.conf <<EOF
-[program:securisk-backend]
-command=$BACKEND_DIR/.venv/bin/uvicorn server:app --host 127.0.0.1 --port 8001 --workers 4
-directory=$BACKEND_DIR
-user=$REAL_USER
-autostart=true
-autorestart=true
-stdout_logfile=/var/log/supervisor/securisk-backend.out.log
-stderr_logfile=/var/log/supervisor/securisk-backend.err.log
-environment=LANG=en_US.UTF-8,LC_ALL=en_US.UTF-8,PATH="$BACKEND_DIR/.venv/bin"
-EOF
+bash "$PROJECT_ROOT/scripts/supervisor_backend_conf.sh" "$REAL_USER"
 
 supervisorctl reread && supervisorctl update && supervisorctl restart securisk-backend
 
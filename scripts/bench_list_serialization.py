@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the list endpoint response path, without MongoDB.
+
+For every paginated list endpoint it builds a page of synthetic rows shaped like Motor
+returns them (naive datetimes, no _id) and times:
+
+  before: Paginated*(**page) in the handler, then FastAPI's response_model validation and
+          serialization (fastapi.routing.serialize_response) and the stdlib JSONResponse
+  after:  trusted_page_response(), i.e. trusted_row() plus orjson
+
+It also checks that both paths produce the same JSON document.
+
+Usage:
+    python scripts/bench_list_serialization.py --limit 100 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+
+
+def _ts(i):
+    # BSON dates come back naive with millisecond precision
+    return datetime(2024, 1, 1) + timedelta(minutes=i, milliseconds=i % 1000)
+
+
+def risk_row(i):
+    return {
+        "id": str(uuid.uuid4()), "risk_number": f"RSK{i:06d}", "registration_date": _ts(i),
+        "scenario": f"Сценарий риска {i} " * 4, "related_assets": [str(uuid.uuid4()) for _ in range(3)],
+        "related_threats": [str(uuid.uuid4())], "related_vulnerabilities": [],
+        "probability": 3, "impact": 4, "risk_level": 12, "criticality": "Высокий", "owner": "Иванов И.И.",
+        "treatment_strategy": "Снижение", "treatment_plan": "План " * 10, "implementation_deadline": "Q3 2026",
+        "status": "Открыт", "review_date": _ts(i + 1000), "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+def incident_row(i):
+    return {
+        "id": str(uuid.uuid4()), "incident_number": f"INC{i:06d}", "incident_time": _ts(i),
+        "detection_time": _ts(i + 30), "reaction_start_time": _ts(i + 45), "violator": "Петров П.П.",
+        "subject_type": "Внутренний", "login": f"user{i}", "system": "Windows", "incident_type": "Утечка",
+        "detection_source": "SIEM", "criticality": "Высокая", "detected_by": "SOC", "status": "В работе",
+        "closed_at": None, "mtta": 30.0, "mttr": 15.0, "mttc": None, "description": "Описание " * 20,
+        "measures": "Меры " * 10, "is_repeat": False, "comment": None,
+        "assigned_to": [str(uuid.uuid4()) for _ in range(2)], "created_by": str(uuid.uuid4()),
+        "attachments": [{"id": str(uuid.uuid4()), "filename": "log.txt", "content_type": "text/plain",
+                         "size": 1024, "sha256": "0" * 64, "url": "/api/incidents/x/attachments/y",
+                         "created_at": _ts(i)}],
+        "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+def asset_row(i):
+    return {
+        "id": str(uuid.uuid4()), "asset_number": f"ACT{i:06d}", "name": f"Сервер {i}", "category": "Сервер",
+        "owner": "ИТ", "criticality": "Высокая", "format": "Физический", "location": "ЦОД",
+        "rights_rw": "admins", "rights_ro": "users", "classification": "Конфиденциально",
+        "review_date": _ts(i), "status": "Актуален", "threats": [str(uuid.uuid4())],
+        "protection_measures": "Меры", "description": "Описание " * 10, "note": None,
+        "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+def threat_row(i):
+    return {
+        "id": str(uuid.uuid4()), "threat_number": f"THR-2024-{i:03d}", "category": "Инсайдер",
+        "description": "Описание угрозы " * 8, "source": "Недовольный сотрудник",
+        "related_vulnerability_id": str(uuid.uuid4()), "mitre_attack_id": "T1078",
+        "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+def vulnerability_row(i):
+    return {
+        "id": str(uuid.uuid4()), "vulnerability_number": f"VUL-2024-{i:03d}",
+        "related_asset_id": str(uuid.uuid4()), "description": "Описание уязвимости " * 8,
+        "vulnerability_type": "Конфигурация", "detection_method": "Сканер",
+        "cvss_vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H", "cvss_score": 9.8,
+        "severity": "Critical", "status": "Обнаружена", "discovery_date": _ts(i), "closure_date": None,
+        "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+def registry_record_row(i):
+    return {
+        "id": str(uuid.uuid4()), "registry_id": "r1", "created_by": str(uuid.uuid4()),
+        "data": {"1": i, "2": f"Поставщик {i}", "3": "2024-05-01", "4": True, "5": ["A", "B"]},
+        "created_at": _ts(i), "updated_at": _ts(i + 5),
+    }
+
+
+ENDPOINTS = [
+    ("/api/risks", server.Risk, server.PaginatedRisks, risk_row),
+    ("/api/incidents", server.Incident, server.PaginatedIncidents, incident_row),
+    ("/api/assets", server.Asset, server.PaginatedAssets, asset_row),
+    ("/api/threats", server.Threat, server.PaginatedThreats, threat_row),
+    ("/api/vulnerabilities", server.Vulnerability, server.PaginatedVulnerabilities, vulnerability_row),
+    ("/api/registries/{id}/records", server.RegistryRecord, server.PaginatedRegistryRecords, registry_record_row),
+]
+
+
+def make_page(row_factory, limit):
+    return {"items": [row_factory(i) for i in range(limit)], "total": limit * 10, "page": 1, "limit": limit,
+            "total_pages": 10, "next_cursor": "abc"}
+
+
+async def before(paginated, field, page):
+    content = await serialize_response(field=field, response_content=paginated(**page))
+    return JSONResponse(content).body
+
+
+async def after(model, page):
+    return server.trusted_page_response(model, page).body
+
+
+def _normalize(body):
+    # Same instants may be written as ...Z by both paths; compare parsed documents
+    return json.loads(body)
+
+
+async def time_path(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=100, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=200, help="timed runs per path")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':32} {'before ms':>10} {'after ms':>10} {'speedup':>8}  same JSON")
+    for path, model, paginated, row_factory in ENDPOINTS:
+        page = make_page(row_factory, args.limit)
+        field = create_response_field(name="response", type_=paginated)
+        same = _normalize(await before(paginated, field, page)) == _normalize(await after(model, page))
+        before_ms = await time_path(lambda: before(paginated, field, page), args.repeat)
+        after_ms = await time_path(lambda: after(model, page), args.repeat)
+        print(f"{path:32} {before_ms:10.3f} {after_ms:10.3f} {before_ms / after_ms:7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark /api/incidents latency during a login burst.
+
+Fires logins at a fixed rate (default 50/s) in background threads and, at the same
+time, polls /api/incidents with an already issued token. Prints p50/p95/p99 latency
+of the incident list for a baseline run and for the run under login load.
+
+Usage:
+    python scripts/bench_login_burst.py --base-url http://127.0.0.1:8001 \
+        --username admin --password admin123 --duration 30 --login-rate 50
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def login(base_url, username, password):
+    response = requests.post(
+        f"{base_url}/api/auth/login",
+        json={"username": username, "password": password},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def poll_incidents(base_url, token, stop, latencies):
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = session.get(f"{base_url}/api/incidents", params={"page": 1, "limit": 20}, timeout=30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+
+
+def login_load(base_url, username, password, rate, stop, counters):
+    interval = 1.0 / rate
+    with ThreadPoolExecutor(max_workers=max(8, rate)) as pool:
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            pool.submit(_timed_login, base_url, username, password, counters)
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _timed_login(base_url, username, password, counters):
+    try:
+        login(base_url, username, password)
+        counters["ok"] += 1
+    except requests.RequestException:
+        counters["failed"] += 1
+
+
+def run_phase(args, token, with_logins):
+    stop = threading.Event()
+    latencies = []
+    counters = {"ok": 0, "failed": 0}
+    threads = [
+        threading.Thread(target=poll_incidents, args=(args.base_url, token, stop, latencies))
+        for _ in range(args.pollers)
+    ]
+    if with_logins:
+        threads.append(threading.Thread(
+            target=login_load,
+            args=(args.base_url, args.username, args.password, args.login_rate, stop, counters),
+        ))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, counters
+
+
+def report(title, latencies, counters=None):
+    print(f"\n{title}")
+    print(f"  requests: {len(latencies)}")
+    if latencies:
+        print(f"  mean: {statistics.mean(latencies):.1f} ms")
+        for pct in (50, 95, 99):
+            print(f"  p{pct}: {percentile(latencies, pct):.1f} ms")
+    if counters is not None:
+        print(f"  logins ok/failed: {counters['ok']}/{counters['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--duration", type=int, default=30, help="seconds per phase")
+    parser.add_argument("--login-rate", type=int, default=50, help="logins per second during the burst phase")
+    parser.add_argument("--pollers", type=int, default=4, help="concurrent /api/incidents clients")
+    args = parser.parse_args()
+
+    token = login(args.base_url, args.username, args.password)
+
+    latencies, _ = run_phase(args, token, with_logins=False)
+    report("Baseline /api/incidents", latencies)
+
+    latencies, counters = run_phase(args, token, with_logins=True)
+    report(f"/api/incidents with {args.login_rate} logins/s in flight", latencies, counters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Check Mongo round trips per endpoint against a budget.
+
+The backend reports the Mongo commands of every request in its Server-Timing header
+(db;dur=...;desc="N round trips"). This script calls read-only endpoints of a running
+server and fails when one of them needs more round trips than its budget, which is how
+N+1 query patterns show up. The first request of each endpoint warms per-worker caches
+(user, counts), the second one is measured.
+
+parse_round_trips() and assert_max_round_trips() work on any response object with a
+headers mapping (requests, httpx, Starlette's TestClient), so tests can use them directly.
+
+Usage:
+    python scripts/check_db_round_trips.py --base-url http://127.0.0.1:8001 \
+        --username admin --password admin123
+"""
+import argparse
+import re
+import sys
+
+import requests
+
+# Budgets include the token check (user and role lookups when the user cache is cold)
+ENDPOINT_BUDGETS = {
+    "/api/auth/me": 2,
+    "/api/users": 4,
+    "/api/users?limit=50&q=a": 4,
+    "/api/roles": 3,
+    "/api/incidents?limit=50": 5,
+    "/api/risks?limit=50": 5,
+    "/api/assets?limit=50": 5,
+    "/api/threats?limit=50": 5,
+    "/api/vulnerabilities?limit=50": 5,
+    "/api/registries": 3,
+    "/api/dashboard/stats": 4,
+    "/api/graph": 6,
+}
+
+ROUND_TRIPS_RE = re.compile(r'db;[^,]*desc="(\d+) round trips"')
+
+
+def parse_round_trips(response):
+    match = ROUND_TRIPS_RE.search(response.headers.get("server-timing", ""))
+    if match is None:
+        raise AssertionError("Response has no db entry in its Server-Timing header")
+    return int(match.group(1))
+
+
+def assert_max_round_trips(response, limit):
+    round_trips = parse_round_trips(response)
+    assert round_trips <= limit, f"{round_trips} Mongo round trips, budget is {limit}"
+    return round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    response = session.post(f"{args.base_url}/api/auth/login",
+                            json={"username": args.username, "password": args.password}, timeout=30)
+    response.raise_for_status()
+    session.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    failures = 0
+    for path, budget in ENDPOINT_BUDGETS.items():
+        session.get(f"{args.base_url}{path}", timeout=60)
+        response = session.get(f"{args.base_url}{path}", timeout=60)
+        response.raise_for_status()
+        try:
+            round_trips = assert_max_round_trips(response, budget)
+            print(f"  ok    {path:36} {round_trips:3d} / {budget}")
+        except AssertionError as e:
+            failures += 1
+            print(f"  FAIL  {path:36} {e}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+#!/bin/bash
+set -e
+
+# Пишет конфиг Supervisor для backend. Вызывается из install.sh и update.sh (под root):
+#   scripts/supervisor_backend_conf.sh <пользователь>
+PROJECT_ROOT="$( cd "$( dirname "${BASH_SOURCE[0]}" )/.." && pwd )"
+BACKEND_DIR="$PROJECT_ROOT/backend"
+RUN_USER="$1"
+
+if [ -z "$RUN_USER" ]; then
+  echo "Использование: $0 <пользователь>"
+  exit 1
+fi
+
+cat > /etc/supervisor/conf.d/securisk-backend.conf <<EOF
+[program:securisk-backend]
+; Метрики воркеров собираются в общем каталоге, его очищаем перед каждым запуском
+command=/bin/bash -c "rm -rf $BACKEND_DIR/.prometheus && mkdir -p $BACKEND_DIR/.prometheus && exec $BACKEND_DIR/.venv/bin/uvicorn server:app --host 127.0.0.1 --port 8001 --workers 4"
+directory=$BACKEND_DIR
+user=$RUN_USER
+autostart=true
+autorestart=true
+stdout_logfile=/var/log/supervisor/securisk-backend.out.log
+stderr_logfile=/var/log/supervisor/securisk-backend.err.log
+environment=LANG=en_US.UTF-8,LC_ALL=en_US.UTF-8,PATH="$BACKEND_DIR/.venv/bin",PROMETHEUS_MULTIPROC_DIR="$BACKEND_DIR/.prometheus"
+EOF
@@ -6,7 +6,15 @@ PROJECT_ROOT="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 
 echo "🔄 Применение изменений SecuRisk..."
 
-# 1. Backend: Просто перезапуск (код подхватится сам)
+# 1. Backend: зависимости из requirements.txt, актуальный конфиг Supervisor и перезапуск
+echo "🐍 Установка зависимостей Backend..."
+"$PROJECT_ROOT/backend/.venv/bin/pip" install -q -r "$PROJECT_ROOT/backend/requirements.txt"
+"$PROJECT_ROOT/backend/.venv/bin/pip" install -q "bcrypt==3.2.2"
+echo "🐍 Обновление конфига Supervisor..."
+# Каталог метрик воркеров (PROMETHEUS_MULTIPROC_DIR) создаётся и очищается командой запуска из конфига
+sudo bash "$PROJECT_ROOT/scripts/supervisor_backend_conf.sh" "$(stat -c %U "$PROJECT_ROOT/backend")"
+sudo supervisorctl reread
+sudo supervisorctl update
 echo "🐍 Перезапуск Backend..."
 sudo supervisorctl restart securisk-backend
 